@@ -0,0 +1,152 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import numpy as np
+from autogen_agentchat.messages import TextMessage
+from openai import AsyncOpenAI
+from result import is_err
+from lib.metrics import registry
+from lib.sqlalchemy import vector
+from lib.tools.weaviate_tools import WeaviateClientContext
+
+logger = logging.getLogger(__name__)
+
+cache_hits = registry.counter("semantic_cache_hits_total", "Team runs answered from the semantic answer cache")
+cache_misses = registry.counter("semantic_cache_misses_total", "Semantic answer cache lookups that ran the team")
+cache_evictions = registry.counter("semantic_cache_evictions_total", "Answers evicted for size, age or a changed Paper collection")
+cache_entries = registry.gauge("semantic_cache_entries", "Answers held in the semantic answer cache")
+lookup_seconds = registry.histogram(
+    "semantic_cache_lookup_seconds", "Time to search the semantic answer cache, including the Paper collection version check",
+    (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+@dataclass
+class CachedAnswer:
+    question: str
+    embedding: np.ndarray
+    # Final messages of the summarizing agent, replayed in order on a hit
+    messages: list[TextMessage]
+    # Paper collection version the answer was computed against
+    version: str
+    created_at: float = field(default_factory=time.monotonic)
+
+class AnswerCacheImpl:
+    """Per-process semantic cache of final answers keyed by question embedding.
+
+    A question whose embedding has cosine similarity of at least threshold
+    with a cached question is answered with that question's summary instead
+    of running the agents. Answers are only served while the Paper
+    collection is unchanged (compared by object counts, re-read at most
+    every version_ttl seconds) and for at most ttl seconds; the least
+    recently used answer is evicted beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        threshold: float = 0.92,
+        max_entries: int = 1000,
+        ttl: float = 86400.0,
+        version_ttl: float = 60.0,
+        embedding_model: str = "text-embedding-3-small",
+    ):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self.embedding_model = embedding_model
+        self._entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self._next_key = 0
+        # Embeddings of _entries stacked in key order, rebuilt after changes
+        self._matrix: np.ndarray | None = None
+        self._keys: list[int] = []
+        self._version: str | None = None
+        self._version_read_at = 0.0
+        self._openai: AsyncOpenAI | None = None
+
+    async def embed(self, text: str) -> np.ndarray:
+        if self._openai is None:
+            self._openai = AsyncOpenAI()
+        response = await self._openai.embeddings.create(model=self.embedding_model, input=text)
+        return np.asarray(response.data[0].embedding, dtype=np.float32)
+
+    async def lookup(self, embedding: np.ndarray) -> CachedAnswer | None:
+        """Return the fresh answer of the most similar cached question, if similar enough"""
+        started = time.perf_counter()
+        try:
+            version = await self.collection_version()
+            self._evict_expired(version)
+            if version is None or not self._entries:
+                cache_misses.inc()
+                return None
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = vector.stack_vectors([self._entries[key].embedding for key in self._keys])
+            indexes, distances = vector.top_k_cosine(self._matrix, embedding, 1)
+            if len(indexes) == 0 or 1 - distances[0] < self.threshold:
+                cache_misses.inc()
+                return None
+            key = self._keys[indexes[0]]
+            self._entries.move_to_end(key)
+            cache_hits.inc()
+            return self._entries[key]
+        finally:
+            lookup_seconds.observe(time.perf_counter() - started)
+
+    async def store(self, question: str, embedding: np.ndarray, messages: list[TextMessage]):
+        version = await self.collection_version()
+        if version is None or not messages:
+            return
+        self._entries[self._next_key] = CachedAnswer(question, embedding, messages, version)
+        self._next_key += 1
+        cache_entries.inc()
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            cache_entries.dec()
+            cache_evictions.inc()
+        self._matrix = None
+
+    async def collection_version(self) -> str | None:
+        """Object counts of the Paper and PaperChunk collections, or None if Weaviate is unreachable"""
+        now = time.monotonic()
+        if self._version is not None and now - self._version_read_at < self.version_ttl:
+            return self._version
+        try:
+            async with WeaviateClientContext() as r:
+                if is_err(r):
+                    return None
+                client = r.unwrap()
+                papers = await client.collections.get("Paper").aggregate.over_all(total_count=True)
+                chunks = await client.collections.get("PaperChunk").aggregate.over_all(total_count=True)
+        except Exception as e:
+            logger.warning(f"Failed to read the Paper collection version: {str(e)}")
+            return None
+        self._version = f"{papers.total_count}:{chunks.total_count}"
+        self._version_read_at = now
+        return self._version
+
+    def _evict_expired(self, version: str | None):
+        now = time.monotonic()
+        expired = [
+            key for key, entry in self._entries.items()
+            if now - entry.created_at >= self.ttl or (version is not None and entry.version != version)
+        ]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            cache_entries.dec(len(expired))
+            cache_evictions.inc(len(expired))
+            self._matrix = None
+
+
+answer_cache = AnswerCacheImpl(
+    enabled=os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true",
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400")),
+    version_ttl=float(os.getenv("SEMANTIC_CACHE_VERSION_TTL_SECONDS", "60")),
+    embedding_model=os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "text-embedding-3-small"),
+)
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+from typing import Any
+from sqlalchemy.exc import OperationalError
+from adapter.storage import StorageRepositoryImpl
+from lib import state_codec
+from lib.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+messages_dropped = registry.counter("buffered_messages_dropped_total", "Buffered messages dropped after their session's writes kept failing")
+
+PendingMessage = tuple[str, dict[str, Any], asyncio.Future | None]
+
+# Durability modes:
+#   "buffered" - enqueue returns immediately; messages reach the database within
+#                MESSAGE_BUFFER_FLUSH_INTERVAL_MS and commits skip the WAL flush wait.
+#   "commit"   - enqueue waits until the group commit containing the message succeeded.
+DURABILITY_MODES = ("buffered", "commit")
+
+class MessageWriteBufferImpl:
+    """Process-wide write-behind buffer for websocket messages.
+
+    Messages from every session are gathered in memory and written with one
+    multi-row INSERT whenever the batch size or the flush interval is reached,
+    so many concurrent chats share a single transaction per flush.
+
+    When a batch fails for anything but a lost connection, each of its
+    sessions is written on its own so one bad session cannot hold back the
+    others. A session whose writes fail max_retries flushes in a row has
+    its messages logged and dropped.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 256,
+        flush_interval: float = 0.2,
+        durability: str = "buffered",
+        max_retries: int = 5,
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.max_retries = max_retries
+        self.storage_repository = StorageRepositoryImpl()
+        # (session_id, JSON-normalized message, future resolved once committed)
+        self._pending: list[PendingMessage] = []
+        # session_id -> flushes in a row that failed to write the session's messages
+        self._failures: dict[str, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Start the background flusher"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background flusher and write everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def enqueue(self, session_id: str, message: dict[str, Any]):
+        """Buffer a message for the session"""
+        self.start()
+        future = asyncio.get_running_loop().create_future() if self.durability == "commit" else None
+        self._pending.append((session_id, state_codec.normalize(message), future))
+        if len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+        if future is not None:
+            await future
+
+    async def flush(self):
+        """Write all buffered messages in one transaction"""
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:len(batch)]
+
+                grouped: dict[str, list[PendingMessage]] = {}
+                for item in batch:
+                    grouped.setdefault(item[0], []).append(item)
+
+                try:
+                    await self._write(grouped)
+                except OperationalError as e:
+                    # The database is unreachable, which no session is to blame for; retry the whole batch
+                    logger.error(f"Failed to flush {len(batch)} buffered messages: {str(e)}")
+                    if self.durability == "commit":
+                        self._reject(batch, e)
+                    else:
+                        self._pending[:0] = batch
+                    return
+                except Exception as e:
+                    logger.warning(f"Failed to flush {len(batch)} buffered messages, writing each session on its own: {str(e)}")
+                    if not await self._write_each(grouped):
+                        return
+                    continue
+                for items in grouped.values():
+                    self._resolve(items)
+
+    async def _write(self, grouped: dict[str, list[PendingMessage]]):
+        try:
+            await self.storage_repository.append_messages_bulk(
+                {session_id: [message for _, message, _ in items] for session_id, items in grouped.items()},
+                synchronous_commit=self.durability == "commit"
+            )
+        except Exception:
+            self.storage_repository.session.rollback()
+            raise
+
+    async def _write_each(self, grouped: dict[str, list[PendingMessage]]) -> bool:
+        """Write each session in its own transaction; False if any session was put back for a retry"""
+        retrying: list[PendingMessage] = []
+        for session_id, items in grouped.items():
+            try:
+                await self._write({session_id: items})
+            except Exception as e:
+                if self.durability == "commit":
+                    self._reject(items, e)
+                    continue
+                if isinstance(e, OperationalError):
+                    retrying.extend(items)
+                    continue
+                failures = self._failures.get(session_id, 0) + 1
+                if failures < self.max_retries:
+                    self._failures[session_id] = failures
+                    retrying.extend(items)
+                    continue
+                del self._failures[session_id]
+                messages_dropped.inc(len(items))
+                messages = [message for _, message, _ in items]
+                logger.error(
+                    f"Dropping {len(items)} buffered messages for session {session_id} after {failures} failed writes: {str(e)}; "
+                    f"messages: {state_codec.dumps(messages).decode()}"
+                )
+            else:
+                self._resolve(items)
+        # Back in front so ordering is preserved for the retry at the next flush
+        self._pending[:0] = retrying
+        return not retrying
+
+    def _resolve(self, items: list[PendingMessage]):
+        if items:
+            self._failures.pop(items[0][0], None)
+        for _, _, future in items:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    def _reject(self, items: list[PendingMessage], error: Exception):
+        for _, _, future in items:
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+message_buffer = MessageWriteBufferImpl(
+    max_batch_size=int(os.getenv("MESSAGE_BUFFER_MAX_BATCH", "256")),
+    flush_interval=int(os.getenv("MESSAGE_BUFFER_FLUSH_INTERVAL_MS", "200")) / 1000,
+    durability=os.getenv("MESSAGE_BUFFER_DURABILITY", "buffered"),
+    max_retries=int(os.getenv("MESSAGE_BUFFER_MAX_RETRIES", "5")),
+)
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any
+from autogen_core.models import ChatCompletionClient
+from autogen_ext.models.cache import ChatCompletionCache
+from lib.completion_cache import SQLiteCacheStore
+from lib.tokenizer import TokenCounter, token_counter
+from lib.model_config import load_model_config, model_config_path
+
+logger = logging.getLogger(__name__)
+
+def _config_key(config: Any) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+def _component_config(config: Any) -> Any:
+    """The model client component, without this app's own sections of the config file"""
+    if isinstance(config, dict) and ("completion_cache" in config or "model_context" in config):
+        return {key: value for key, value in config.items() if key not in ("completion_cache", "model_context")}
+    return config
+
+def _file_stat(path: str) -> tuple[int, int, int] | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # The inode catches editors that save by writing a new file and renaming it over the old one
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+class ModelClientPoolImpl:
+    """Process-wide pool of model clients shared by every session.
+
+    Clients are keyed by their component config, so all teams built from the
+    same config share one client and its pool of keep-alive HTTP connections.
+    The parsed model config file is cached; a watcher re-reads it only when
+    the file changes, and then retires the clients built from the old config.
+    Retired clients are closed after retire_after seconds so turns already
+    running on them can finish.
+
+    Agents enabled in the completion_cache section of the config file get
+    the shared client wrapped in a ChatCompletionCache, backed by a local
+    SQLite store, so identical prompts are answered from disk:
+
+        completion_cache:
+          path: data/completion_cache.sqlite3
+          max_size_mb: 512
+          default: false        # agents not listed below
+          agents:
+            search_paper_agent: true
+
+    The model_context section picks each agent's context policy (see
+    lib/model_context.py); agents not listed use default:
+
+        model_context:
+          default: {policy: tokens, token_limit: 16000}
+          agents:
+            summarize_agent: {policy: summary, token_limit: 12000, keep_tokens: 4000}
+    """
+
+    def __init__(self, config_path: str = model_config_path, poll_interval: float = 2.0, retire_after: float = 600.0):
+        self.config_path = config_path
+        self.poll_interval = poll_interval
+        self.retire_after = retire_after
+        # Incremented on every config change; teams built before it are stale
+        self.generation = 0
+        self._config: Any | None = None
+        self._config_key: str | None = None
+        self._config_stat: tuple[int, int, int] | None = None
+        self._clients: dict[str, ChatCompletionClient] = {}
+        # Caching wrappers around the clients in _clients, by the same key
+        self._cached_clients: dict[str, ChatCompletionCache] = {}
+        self._cache_stores: dict[str, SQLiteCacheStore] = {}
+        # (time retired, client)
+        self._retired: list[tuple[float, ChatCompletionClient]] = []
+        self._reload_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Start watching the config file"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the watcher and close every client"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._retire_all()
+        await self._close_retired(force=True)
+        for store in self._cache_stores.values():
+            store.close()
+        self._cache_stores.clear()
+
+    async def get_config(self) -> Any:
+        """Return the parsed model config, reading the file only on first use"""
+        if self._config is None:
+            await self.reload()
+        return self._config
+
+    async def get_client(self, config: Any | None = None) -> ChatCompletionClient:
+        """Return the shared client for a component config, by default the one in the config file"""
+        if config is None:
+            config = _component_config(await self.get_config())
+            key = self._config_key
+        else:
+            key = _config_key(config)
+        client = self._clients.get(key)
+        if client is None:
+            client = ChatCompletionClient.load_component(config)
+            self._clients[key] = client
+        return client
+
+    async def get_agent_client(self, agent_name: str) -> ChatCompletionClient:
+        """Return the default client, behind the completion cache if the config enables it for the agent"""
+        client = await self.get_client()
+        settings = (await self.get_config()).get("completion_cache") or {}
+        if not (settings.get("agents") or {}).get(agent_name, settings.get("default", False)):
+            return client
+        cached = self._cached_clients.get(self._config_key)
+        if cached is None:
+            path = settings.get("path", "data/completion_cache.sqlite3")
+            store = self._cache_stores.get(path)
+            if store is None:
+                store = SQLiteCacheStore(path, int(settings.get("max_size_mb", 512) * 1024 * 1024))
+                self._cache_stores[path] = store
+            # Completions are only reused for the model config that produced them
+            cached = ChatCompletionCache(client, store.namespaced(self._config_key))
+            self._cached_clients[self._config_key] = cached
+        return cached
+
+    async def get_context_settings(self, agent_name: str) -> dict[str, Any]:
+        """Model context settings of the agent, over the defaults of the config file"""
+        settings = (await self.get_config()).get("model_context") or {}
+        return {**(settings.get("default") or {}), **((settings.get("agents") or {}).get(agent_name) or {})}
+
+    async def get_token_counter(self) -> TokenCounter:
+        """Cached token counter for the configured model"""
+        config = await self.get_config()
+        return token_counter((config.get("config") or {}).get("model", "gpt-4o"))
+
+    async def reload(self) -> bool:
+        """Re-read the config file if it changed on disk; returns True when the config changed"""
+        async with self._reload_lock:
+            stat = _file_stat(self.config_path)
+            if self._config is not None and stat == self._config_stat:
+                return False
+            config = await load_model_config(self.config_path)
+            self._config_stat = stat
+            if config == self._config:
+                return False
+            changed = self._config is not None
+            self._config = config
+            self._config_key = _config_key(_component_config(config))
+            if changed:
+                self.generation += 1
+                self._retire_all()
+                logger.info(f"Model config {self.config_path} changed, rebuilding model clients")
+            return True
+
+    def _retire_all(self):
+        now = time.monotonic()
+        self._retired.extend((now, client) for client in self._clients.values())
+        self._clients.clear()
+        # The wrappers only close their inner client, which is retired above
+        self._cached_clients.clear()
+
+    async def _close_retired(self, force: bool = False):
+        now = time.monotonic()
+        keep = []
+        for retired_at, client in self._retired:
+            if force or now - retired_at >= self.retire_after:
+                try:
+                    await client.close()
+                except Exception as e:
+                    logger.error(f"Failed to close model client: {str(e)}")
+            else:
+                keep.append((retired_at, client))
+        self._retired = keep
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                # Keep serving the last good config, e.g. while the file is half written
+                logger.error(f"Failed to reload model config: {str(e)}")
+            await self._close_retired()
+
+
+model_client_pool = ModelClientPoolImpl(
+    poll_interval=float(os.getenv("MODEL_CONFIG_POLL_SECONDS", "2")),
+    retire_after=float(os.getenv("MODEL_CLIENT_RETIRE_SECONDS", "600")),
+)
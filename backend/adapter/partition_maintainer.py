@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import os
+from sqlalchemy import Engine
+from lib.sqlalchemy import partitions
+from lib.sqlalchemy.db import engine
+from lib.sqlalchemy.sqlalchemy_models import WebsocketMessage
+
+logger = logging.getLogger(__name__)
+
+class PartitionMaintainerImpl:
+    """Background task that keeps the monthly websocket_messages partitions in shape.
+
+    Creates partitions months_ahead months in advance, drops past partitions
+    once the session archive has emptied them, and detaches partitions older
+    than retention_months. Does nothing unless the database is PostgreSQL.
+    """
+
+    def __init__(self, engine: Engine, months_ahead: int = 3, retention_months: int = 0, interval: float = 86400.0):
+        self.engine = engine
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.interval = interval
+        self.table_name = WebsocketMessage.__tablename__
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Start maintaining partitions in the background"""
+        if self.engine.dialect.name != "postgresql":
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def maintain(self) -> dict[str, list[str]]:
+        """Run one maintenance pass and return the partitions created, dropped and detached"""
+        return await asyncio.to_thread(
+            partitions.maintain, self.engine, self.table_name, self.months_ahead, self.retention_months
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                result = await self.maintain()
+                for action, names in result.items():
+                    if names:
+                        logger.info(f"Partitions {action}: {', '.join(names)}")
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+partition_maintainer = PartitionMaintainerImpl(
+    engine,
+    months_ahead=int(os.getenv("MESSAGE_PARTITIONS_AHEAD", "3")),
+    retention_months=int(os.getenv("MESSAGE_PARTITION_RETENTION_MONTHS", "0")),
+    interval=float(os.getenv("MESSAGE_PARTITION_MAINTENANCE_SECONDS", "86400")),
+)
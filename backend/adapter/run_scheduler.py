@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+from autogen_core.models import RequestUsage
+from lib.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+runs_active = registry.gauge("team_runs_active", "Team runs holding an execution slot")
+runs_waiting = registry.gauge("team_runs_waiting", "Team runs queued for an execution slot")
+runs_admitted = registry.counter("team_runs_admitted_total", "Execution slots granted to team runs")
+run_queue_wait_seconds = registry.histogram(
+    "team_run_queue_wait_seconds", "Time a team run waited for an execution slot",
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+llm_tokens_charged = registry.counter("llm_tokens_charged_total", "Prompt and completion tokens charged to the rate limit buckets")
+
+class TokenBucket:
+    """Refills at rate per second up to capacity.
+
+    Usage is only known after a model call, so consume() may take the level
+    below zero; admission then waits until the debt has been refilled.
+    A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> bool:
+        if not self.rate:
+            return True
+        self._refill()
+        return self.level > 0
+
+    def consume(self, amount: float):
+        if self.rate:
+            self._refill()
+            self.level -= amount
+
+    def seconds_until_available(self) -> float:
+        if not self.rate:
+            return 0.0
+        self._refill()
+        return max(0.0, -self.level) / self.rate + 0.001
+
+@dataclass(eq=False)
+class RunTicket:
+    user_key: str
+    on_position: PositionCallback | None = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    position: int | None = None
+    active: bool = False
+
+class RunSchedulerImpl:
+    """Admission control in front of team execution.
+
+    At most max_concurrent runs hold an execution slot at once, and at most
+    max_per_user of them for the same user (or session, for anonymous
+    chats). Waiting runs are served round-robin across users, so one user
+    with a burst of chats cannot starve the others, and each waiter is told
+    its position whenever it changes. Slots are also withheld while the
+    requests-per-minute or tokens-per-minute bucket of the LLM provider is
+    in debt; runs charge their model usage as it is reported.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_per_user: int = 2, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self._active = 0
+        self._active_per_user: dict[str, int] = {}
+        # user key -> waiting tickets; key order is the round-robin order
+        self._waiting: OrderedDict[str, deque[RunTicket]] = OrderedDict()
+        self._retry: asyncio.TimerHandle | None = None
+
+    @asynccontextmanager
+    async def slot(self, user_key: str, on_position: PositionCallback | None = None) -> AsyncIterator[RunTicket]:
+        """Hold an execution slot for the duration of the block"""
+        ticket = await self.acquire(user_key, on_position)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def yielded(self, ticket: RunTicket) -> AsyncIterator[None]:
+        """Give the slot back for the duration of the block, e.g. while waiting for the user to type"""
+        self.release(ticket)
+        # On an error the run is over anyway, so it doesn't queue again
+        yield
+        await self._wait(ticket)
+
+    async def acquire(self, user_key: str, on_position: PositionCallback | None = None) -> RunTicket:
+        ticket = RunTicket(user_key, on_position)
+        await self._wait(ticket)
+        return ticket
+
+    def release(self, ticket: RunTicket):
+        if not ticket.active:
+            return
+        ticket.active = False
+        self._active -= 1
+        runs_active.dec()
+        remaining = self._active_per_user[ticket.user_key] - 1
+        if remaining:
+            self._active_per_user[ticket.user_key] = remaining
+        else:
+            del self._active_per_user[ticket.user_key]
+        self._dispatch()
+
+    def charge(self, models_usage: RequestUsage | None):
+        """Charge one model call's usage to the rate limit buckets"""
+        if models_usage is None:
+            return
+        tokens = models_usage.prompt_tokens + models_usage.completion_tokens
+        if not tokens:
+            # Answered from the completion cache without calling the model
+            return
+        self.request_bucket.consume(1)
+        self.token_bucket.consume(tokens)
+        llm_tokens_charged.inc(tokens)
+
+    async def _wait(self, ticket: RunTicket):
+        ticket.enqueued_at = time.monotonic()
+        ticket.granted = asyncio.get_running_loop().create_future()
+        ticket.position = None
+        self._waiting.setdefault(ticket.user_key, deque()).append(ticket)
+        runs_waiting.inc()
+        self._dispatch()
+        try:
+            await ticket.granted
+        except asyncio.CancelledError:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                # Granted just as the waiter went away
+                self.release(ticket)
+            else:
+                self._remove_waiting(ticket)
+                self._dispatch()
+            raise
+        run_queue_wait_seconds.observe(time.monotonic() - ticket.enqueued_at)
+
+    def _remove_waiting(self, ticket: RunTicket):
+        queue = self._waiting.get(ticket.user_key)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            runs_waiting.dec()
+            if not queue:
+                del self._waiting[ticket.user_key]
+
+    def _dispatch(self):
+        while self._active < self.max_concurrent and self._waiting:
+            user_key = next((key for key in self._waiting if self._active_per_user.get(key, 0) < self.max_per_user), None)
+            if user_key is None:
+                break
+            if not (self.request_bucket.available() and self.token_bucket.available()):
+                self._retry_later()
+                break
+            queue = self._waiting.pop(user_key)
+            ticket = queue.popleft()
+            if queue:
+                # Back of the rotation, behind every other waiting user
+                self._waiting[user_key] = queue
+            runs_waiting.dec()
+            ticket.active = True
+            self._active += 1
+            self._active_per_user[user_key] = self._active_per_user.get(user_key, 0) + 1
+            runs_active.inc()
+            runs_admitted.inc()
+            ticket.granted.set_result(None)
+        self._notify_positions()
+
+    def _retry_later(self):
+        if self._retry is not None:
+            return
+        delay = max(self.request_bucket.seconds_until_available(), self.token_bucket.seconds_until_available())
+
+        def retry():
+            self._retry = None
+            self._dispatch()
+        self._retry = asyncio.get_running_loop().call_later(delay, retry)
+
+    def _notify_positions(self):
+        """Tell every waiter whose place in the round-robin order changed"""
+        queues = [list(queue) for queue in self._waiting.values()]
+        position = 0
+        for depth in range(max((len(queue) for queue in queues), default=0)):
+            for queue in queues:
+                if depth < len(queue):
+                    position += 1
+                    ticket = queue[depth]
+                    if ticket.position != position:
+                        ticket.position = position
+                        if ticket.on_position is not None:
+                            asyncio.create_task(self._send_position(ticket, position))
+
+    async def _send_position(self, ticket: RunTicket, position: int):
+        try:
+            await ticket.on_position(position)
+        except Exception as e:
+            logger.debug(f"Failed to send queue position: {str(e)}")
+
+
+run_scheduler = RunSchedulerImpl(
+    max_concurrent=int(os.getenv("MAX_CONCURRENT_RUNS", "8")),
+    max_per_user=int(os.getenv("MAX_RUNS_PER_USER", "2")),
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+    tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+)
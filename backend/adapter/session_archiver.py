@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from adapter.storage import StorageRepositoryImpl
+
+logger = logging.getLogger(__name__)
+
+class SessionArchiverImpl:
+    """Background task that moves inactive sessions to the session archive.
+
+    Sessions with no new messages for archive_after_days are archived in
+    batches of batch_size, so the hot message and team state tables only
+    hold recently active sessions. Archived sessions are restored
+    transparently by StorageRepositoryImpl when they are accessed again.
+    """
+
+    def __init__(self, archive_after_days: float = 0.0, batch_size: int = 100, interval: float = 3600.0):
+        self.archive_after_days = archive_after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.storage_repository = StorageRepositoryImpl()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Start archiving in the background; archive_after_days <= 0 disables it"""
+        if self.archive_after_days <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task; a batch in progress finishes its current session"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def archive_batch(self) -> int:
+        """Archive one batch of inactive sessions and return how many were archived"""
+        inactive_since = datetime.now(timezone.utc) - timedelta(days=self.archive_after_days)
+        # Compressing and writing archives is slow, so it runs off the event loop
+        return await asyncio.to_thread(
+            asyncio.run,
+            self.storage_repository.archive_inactive_sessions(inactive_since, self.batch_size)
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                total = 0
+                while True:
+                    archived = await self.archive_batch()
+                    total += archived
+                    if archived < self.batch_size:
+                        break
+                if total:
+                    logger.info(f"Archived {total} inactive sessions")
+            except Exception as e:
+                logger.error(f"Session archiving failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+session_archiver = SessionArchiverImpl(
+    archive_after_days=float(os.getenv("SESSION_ARCHIVE_AFTER_DAYS", "0")),
+    batch_size=int(os.getenv("SESSION_ARCHIVE_BATCH_SIZE", "100")),
+    interval=float(os.getenv("SESSION_ARCHIVE_INTERVAL_SECONDS", "3600")),
+)
@@ -1,39 +1,69 @@
-from typing import Any, List
+from typing import Any, AsyncIterator, List
 from adapter.storage import StorageRepositoryImpl
-from models.websocket import WebsocketMessage as WebsocketMessageDomain
+from lib import state_codec
 
 class SessionHistoryRepositoryImpl:
     def __init__(self, session_id: str):
         self.session_id = session_id
         self.storage_repository = StorageRepositoryImpl()
 
-    async def load_history(self) -> List[dict[str, Any]]:
-        """Load history for the current session"""
-        messages = await self.storage_repository.load_history(self.session_id)
+    async def load_history(
+        self,
+        since: int | None = None,
+        limit: int | None = None,
+        types: List[str] | None = None,
+        source: str | None = None,
+        until: int | None = None,
+    ) -> List[dict[str, Any]]:
+        """Load history for the current session, optionally only messages after the since cursor"""
+        messages = await self.storage_repository.load_history(self.session_id, since, limit, types, source, until)
         return [message.model_dump() for message in messages]
-    
-    async def save_history(self, history: List[dict[str, Any]]):
-        """Save history for the current session"""
-        # Convert dict messages to domain models
-        domain_messages = []
-        for msg_dict in history:
-            # Create a temporary ID if not present
-            if 'id' not in msg_dict:
-                msg_dict['id'] = len(domain_messages) + 1
-            domain_messages.append(WebsocketMessageDomain.model_validate(msg_dict))
-        
-        await self.storage_repository.save_history(self.session_id, domain_messages)
-    
-    async def get_history(self) -> List[dict[str, Any]]:
+
+    async def stream_history(
+        self,
+        since: int | None = None,
+        limit: int | None = None,
+        types: List[str] | None = None,
+        source: str | None = None,
+        until: int | None = None,
+    ) -> AsyncIterator[str]:
+        """Stream history for the current session as NDJSON lines"""
+        async for message in self.storage_repository.stream_history(self.session_id, since, limit, types, source, until):
+            yield message.model_dump_json() + "\n"
+
+    async def get_page_end(
+        self,
+        since: int | None,
+        limit: int,
+        types: List[str] | None = None,
+        source: str | None = None,
+        until: int | None = None,
+    ) -> int | None:
+        """Get the cursor of the last message a page of at most limit messages holds, or None if the page is not full"""
+        return await self.storage_repository.get_page_end(self.session_id, since, limit, types, source, until)
+
+    async def get_last_seq(self) -> int | None:
+        """Get the cursor of the latest message in the current session"""
+        return await self.storage_repository.get_last_seq(self.session_id)
+
+    async def append_messages(self, messages: List[dict[str, Any]]) -> List[int]:
+        """Append a batch of messages to the current session history"""
+        return await self.storage_repository.append_messages(
+            self.session_id,
+            [state_codec.normalize(message) for message in messages]
+        )
+
+    async def get_history(
+        self,
+        since: int | None = None,
+        limit: int | None = None,
+        types: List[str] | None = None,
+        source: str | None = None,
+        until: int | None = None,
+    ) -> List[dict[str, Any]]:
         """Get history for the current session"""
-        return await self.load_history()
-    
+        return await self.load_history(since, limit, types, source, until)
+
     async def append_history(self, message: dict[str, Any]):
         """Append a message to the current session history"""
-        # Save the message to the database
-        await self.storage_repository.save_message(self.session_id, str(message))
-        
-        # Also update the in-memory history
-        current_history = await self.get_history()
-        current_history.append(message)
-        await self.save_history(current_history) 
\ No newline at end of file
+        await self.append_messages([message])
@@ -0,0 +1,376 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Optional
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import ModelClientStreamingChunkEvent, TextMessage, UserInputRequestedEvent
+from autogen_core import CancellationToken
+from adapter.answer_cache import CachedAnswer, answer_cache
+from adapter.message_buffer import message_buffer
+from adapter.run_scheduler import RunTicket, run_scheduler
+from adapter.storage import StorageRepositoryImpl
+from adapter.team import SUMMARY_AGENT
+from adapter.team_cache import team_cache
+from lib.metrics import registry
+from lib.stream_coalescer import StreamChunkCoalescer
+
+logger = logging.getLogger(__name__)
+
+# Streamed tokens are published in frames of at most this many milliseconds or characters
+stream_flush_interval = int(os.getenv("STREAM_FLUSH_INTERVAL_MS", "50")) / 1000
+stream_flush_chars = int(os.getenv("STREAM_FLUSH_CHARS", "256"))
+
+runs_cancelled = registry.counter("team_runs_cancelled_total", "Team runs cancelled by the client, a deadline or abandonment")
+
+class SessionRun:
+    """Event log and input channel of one session's team runs.
+
+    Runs execute as background tasks and publish every frame to the log,
+    numbered with increasing offsets. Clients follow the log from any
+    retained offset, so a client that reconnects replays what it missed
+    while the run carries on. A new log starts its offsets at the current
+    time in microseconds, so they are above every offset an earlier log
+    of the session handed out and a stale resume offset replays the whole
+    new log.
+    """
+
+    def __init__(self, session_id: str, max_events: int = 1000, input_timeout: float = 600.0, turn_deadline: float = 0.0):
+        self.session_id = session_id
+        self.input_timeout = input_timeout
+        self.turn_deadline = turn_deadline
+        self.events: deque[tuple[int, dict[str, Any]]] = deque(maxlen=max_events)
+        self.next_offset = time.time_ns() // 1000
+        self.task: asyncio.Task | None = None
+        self.ticket: RunTicket | None = None
+        self.awaiting_input = False
+        # Cancels the current run's model calls and tools; cancel_reason is set once it was used
+        self.cancellation_token: CancellationToken | None = None
+        self.cancel_reason: str | None = None
+        self.clients = 0
+        self.last_active = time.monotonic()
+        # Runs started from this log; only a session's first question goes through the answer cache
+        self.runs = 0
+        self._inputs: asyncio.Queue[str] = asyncio.Queue()
+        self._changed = asyncio.Condition()
+        self._deadline: asyncio.TimerHandle | None = None
+        self._abandon: asyncio.TimerHandle | None = None
+        # One bound method for the life of the log, so the team cache can tell it is still attached
+        self.input_func = self.user_input
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def publish(self, frame: dict[str, Any]):
+        async with self._changed:
+            frame["offset"] = self.next_offset
+            self.events.append((self.next_offset, frame))
+            self.next_offset += 1
+            self._changed.notify_all()
+
+    async def follow(self, offset: int | None = None) -> AsyncIterator[dict[str, Any]]:
+        """Yield frames from offset on (only new frames by default), waiting for more"""
+        if offset is None:
+            offset = self.next_offset
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.next_offset > offset)
+                first = self.events[0][0] if self.events else self.next_offset
+                if offset < first:
+                    logger.info(f"Resume offset {offset} for session {self.session_id} is no longer retained, replaying from {first}")
+                start = max(0, offset - first)
+                frames = [frame for _, frame in list(self.events)[start:]]
+                offset = self.next_offset
+            for frame in frames:
+                yield frame
+
+    def submit_input(self, content: str):
+        self._inputs.put_nowait(content)
+
+    def cancel(self, reason: str):
+        """Stop the current run: in-flight model calls and tools through the token, waits through the task"""
+        if not self.running or self.cancel_reason is not None:
+            return
+        self.cancel_reason = reason
+        if self.cancellation_token is not None:
+            self.cancellation_token.cancel()
+        self.task.cancel()
+
+    def arm_deadline(self):
+        """Start the clock of the current turn, the agents' work between two user inputs"""
+        self.disarm_deadline()
+        if self.turn_deadline > 0:
+            self._deadline = asyncio.get_running_loop().call_later(self.turn_deadline, self.cancel, "deadline")
+
+    def disarm_deadline(self):
+        if self._deadline is not None:
+            self._deadline.cancel()
+            self._deadline = None
+
+    async def user_input(self, prompt: str, cancellation_token: Optional[CancellationToken]) -> str:
+        """Input function for the user proxy; waits for whichever client answers first"""
+        self.awaiting_input = True
+        # The user's think time doesn't count against the turn deadline
+        self.disarm_deadline()
+        try:
+            if self.ticket is not None:
+                # Don't hold a slot while the user is typing; queue again for the rest of the run
+                async with run_scheduler.yielded(self.ticket):
+                    return await self._next_input(cancellation_token)
+            return await self._next_input(cancellation_token)
+        finally:
+            self.awaiting_input = False
+            self.arm_deadline()
+
+    async def _next_input(self, cancellation_token: Optional[CancellationToken]) -> str:
+        future = asyncio.ensure_future(self._inputs.get())
+        if cancellation_token is not None:
+            cancellation_token.link_future(future)
+        return await asyncio.wait_for(future, self.input_timeout)
+
+class SessionRunManagerImpl:
+    """Runs team turns in the background, detached from any websocket.
+
+    A client that disconnects mid-run doesn't end the run right away: the
+    LLM work completes, its messages are persisted and its frames stay in
+    the session's event log for the client to replay when it reconnects.
+    A run nobody reattaches to within detached_grace seconds is cancelled,
+    as is a turn running longer than turn_deadline seconds or a run the
+    client cancels. Cancelling goes through the run's CancellationToken,
+    which AutoGen hands to every model call and tool, so abandoned work
+    stops straight away. A run waiting for user input with no answer for
+    input_timeout seconds is ended. Logs of sessions with no clients and no
+    run are dropped after retention seconds.
+    """
+
+    def __init__(
+        self,
+        max_events: int = 1000,
+        input_timeout: float = 600.0,
+        retention: float = 300.0,
+        turn_deadline: float = 300.0,
+        detached_grace: float = 30.0,
+    ):
+        self.max_events = max_events
+        self.input_timeout = input_timeout
+        self.retention = retention
+        self.turn_deadline = turn_deadline
+        self.detached_grace = detached_grace
+        self.storage_repository = StorageRepositoryImpl()
+        self._runs: dict[str, SessionRun] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Start the sweeper that drops idle event logs"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the sweeper and cancel runs still in progress"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        tasks = [run.task for run in self._runs.values() if run.running]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._runs.clear()
+
+    def attach(self, session_id: str) -> SessionRun:
+        """Register a client with the session's run, creating its event log if needed"""
+        self.start()
+        run = self._runs.get(session_id)
+        if run is None:
+            run = SessionRun(session_id, self.max_events, self.input_timeout, self.turn_deadline)
+            self._runs[session_id] = run
+        if run._abandon is not None:
+            run._abandon.cancel()
+            run._abandon = None
+        run.clients += 1
+        run.last_active = time.monotonic()
+        return run
+
+    async def detach(self, run: SessionRun):
+        """Unregister a client; the run itself keeps going"""
+        run.clients -= 1
+        run.last_active = time.monotonic()
+        if run.clients:
+            return
+        if run.running:
+            # Give a flaky connection time to come back before throwing the work away
+            run._abandon = asyncio.get_running_loop().call_later(self.detached_grace, self._abandon, run)
+        else:
+            await team_cache.release(run.session_id, run.input_func)
+
+    def _abandon(self, run: SessionRun):
+        run._abandon = None
+        # A run waiting for input costs nothing; input_timeout ends it
+        if not run.clients and not run.awaiting_input:
+            logger.info(f"Cancelling abandoned run for session {run.session_id}")
+            run.cancel("abandoned")
+
+    async def submit(self, run: SessionRun, user_key: str, message: TextMessage):
+        """Answer the pending input request, or start a run with the message as its task"""
+        if run.awaiting_input:
+            run.submit_input(message.content)
+        elif run.running:
+            await run.publish({
+                "type": "error",
+                "content": "A run is already in progress for this session",
+                "source": "system"
+            })
+        else:
+            run.cancel_reason = None
+            run.cancellation_token = CancellationToken()
+            run.runs += 1
+            run.task = asyncio.create_task(self._execute(run, user_key, message))
+
+    def cancel(self, run: SessionRun):
+        """Cancel the session's run on the client's request"""
+        run.cancel("client")
+
+    async def _execute(self, run: SessionRun, user_key: str, task: TextMessage):
+        session_id = run.session_id
+
+        async def queue_position(position: int):
+            await run.publish({
+                "type": "RunQueuedEvent",
+                "content": f"Waiting for a free slot, position {position} in the queue",
+                "position": position,
+                "source": "system"
+            })
+
+        try:
+            embedding = None
+            if answer_cache.enabled and await self._is_first_question(run):
+                try:
+                    embedding = await answer_cache.embed(task.content)
+                    cached = await answer_cache.lookup(embedding)
+                except Exception as e:
+                    logger.warning(f"Semantic answer cache unavailable: {str(e)}")
+                    embedding, cached = None, None
+                if cached is not None:
+                    # Served without the scheduler or the team, so no LLM quota is spent
+                    await self._replay(run, task, cached)
+                    return
+
+            answers: list[TextMessage] = []
+            # Warm team for this session; only built (and its state loaded) on a cache miss
+            entry = await team_cache.acquire(session_id, run.input_func)
+            async with entry.lock, run_scheduler.slot(user_key, queue_position) as run.ticket:
+                coalescer = StreamChunkCoalescer(run.publish, stream_flush_interval, stream_flush_chars)
+                run.arm_deadline()
+                try:
+                    async for message in entry.team.run_stream(task=task, cancellation_token=run.cancellation_token):
+                        if isinstance(message, TaskResult):
+                            continue
+                        if isinstance(message, ModelClientStreamingChunkEvent):
+                            # Partial tokens are only shown; the agent's final message is what gets persisted
+                            await coalescer.add(message)
+                            continue
+                        # Usage arrives after each model call; it counts against the LLM rate limits
+                        run_scheduler.charge(message.models_usage)
+                        await coalescer.flush()
+                        if isinstance(message, TextMessage) and message.source == SUMMARY_AGENT:
+                            answers.append(message)
+                        frame = message.model_dump(mode="json")
+                        if not isinstance(message, UserInputRequestedEvent):
+                            await message_buffer.enqueue(session_id, frame)
+                        await run.publish(dict(frame))
+                        if isinstance(message, UserInputRequestedEvent) and embedding is not None:
+                            # Answers from here on depend on what the user types, not just on the question
+                            await answer_cache.store(task.content, embedding, answers)
+                            embedding = None
+                    await coalescer.flush()
+                finally:
+                    run.disarm_deadline()
+                    coalescer.close()
+                    run.ticket = None
+            await team_cache.checkpoint(session_id)
+            if embedding is not None:
+                await answer_cache.store(task.content, embedding, answers)
+        except asyncio.CancelledError:
+            # A cancelled run leaves the team mid-turn; rebuild from the persisted state next time
+            await team_cache.discard(session_id)
+            if run.cancel_reason is None:
+                raise
+            asyncio.current_task().uncancel()
+            runs_cancelled.inc()
+            logger.info(f"Run cancelled for session {session_id}: {run.cancel_reason}")
+            await run.publish({
+                "type": "RunCancelledEvent",
+                "content": f"Run cancelled ({run.cancel_reason})",
+                "reason": run.cancel_reason,
+                "source": "system"
+            })
+            await run.publish({
+                "type": "UserInputRequestedEvent",
+                "content": "The run was cancelled. Send a new message to start again.",
+                "source": "system"
+            })
+        except Exception as e:
+            logger.error(f"Run failed for session {session_id}: {str(e)}")
+            # The failed run leaves the team mid-turn; rebuild from the persisted state next time
+            await team_cache.discard(session_id)
+            await run.publish({
+                "type": "error",
+                "content": f"Error: {str(e)}",
+                "source": "system"
+            })
+            await run.publish({
+                "type": "UserInputRequestedEvent",
+                "content": "An error occurred. Please try again.",
+                "source": "system"
+            })
+        finally:
+            run.last_active = time.monotonic()
+            if not run.clients:
+                # Nobody is watching; persist now instead of waiting for a client to come back
+                await message_buffer.flush()
+                await team_cache.release(session_id, run.input_func)
+
+    async def _is_first_question(self, run: SessionRun) -> bool:
+        if run.runs > 1:
+            return False
+        session_info = await self.storage_repository.get_session_info(run.session_id)
+        return session_info is None or session_info["message_count"] == 0
+
+    async def _replay(self, run: SessionRun, task: TextMessage, cached: CachedAnswer):
+        """Answer a run from the cache, persisting the exchange like a team run would"""
+        answers = [TextMessage(content=message.content, source=message.source) for message in cached.messages]
+        # The team takes the exchange into its state, so follow-ups keep their context across restarts
+        entry = await team_cache.acquire(run.session_id, run.input_func)
+        async with entry.lock:
+            await team_cache.record(run.session_id, [task, *answers])
+        for message in (task, *answers):
+            frame = message.model_dump(mode="json")
+            await message_buffer.enqueue(run.session_id, frame)
+            await run.publish({**frame, "cached": message is not task})
+        await run.publish({
+            "type": "UserInputRequestedEvent",
+            "content": "Answered from earlier research on a similar question.",
+            "source": "system"
+        })
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(min(self.retention, 60.0))
+            now = time.monotonic()
+            for session_id, run in list(self._runs.items()):
+                if not run.clients and not run.running and now - run.last_active >= self.retention:
+                    del self._runs[session_id]
+
+
+run_manager = SessionRunManagerImpl(
+    max_events=int(os.getenv("RUN_EVENT_LOG_SIZE", "1000")),
+    input_timeout=float(os.getenv("RUN_INPUT_TIMEOUT_SECONDS", "600")),
+    retention=float(os.getenv("RUN_EVENT_LOG_RETENTION_SECONDS", "300")),
+    turn_deadline=float(os.getenv("RUN_TURN_DEADLINE_SECONDS", "300")),
+    detached_grace=float(os.getenv("RUN_DETACHED_GRACE_SECONDS", "30")),
+)
@@ -8,11 +8,22 @@ class SessionTeamStateRepositoryImpl:
 
     async def load_team_state(self) -> dict[str, Any] | None:
         """Load team state for the current session"""
-        return await self.storage_repository.load_llm_state(self.session_id)
+        try:
+            return await self.storage_repository.load_llm_state(self.session_id)
+        finally:
+            # Cached teams keep their repository between turns; don't keep a connection with it
+            self.close()
     
     async def save_team_state(self, team_state: Any):
         """Save team state for the current session"""
-        await self.storage_repository.save_llm_state(self.session_id, team_state)
+        try:
+            await self.storage_repository.save_llm_state(self.session_id, team_state)
+        finally:
+            self.close()
+    
+    def close(self):
+        """Release the database connection; the repository can still be used afterwards"""
+        self.storage_repository.close()
     
     async def get_team_state(self) -> dict[str, Any] | None:
         """Get team state for the current session"""
@@ -20,7 +31,4 @@ class SessionTeamStateRepositoryImpl:
     
     async def update_team_state(self, state: Any):
         """Update team state for the current session"""
-        await self.save_team_state(state) 
-
-
-#TODO: "Error: (builtins.TypeError) Object of type datetime is not JSON serializable [SQL: UPDATE websocket_sessions SET updated_at=now(), llm_state=%(llm_state)s::JSON WHERE websocket_sessions.session_id = %(session_id_1)s] [parameters: [{}]]"
\ No newline at end of file
+        await self.save_team_state(state)
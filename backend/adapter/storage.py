@@ -1,70 +1,361 @@
+import copy
+import logging
+import os
+from datetime import datetime, timezone
+from itertools import islice
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+from lib import session_archive, state_codec
 from lib.sqlalchemy.db import SessionLocal
-from lib.sqlalchemy.sqlalchemy_models import WebsocketMessage as WebsocketMessageDb, WebsocketSession as WebsocketSessionDb
+from lib.sqlalchemy.sqlalchemy_models import WebsocketMessage as WebsocketMessageDb, WebsocketSession as WebsocketSessionDb, WebsocketTeamState as WebsocketTeamStateDb
 from models.websocket import WebsocketMessage as WebsocketMessageDomain
-from typing import Any 
+from typing import Any, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# A full team state snapshot is written after this many deltas
+team_state_snapshot_interval = int(os.getenv("TEAM_STATE_SNAPSHOT_INTERVAL", "20"))
+
+# Messages inserted per statement when an archived session is restored
+REHYDRATE_BATCH_SIZE = 1000
+
+# Message columns kept in the session archive; ids are reassigned on restore
+ARCHIVED_MESSAGE_COLUMNS = (
+    WebsocketMessageDb.seq,
+    WebsocketMessageDb.source,
+    WebsocketMessageDb.type,
+    WebsocketMessageDb.prompt_tokens,
+    WebsocketMessageDb.completion_tokens,
+    WebsocketMessageDb.payload,
+    WebsocketMessageDb.created_at,
+)
 
 # operates sqlalchemy
 class StorageRepositoryImpl:
-    def __init__(self):
-        self.session = SessionLocal()
+    def __init__(self, session_factory=SessionLocal):
+        # Overridable so benchmarks and scripts can point the repository at another database
+        self.session_factory = session_factory
+        self.session = session_factory()
+        # session_id -> (version, deltas since snapshot, normalized state) of the last state saved or loaded
+        self._team_states: dict[str, tuple[int, int, Any]] = {}
+    
+    def close(self):
+        """Roll back anything uncommitted and return the connection to the pool.
+
+        The repository stays usable; the next query checks out a connection again.
+        """
+        self.session.close()
 
-    async def load_history(self, session_id: str) -> list[WebsocketMessageDomain]:
+    async def load_history(
+        self,
+        session_id: str,
+        since: int | None = None,
+        limit: int | None = None,
+        types: list[str] | None = None,
+        source: str | None = None,
+        until: int | None = None,
+    ) -> list[WebsocketMessageDomain]:
+        """Load messages with a sequence number greater than since, oldest first.
+
+        Served from the (session_id, seq) unique index, so a page costs the
+        same however long the session is. types and source filter on the
+        indexed message columns.
+        """
         # First get the session record
-        session = self.session.query(WebsocketSessionDb).filter(WebsocketSessionDb.session_id == session_id).first()
+        session = self._hot_session(session_id)
         if not session:
             return []
         
-        # Then get messages for this session
-        result = self.session.query(WebsocketMessageDb).filter(WebsocketMessageDb.session_id == session.id).all()
-        return list(map(lambda x: WebsocketMessageDomain.model_validate({
+        # Then get messages for this session in the order they were appended
+        query = self.session.query(WebsocketMessageDb).filter(*self._history_conditions(session, since, types, source, until))
+        query = query.order_by(WebsocketMessageDb.seq)
+        if limit is not None:
+            query = query.limit(limit)
+        return [self._to_domain_message(x) for x in query.all()]
+    
+    async def stream_history(
+        self,
+        session_id: str,
+        since: int | None = None,
+        limit: int | None = None,
+        types: list[str] | None = None,
+        source: str | None = None,
+        until: int | None = None,
+        batch_size: int = 500,
+    ) -> AsyncIterator[WebsocketMessageDomain]:
+        """Yield messages oldest first, up to sequence number until, reading them through a server-side cursor"""
+        session = self._hot_session(session_id)
+        if not session:
+            return
+        
+        statement = select(WebsocketMessageDb).where(*self._history_conditions(session, since, types, source, until))
+        statement = statement.order_by(WebsocketMessageDb.seq)
+        if limit is not None:
+            statement = statement.limit(limit)
+        statement = statement.execution_options(yield_per=batch_size)
+        
+        # A dedicated session keeps the long-running cursor off this repository's transaction
+        with self.session_factory() as db:
+            for partition in db.execute(statement).scalars().partitions():
+                for x in partition:
+                    yield self._to_domain_message(x)
+    
+    async def get_page_end(
+        self,
+        session_id: str,
+        since: int | None,
+        limit: int,
+        types: list[str] | None = None,
+        source: str | None = None,
+        until: int | None = None,
+    ) -> int | None:
+        """Sequence number of the limit-th message after since, or None if fewer messages match"""
+        session = self._hot_session(session_id)
+        if not session:
+            return None
+        return self.session.query(WebsocketMessageDb.seq).filter(
+            *self._history_conditions(session, since, types, source, until)
+        ).order_by(WebsocketMessageDb.seq).offset(limit - 1).limit(1).scalar()
+    
+    async def get_last_seq(self, session_id: str) -> int | None:
+        """Get the sequence number of the latest message, or None if the session does not exist"""
+        return self.session.query(WebsocketSessionDb.last_seq).filter(WebsocketSessionDb.session_id == session_id).scalar()
+    
+    async def get_message_stats(self, session_id: str) -> dict | None:
+        """Count messages per type and source and sum token usage for a session"""
+        session = self._hot_session(session_id)
+        if not session:
+            return None
+        
+        rows = self.session.query(
+            WebsocketMessageDb.type,
+            WebsocketMessageDb.source,
+            func.count(WebsocketMessageDb.id),
+            func.coalesce(func.sum(WebsocketMessageDb.prompt_tokens), 0),
+            func.coalesce(func.sum(WebsocketMessageDb.completion_tokens), 0),
+        ).filter(*self._session_messages(session)).group_by(
+            WebsocketMessageDb.type, WebsocketMessageDb.source
+        ).all()
+        
+        return {
+            "session_id": session.session_id,
+            "message_count": sum(row[2] for row in rows),
+            "prompt_tokens": sum(row[3] for row in rows),
+            "completion_tokens": sum(row[4] for row in rows),
+            "by_type_and_source": [
+                {
+                    "type": row[0],
+                    "source": row[1],
+                    "message_count": row[2],
+                    "prompt_tokens": row[3],
+                    "completion_tokens": row[4]
+                }
+                for row in rows
+            ]
+        }
+    
+    def _session_messages(self, session: WebsocketSessionDb) -> list:
+        """Conditions that select a session's messages.
+
+        No message is older than its session, so on PostgreSQL the created_at
+        bound lets the planner skip every monthly partition before the session
+        started. SQLite compares the stored timestamp text, so it only gets the
+        session condition.
+        """
+        conditions = [WebsocketMessageDb.session_id == session.id]
+        if self.session.get_bind().dialect.name == "postgresql":
+            conditions.append(WebsocketMessageDb.created_at >= session.created_at)
+        return conditions
+    
+    def _history_conditions(
+        self,
+        session: WebsocketSessionDb,
+        since: int | None,
+        types: list[str] | None,
+        source: str | None,
+        until: int | None = None,
+    ) -> list:
+        """Conditions that select the session's messages after since, up to until, filtered by type and source"""
+        conditions = self._session_messages(session)
+        if since is not None:
+            conditions.append(WebsocketMessageDb.seq > since)
+        if until is not None:
+            conditions.append(WebsocketMessageDb.seq <= until)
+        if types:
+            conditions.append(WebsocketMessageDb.type.in_(types))
+        if source is not None:
+            conditions.append(WebsocketMessageDb.source == source)
+        return conditions
+    
+    def _to_domain_message(self, x: WebsocketMessageDb) -> WebsocketMessageDomain:
+        return WebsocketMessageDomain.model_validate({
             "id": x.id,
             "session_id": x.session_id,
-            "message": x.message,
+            "seq": x.seq,
+            "source": x.source,
+            "type": x.type,
+            "prompt_tokens": x.prompt_tokens,
+            "completion_tokens": x.completion_tokens,
+            "payload": x.payload,
             "created_at": x.created_at
-        }), result))
+        })
     
-    async def save_history(self, session_id: str, history: list[WebsocketMessageDomain]):
-        # First get the session record
-        session = self.session.query(WebsocketSessionDb).filter(WebsocketSessionDb.session_id == session_id).first()
-        if not session:
-            return
+    def _to_message_columns(self, message: dict[str, Any]) -> dict[str, Any]:
+        """Split the indexed fields out of an AutoGen message dump"""
+        models_usage = message.get("models_usage") or {}
+        return {
+            "source": message.get("source"),
+            "type": message.get("type"),
+            "prompt_tokens": models_usage.get("prompt_tokens"),
+            "completion_tokens": models_usage.get("completion_tokens"),
+            "payload": message
+        }
+    
+    async def append_messages(self, session_id: str, messages: list[dict[str, Any]]) -> list[int]:
+        """Append messages to the session and return their sequence numbers.
+
+        Existing messages are never rewritten.
+        """
+        seqs = await self.append_messages_bulk({session_id: messages})
+        return seqs.get(session_id, [])
+    
+    async def append_messages_bulk(self, batches: dict[str, list[dict[str, Any]]], synchronous_commit: bool = True) -> dict[str, list[int]]:
+        """Append messages for many sessions in a single transaction.
+
+        Sequence numbers are reserved by bumping each session's counter, which
+        row-locks the session until commit, so concurrent writers never collide.
+        All rows go out in one multi-row INSERT. Sessions that do not exist are
+        skipped and left out of the result.
+        """
+        batches = {session_id: messages for session_id, messages in batches.items() if messages}
+        if not batches:
+            return {}
         
-        # Delete existing messages for this session
-        self.session.query(WebsocketMessageDb).filter(WebsocketMessageDb.session_id == session.id).delete()
+        if not synchronous_commit and self.session.get_bind().dialect.name == "postgresql":
+            # Trade the last few hundred milliseconds of durability for commit latency
+            self.session.execute(text("SET LOCAL synchronous_commit TO OFF"))
+        
+        result: dict[str, list[int]] = {}
+        rows: list[dict[str, Any]] = []
+        rehydrated: list[str] = []
+        # Lock sessions in a stable order so concurrent flushes cannot deadlock
+        for session_id in sorted(batches):
+            messages = batches[session_id]
+            reserved = self.session.execute(
+                update(WebsocketSessionDb)
+                .where(WebsocketSessionDb.session_id == session_id)
+                .values(last_seq=WebsocketSessionDb.last_seq + len(messages), last_activity_at=func.now())
+                .returning(WebsocketSessionDb.id, WebsocketSessionDb.last_seq, WebsocketSessionDb.archived_at)
+            ).first()
+            if not reserved:
+                continue
+            if reserved.archived_at is not None:
+                # The archived history comes back in the same transaction as the new messages
+                rehydrated.append(self._rehydrate(self.session.get(WebsocketSessionDb, reserved.id)))
+            
+            first_seq = reserved.last_seq - len(messages) + 1
+            seqs = list(range(first_seq, reserved.last_seq + 1))
+            rows.extend(
+                {"session_id": reserved.id, "seq": seq, **self._to_message_columns(message)}
+                for seq, message in zip(seqs, messages)
+            )
+            result[session_id] = seqs
         
-        # Add new messages
-        self.session.add_all(list(map(lambda x: WebsocketMessageDb(
-            id=x.id,
-            session_id=session.id,  # Use session.id, not session_id string
-            message=x.message,
-            created_at=x.created_at
-        ), history)))
+        if rows:
+            self.session.execute(insert(WebsocketMessageDb), rows)
         self.session.commit()
+        for path in rehydrated:
+            session_archive.remove_archive(path)
+        return result
     
     async def save_llm_state(self, session_id: str, llm_state: Any):
-        self.session.query(WebsocketSessionDb).filter(WebsocketSessionDb.session_id == session_id).update({
-            "llm_state": llm_state
-        })
+        """Persist a new version of the team state.
+
+        Only the difference to the previous version is written, except every
+        TEAM_STATE_SNAPSHOT_INTERVAL saves (or when the delta would not be
+        smaller) when a full snapshot is written and older versions are pruned.
+        """
+        session = self._hot_session(session_id)
+        if not session:
+            return
+        
+        state = state_codec.normalize(llm_state)
+        try:
+            self._write_team_state(session, state)
+        except IntegrityError:
+            # Another writer saved this session concurrently; rebase on its latest version
+            self.session.rollback()
+            self._team_states.pop(session_id, None)
+            self._write_team_state(session, state)
+    
+    def _write_team_state(self, session: WebsocketSessionDb, state: Any):
+        if session.session_id not in self._team_states:
+            self._read_team_state(session)
+        version, deltas_since_snapshot, previous = self._team_states.get(session.session_id, (0, 0, None))
+        
+        raw = state_codec.dumps(state)
+        payload = None
+        if previous is not None and deltas_since_snapshot < team_state_snapshot_interval:
+            delta = state_codec.dumps(state_codec.diff_state(previous, state))
+            if len(delta) < len(raw) // 2:
+                payload = state_codec.compress(delta)
+                deltas_since_snapshot += 1
+        is_snapshot = payload is None
+        if is_snapshot:
+            payload = state_codec.compress(raw)
+            deltas_since_snapshot = 0
+        
+        version += 1
+        self.session.add(WebsocketTeamStateDb(
+            session_id=session.id,
+            version=version,
+            is_snapshot=is_snapshot,
+            payload=payload,
+            raw_size=len(raw)
+        ))
+        if is_snapshot:
+            # Everything before the new snapshot is no longer needed to rebuild the state
+            self.session.query(WebsocketTeamStateDb).filter(
+                WebsocketTeamStateDb.session_id == session.id,
+                WebsocketTeamStateDb.version < version
+            ).delete(synchronize_session=False)
+            if session.llm_state is not None:
+                session.llm_state = None
         self.session.commit()
+        self._team_states[session.session_id] = (version, deltas_since_snapshot, state)
+    
+    def _read_team_state(self, session: WebsocketSessionDb) -> Any | None:
+        """Rebuild the latest team state from the last snapshot and the deltas after it"""
+        latest_snapshot = self.session.query(func.max(WebsocketTeamStateDb.version)).filter(
+            WebsocketTeamStateDb.session_id == session.id,
+            WebsocketTeamStateDb.is_snapshot.is_(True)
+        ).scalar_subquery()
+        rows = self.session.query(WebsocketTeamStateDb).filter(
+            WebsocketTeamStateDb.session_id == session.id,
+            WebsocketTeamStateDb.version >= latest_snapshot
+        ).order_by(WebsocketTeamStateDb.version).all()
+        if not rows:
+            self._team_states.pop(session.session_id, None)
+            return session.llm_state
+        
+        state = None
+        for row in rows:
+            if row.is_snapshot:
+                state = state_codec.decode(row.payload)
+            else:
+                state = state_codec.apply_delta(state, state_codec.decode(row.payload))
+        self._team_states[session.session_id] = (rows[-1].version, len(rows) - 1, state)
+        return copy.deepcopy(state)
     
     async def load_llm_state(self, session_id: str) -> Any | None:
-        result = self.session.query(WebsocketSessionDb).filter(WebsocketSessionDb.session_id == session_id).first()
+        result = self._hot_session(session_id)
         if not result:
             return None
-        return result.llm_state
+        return self._read_team_state(result)
     
-    async def save_message(self, session_id: str, message: str):
+    async def save_message(self, session_id: str, message: dict[str, Any]):
         """Save a single message to the session"""
-        session = self.session.query(WebsocketSessionDb).filter(WebsocketSessionDb.session_id == session_id).first()
-        if not session:
-            return
-        
-        message_db = WebsocketMessageDb(
-            session_id=session.id,
-            message=message
-        )
-        self.session.add(message_db)
-        self.session.commit()
+        await self.append_messages(session_id, [message])
 
     async def init_session(self, session_id: str):
         self.session.add(WebsocketSessionDb(
@@ -74,23 +365,20 @@ class StorageRepositoryImpl:
         self.session.commit()
     
     async def get_session_info(self, session_id: str) -> dict | None:
-        """Get session information including message count and last activity"""
+        """Get session information including message count and last activity.
+
+        Read from the session row alone, so archived sessions are not restored:
+        messages are never removed one by one, so last_seq is the message count.
+        """
         session = self.session.query(WebsocketSessionDb).filter(WebsocketSessionDb.session_id == session_id).first()
         if not session:
             return None
         
-        # Get message count for this session
-        message_count = self.session.query(WebsocketMessageDb).filter(WebsocketMessageDb.session_id == session.id).count()
-        
-        # Get last activity (latest message timestamp)
-        latest_message = self.session.query(WebsocketMessageDb).filter(WebsocketMessageDb.session_id == session.id).order_by(WebsocketMessageDb.created_at.desc()).first()
-        last_activity = latest_message.created_at if latest_message else session.created_at
-        
         return {
             "session_id": session.session_id,
             "created_at": session.created_at,
-            "message_count": message_count,
-            "last_activity": last_activity
+            "message_count": session.last_seq,
+            "last_activity": session.last_activity_at or session.created_at
         }
     
     async def delete_session(self, session_id: str) -> bool:
@@ -99,32 +387,154 @@ class StorageRepositoryImpl:
         if not session:
             return False
         
-        # Delete all messages for this session
-        self.session.query(WebsocketMessageDb).filter(WebsocketMessageDb.session_id == session.id).delete()
+        # Delete all messages and team states for this session
+        self.session.query(WebsocketMessageDb).filter(*self._session_messages(session)).delete()
+        self.session.query(WebsocketTeamStateDb).filter(WebsocketTeamStateDb.session_id == session.id).delete()
+        self._team_states.pop(session_id, None)
         
         # Delete the session
+        archived = session.archived_at is not None
         self.session.delete(session)
         self.session.commit()
+        if archived:
+            session_archive.remove_archive(session_archive.archive_path(session_id))
         return True
     
     async def list_sessions(self) -> list[dict]:
         """List all sessions with basic information"""
-        sessions = self.session.query(WebsocketSessionDb).all()
-        result = []
+        # The counters on the session rows cover archived sessions without touching the message table
+        rows = self.session.query(
+            WebsocketSessionDb.session_id,
+            WebsocketSessionDb.created_at,
+            WebsocketSessionDb.last_seq,
+            WebsocketSessionDb.last_activity_at
+        ).all()
         
-        for session in sessions:
-            # Get message count for this session
-            message_count = self.session.query(WebsocketMessageDb).filter(WebsocketMessageDb.session_id == session.id).count()
-            
-            # Get last activity
-            latest_message = self.session.query(WebsocketMessageDb).filter(WebsocketMessageDb.session_id == session.id).order_by(WebsocketMessageDb.created_at.desc()).first()
-            last_activity = latest_message.created_at if latest_message else session.created_at
-            
-            result.append({
+        return [
+            {
+                "session_id": row.session_id,
+                "created_at": row.created_at,
+                "message_count": row.last_seq,
+                "last_activity": row.last_activity_at or row.created_at
+            }
+            for row in rows
+        ]
+    
+    async def archive_inactive_sessions(self, inactive_since: datetime, limit: int = 100) -> int:
+        """Move up to limit sessions with no activity since inactive_since to the session archive.
+
+        Returns the number of sessions archived. Each session is archived in its
+        own transaction, and a session that fails is logged and left hot.
+        """
+        candidates = self.session.query(WebsocketSessionDb.id).filter(
+            WebsocketSessionDb.archived_at.is_(None),
+            WebsocketSessionDb.last_activity_at < inactive_since
+        ).order_by(WebsocketSessionDb.last_activity_at).limit(limit).all()
+        self.session.rollback()
+        
+        archived = 0
+        for (id,) in candidates:
+            try:
+                if self._archive_session(id, inactive_since):
+                    archived += 1
+            except Exception as e:
+                self.session.rollback()
+                logger.error(f"Failed to archive session {id}: {str(e)}")
+        return archived
+    
+    def _archive_session(self, id: int, inactive_since: datetime) -> bool:
+        """Write one session's messages and team state to its archive file and delete them.
+
+        Claiming the session row first makes concurrent writers to the session
+        wait, and once the archive commits they find it archived and restore it.
+        """
+        claimed = self.session.execute(
+            update(WebsocketSessionDb)
+            .where(
+                WebsocketSessionDb.id == id,
+                WebsocketSessionDb.archived_at.is_(None),
+                WebsocketSessionDb.last_activity_at < inactive_since
+            )
+            .values(archived_at=func.now())
+            .returning(WebsocketSessionDb.session_id)
+        ).first()
+        if not claimed:
+            # Became active again since it was selected
+            self.session.rollback()
+            return False
+        
+        session = self.session.get(WebsocketSessionDb, id, populate_existing=True)
+        team_state = self._read_team_state(session)
+        team_state_version = self._team_states.get(session.session_id, (0, 0, None))[0]
+        messages = self.session.execute(
+            select(*ARCHIVED_MESSAGE_COLUMNS)
+            .where(*self._session_messages(session))
+            .order_by(WebsocketMessageDb.seq)
+            .execution_options(yield_per=REHYDRATE_BATCH_SIZE)
+        )
+        session_archive.write_archive(
+            session_archive.archive_path(session.session_id),
+            {
                 "session_id": session.session_id,
-                "created_at": session.created_at,
-                "message_count": message_count,
-                "last_activity": last_activity
-            })
+                "last_seq": session.last_seq,
+                "team_state": team_state,
+                "team_state_version": team_state_version,
+            },
+            (row._asdict() for row in messages)
+        )
+        
+        self.session.query(WebsocketMessageDb).filter(*self._session_messages(session)).delete(synchronize_session=False)
+        self.session.query(WebsocketTeamStateDb).filter(WebsocketTeamStateDb.session_id == id).delete(synchronize_session=False)
+        session.llm_state = None
+        self.session.commit()
+        self._team_states.pop(session.session_id, None)
+        return True
+    
+    def _hot_session(self, session_id: str) -> WebsocketSessionDb | None:
+        """Look up a session, restoring it from the archive first if it was archived"""
+        session = self.session.query(WebsocketSessionDb).filter(WebsocketSessionDb.session_id == session_id).first()
+        if session is not None and session.archived_at is not None:
+            path = self._rehydrate(session)
+            self.session.commit()
+            session_archive.remove_archive(path)
+        return session
+    
+    def _rehydrate(self, session: WebsocketSessionDb) -> str:
+        """Copy an archived session back into the hot tables without committing; returns the archive path.
+
+        If the archive file is gone, the session is brought back without its
+        archived messages and team state, so it stays usable from then on.
+        """
+        path = session_archive.archive_path(session.session_id)
+        header = None
+        try:
+            with session_archive.open_archive(path) as (header, rows):
+                while batch := list(islice(rows, REHYDRATE_BATCH_SIZE)):
+                    for row in batch:
+                        row["session_id"] = session.id
+                        row["created_at"] = session_archive.parse_datetime(row["created_at"])
+                    self.session.execute(insert(WebsocketMessageDb), batch)
+        except FileNotFoundError:
+            logger.error(
+                f"Archive of session {session.session_id} not found at {path}; "
+                f"restoring the session without its {session.last_seq} archived messages and team state"
+            )
         
-        return result
\ No newline at end of file
+        # A state saved while the session was being archived is newer than the archived one
+        has_hot_state = self.session.query(WebsocketTeamStateDb.id).filter(WebsocketTeamStateDb.session_id == session.id).first() is not None
+        if header is not None and header["team_state"] is not None and not has_hot_state:
+            raw = state_codec.dumps(header["team_state"])
+            self.session.add(WebsocketTeamStateDb(
+                session_id=session.id,
+                version=header["team_state_version"] or 1,
+                is_snapshot=True,
+                payload=state_codec.compress(raw),
+                raw_size=len(raw)
+            ))
+        self.session.execute(
+            update(WebsocketSessionDb)
+            .where(WebsocketSessionDb.id == session.id)
+            .values(archived_at=None)
+        )
+        self._team_states.pop(session.session_id, None)
+        return path
@@ -1,3 +1,4 @@
+import os
 from typing import Any, Awaitable, Callable, Optional
 # https://microsoft.github.io/autogen/stable/user-guide/agentchat-user-guide/tutorial/agents.html#streaming-tokens
 
@@ -5,32 +6,46 @@ from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
 from autogen_core.tools import FunctionTool
 from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_core import CancellationToken
+from autogen_core.model_context import ChatCompletionContext
 from autogen_core.models import ChatCompletionClient
 from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination
-from lib.model_config import load_model_config
+from adapter.model_client_pool import model_client_pool
+from lib.model_context import build_model_context
 from lib.tools.sample import sample_tool
 from lib.tools.weaviate_tools import search_paper, search_chunk
 
+# Stream tokens as ModelClientStreamingChunkEvents while agents generate their answers
+model_client_stream = os.getenv("MODEL_CLIENT_STREAM", "true").lower() == "true"
+
+# Agent whose messages are the team's final answer
+SUMMARY_AGENT = "summarize_agent"
+
 class TeamRepositoryImpl:
-    def __init__(self):
-        self.model_client = None
-        self.team = None
-    
-    async def load_model_config(self) -> Any:
-        model_config = await load_model_config()
-        self.model_client = ChatCompletionClient.load_component(model_config)
+    # Stateless, so one instance can build teams for every session concurrently
 
     async def get_team(
         self, 
         user_input_func: Callable[[str, Optional[CancellationToken]], Awaitable[str]],
-        state: Any | None = None
+        state: Any | None = None,
+        model_client: ChatCompletionClient | None = None
     ) -> RoundRobinGroupChat:
-        if self.model_client is None:
-            raise ValueError("Model client not loaded")
-        
+        async def client_for(agent_name: str) -> ChatCompletionClient:
+            if model_client is not None:
+                return model_client
+            # Shared with every other team built from the same config, behind the completion cache if enabled for the agent
+            return await model_client_pool.get_agent_client(agent_name)
+
+        async def context_for(agent_name: str, client: ChatCompletionClient) -> ChatCompletionContext:
+            # Bounds the prompt each turn sends, however long the session gets
+            settings = await model_client_pool.get_context_settings(agent_name)
+            return build_model_context(settings, client, await model_client_pool.get_token_counter())
+
+        search_paper_client = await client_for("search_paper_agent")
         search_paper_agent = AssistantAgent(
             name="search_paper_agent",
-            model_client=self.model_client,
+            model_client=search_paper_client,
+            model_client_stream=model_client_stream,
+            model_context=await context_for("search_paper_agent", search_paper_client),
             # TODO: these tools are called at the same time,
             # so need to change impl as search_paper -> search_chunk -> summarize
             description="Search for paper related to the query from database",
@@ -45,9 +60,12 @@ class TeamRepositoryImpl:
             max_tool_iterations=10,  # At most 10 iterations of tool calls before stopping the loop.
         )
 
+        search_chunk_client = await client_for("search_chunk_agent")
         search_chunk_agent = AssistantAgent(
             name="search_chunk_agent",
-            model_client=self.model_client,
+            model_client=search_chunk_client,
+            model_client_stream=model_client_stream,
+            model_context=await context_for("search_chunk_agent", search_chunk_client),
             description="Search for chunk related to the query from the paper with the given id",
             tools=[
                 FunctionTool(
@@ -60,9 +78,12 @@ class TeamRepositoryImpl:
             max_tool_iterations=10,
         )
 
+        summarize_client = await client_for(SUMMARY_AGENT)
         summarize_agent = AssistantAgent(
-            name="summarize_agent",
-            model_client=self.model_client,
+            name=SUMMARY_AGENT,
+            model_client=summarize_client,
+            model_client_stream=model_client_stream,
+            model_context=await context_for(SUMMARY_AGENT, summarize_client),
             description="Summarize the paper",
             system_message="Summarize the given information and generate TL;DR. Use bullet points to organize the structure",
             max_tool_iterations=10,
@@ -77,16 +98,15 @@ class TeamRepositoryImpl:
         # TODO: implement explicit termination flag
         # The termination condition is a combination of text termination and max message termination, either of which will cause the chat to terminate.
         termination = TextMentionTermination("TERMINATE") | MaxMessageTermination(10)
-        self.team = RoundRobinGroupChat([
+        team = RoundRobinGroupChat([
             search_paper_agent,
             search_chunk_agent,
             summarize_agent,
             user_proxy
         ], termination_condition=termination)
         if state is not None:
-            await self.team.load_state(state)
-        return self.team
+            await team.load_state(state)
+        return team
 
     async def save_team(self, team: RoundRobinGroupChat):
-        self.team = team
-        return await self.team.save_state()
\ No newline at end of file
+        return await team.save_state()
\ No newline at end of file
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Mapping, Optional, Sequence
+from autogen_agentchat.messages import BaseChatMessage
+from autogen_agentchat.teams import RoundRobinGroupChat
+from autogen_core import CancellationToken
+from autogen_core.models import AssistantMessage
+from adapter.model_client_pool import model_client_pool
+from adapter.team import TeamRepositoryImpl
+from adapter.session_team_state import SessionTeamStateRepositoryImpl
+
+logger = logging.getLogger(__name__)
+
+UserInputFunc = Callable[[str, Optional[CancellationToken]], Awaitable[str]]
+
+class UserInputRelay:
+    """Input function handed to the user proxy of a cached team.
+
+    The team outlives any single websocket, so input requests are forwarded to
+    whichever client is currently attached to the session.
+    """
+
+    def __init__(self, input_func: UserInputFunc | None = None):
+        self.input_func = input_func
+
+    async def __call__(self, prompt: str, cancellation_token: Optional[CancellationToken]) -> str:
+        if self.input_func is None:
+            raise RuntimeError("No client is attached to this session")
+        return await self.input_func(prompt, cancellation_token)
+
+@dataclass
+class TeamCacheEntry:
+    team: RoundRobinGroupChat
+    relay: UserInputRelay
+    state_repository: SessionTeamStateRepositoryImpl
+    last_used: float = field(default_factory=time.monotonic)
+    # Held while the team is running; busy entries are never evicted
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Set when the team state changed since it was last persisted
+    dirty: bool = False
+    # State at the end of the last successful turn, kept until it is persisted
+    state: Mapping[str, Any] | None = None
+    # model_client_pool generation the team was built with
+    generation: int = 0
+
+class TeamCacheImpl:
+    """Per-process LRU cache of live teams keyed by session id.
+
+    A hit skips loading the model config, reading the team state and
+    rebuilding the agents. State is persisted at the end of every
+    successful turn. If that write fails, the state of the turn is kept and
+    retried when the entry is evicted (for size or idleness), released by
+    its client, discarded after a failed run, or on shutdown.
+    """
+
+    def __init__(self, max_size: int = 128, idle_timeout: float = 900.0):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.team_repository = TeamRepositoryImpl()
+        self._entries: OrderedDict[str, TeamCacheEntry] = OrderedDict()
+        self._build_locks: dict[str, asyncio.Lock] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Start the idle eviction sweeper"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the sweeper and persist every cached team"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for session_id in list(self._entries):
+            await self.evict(session_id)
+
+    async def acquire(self, session_id: str, user_input_func: UserInputFunc) -> TeamCacheEntry:
+        """Return the warm team for the session, building it on a miss"""
+        self.start()
+        build_lock = self._build_locks.setdefault(session_id, asyncio.Lock())
+        async with build_lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and self._is_stale(entry) and not entry.lock.locked():
+                # Built with a model config that has changed since; rebuild on the new clients
+                del self._entries[session_id]
+                if entry.dirty:
+                    await self._persist(entry)
+                entry.state_repository.close()
+                entry = None
+            if entry is None:
+                entry = await self._build(session_id)
+                self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            entry.relay.input_func = user_input_func
+            entry.last_used = time.monotonic()
+        await self._evict_overflow(keep=session_id)
+        return entry
+
+    async def checkpoint(self, session_id: str):
+        """Persist the team state at the end of a successful turn"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        entry.state = await entry.team.save_state()
+        entry.dirty = True
+        entry.last_used = time.monotonic()
+        await self._persist(entry)
+
+    async def record(self, session_id: str, messages: Sequence[BaseChatMessage]):
+        """Add messages to the team's conversation without running it, and persist it.
+
+        The state ends up as if a turn had produced them: the manager adds
+        them to its thread, a participant that sent some has everything up
+        to its last message in its model context, and every participant
+        buffers the messages after that for its next turn.
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        state = await entry.team.save_state()
+        for name, agent_state in state["agent_states"].items():
+            if "message_thread" in agent_state:
+                agent_state["message_thread"].extend(message.dump() for message in messages)
+                continue
+            seen = max((i + 1 for i, message in enumerate(messages) if message.source == name), default=0)
+            llm_context = agent_state["agent_state"].get("llm_context")
+            if seen and llm_context is not None:
+                llm_context["messages"].extend(
+                    (AssistantMessage(content=message.to_model_text(), source=name) if message.source == name else message.to_model_message()).model_dump()
+                    for message in messages[:seen]
+                )
+            agent_state["message_buffer"].extend(message.dump() for message in messages[seen:])
+        await entry.team.load_state(state)
+        await self.checkpoint(session_id)
+
+    async def release(self, session_id: str, user_input_func: UserInputFunc):
+        """Detach a client from the session, persisting team state not yet written"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        if entry.relay.input_func is user_input_func:
+            entry.relay.input_func = None
+        if entry.dirty and not entry.lock.locked():
+            await self._persist(entry)
+
+    async def discard(self, session_id: str):
+        """Drop a cached team after a failed run.
+
+        The team is left mid-turn, so only the state of its last successful
+        turn is persisted, if that has not been written yet.
+        """
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            if entry.dirty:
+                await self._persist(entry)
+            entry.state_repository.close()
+
+    async def evict(self, session_id: str):
+        """Remove a session from the cache, persisting its state first"""
+        # Hold the build lock so a concurrent miss cannot read the state before it is persisted
+        async with self._build_locks.setdefault(session_id, asyncio.Lock()):
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                if entry.dirty:
+                    await self._persist(entry)
+                entry.state_repository.close()
+
+    async def _build(self, session_id: str) -> TeamCacheEntry:
+        state_repository = SessionTeamStateRepositoryImpl(session_id)
+        team_state = await state_repository.get_team_state()
+        generation = model_client_pool.generation
+        relay = UserInputRelay()
+        # Each agent gets its client from the pool, cached or not as the model config says
+        team = await self.team_repository.get_team(relay, team_state)
+        return TeamCacheEntry(team=team, relay=relay, state_repository=state_repository, generation=generation)
+
+    def _is_stale(self, entry: TeamCacheEntry) -> bool:
+        return entry.generation != model_client_pool.generation
+
+    async def _persist(self, entry: TeamCacheEntry):
+        try:
+            await entry.state_repository.save_team_state(entry.state)
+            entry.state = None
+            entry.dirty = False
+        except Exception as e:
+            logger.error(f"Failed to persist team state for {entry.state_repository.session_id}: {str(e)}")
+
+    async def _evict_overflow(self, keep: str):
+        for session_id in list(self._entries):
+            if len(self._entries) <= self.max_size:
+                break
+            entry = self._entries.get(session_id)
+            if session_id != keep and entry is not None and not entry.lock.locked():
+                await self.evict(session_id)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 60.0))
+            now = time.monotonic()
+            for session_id, entry in list(self._entries.items()):
+                if (now - entry.last_used >= self.idle_timeout or self._is_stale(entry)) and not entry.lock.locked():
+                    logger.info(f"Evicting idle or outdated team for session: {session_id}")
+                    await self.evict(session_id)
+            for session_id, build_lock in list(self._build_locks.items()):
+                if session_id not in self._entries and not build_lock.locked():
+                    del self._build_locks[session_id]
+
+
+team_cache = TeamCacheImpl(
+    max_size=int(os.getenv("TEAM_CACHE_MAX_SIZE", "128")),
+    idle_timeout=float(os.getenv("TEAM_CACHE_IDLE_SECONDS", "900")),
+)
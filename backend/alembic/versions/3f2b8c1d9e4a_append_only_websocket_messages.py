@@ -0,0 +1,88 @@
+"""Append-only websocket messages with per-session sequence numbers
+
+Revision ID: 3f2b8c1d9e4a
+Revises: 162a9eedd725
+Create Date: 2025-08-02 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f2b8c1d9e4a'
+down_revision: Union[str, Sequence[str], None] = '162a9eedd725'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('websocket_sessions', sa.Column('last_seq', sa.Integer(), server_default='0', nullable=False))
+
+    # init_session used to insert a new row on every call, so a session_id may have several rows.
+    # Merge them into the oldest one before session_id becomes unique: it takes the others'
+    # messages, which the numbering below keeps in insertion order, and the latest update time.
+    # save_llm_state wrote to every row of a session_id, so the oldest row already has the latest state.
+    op.execute("""
+        UPDATE websocket_messages AS m
+        SET session_id = keep.id
+        FROM websocket_sessions AS s, (
+            SELECT session_id, MIN(id) AS id
+            FROM websocket_sessions
+            GROUP BY session_id
+        ) AS keep
+        WHERE m.session_id = s.id AND s.session_id = keep.session_id AND s.id <> keep.id
+    """)
+    op.execute("""
+        UPDATE websocket_sessions AS s
+        SET updated_at = dups.updated_at
+        FROM (
+            SELECT MIN(id) AS id, MAX(updated_at) AS updated_at
+            FROM websocket_sessions
+            GROUP BY session_id
+            HAVING COUNT(*) > 1
+        ) AS dups
+        WHERE s.id = dups.id
+    """)
+    op.execute("""
+        DELETE FROM websocket_sessions
+        WHERE id NOT IN (SELECT MIN(id) FROM websocket_sessions GROUP BY session_id)
+    """)
+
+    op.create_index(op.f('ix_websocket_sessions_session_id'), 'websocket_sessions', ['session_id'], unique=True)
+    op.add_column('websocket_messages', sa.Column('seq', sa.Integer(), nullable=True))
+
+    # Number existing messages in insertion order and move each session's counter past them
+    op.execute("""
+        UPDATE websocket_messages AS m
+        SET seq = numbered.seq
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY id) AS seq
+            FROM websocket_messages
+        ) AS numbered
+        WHERE m.id = numbered.id
+    """)
+    op.execute("""
+        UPDATE websocket_sessions AS s
+        SET last_seq = counts.last_seq
+        FROM (
+            SELECT session_id, MAX(seq) AS last_seq
+            FROM websocket_messages
+            GROUP BY session_id
+        ) AS counts
+        WHERE s.id = counts.session_id
+    """)
+
+    op.alter_column('websocket_messages', 'seq', nullable=False)
+    op.create_unique_constraint('uq_websocket_messages_session_seq', 'websocket_messages', ['session_id', 'seq'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_websocket_messages_session_seq', 'websocket_messages', type_='unique')
+    op.drop_column('websocket_messages', 'seq')
+    op.drop_index(op.f('ix_websocket_sessions_session_id'), table_name='websocket_sessions')
+    op.drop_column('websocket_sessions', 'last_seq')
@@ -0,0 +1,45 @@
+"""Add compressed websocket team state snapshots and deltas
+
+Revision ID: 8a41d6c2f0b7
+Revises: 3f2b8c1d9e4a
+Create Date: 2025-08-03 16:45:09.118734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a41d6c2f0b7'
+down_revision: Union[str, Sequence[str], None] = '3f2b8c1d9e4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('websocket_team_states',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('session_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('is_snapshot', sa.Boolean(), nullable=False),
+    sa.Column('payload', sa.LargeBinary(), nullable=False),
+    sa.Column('raw_size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['websocket_sessions.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('session_id', 'version', name='uq_websocket_team_states_session_version')
+    )
+    op.create_index(op.f('ix_websocket_team_states_id'), 'websocket_team_states', ['id'], unique=False)
+    # Existing states stay readable from the legacy column until the session is saved again
+    op.alter_column('websocket_sessions', 'llm_state', existing_type=sa.JSON(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("UPDATE websocket_sessions SET llm_state = 'null'::json WHERE llm_state IS NULL")
+    op.alter_column('websocket_sessions', 'llm_state', existing_type=sa.JSON(), nullable=False)
+    op.drop_index(op.f('ix_websocket_team_states_id'), table_name='websocket_team_states')
+    op.drop_table('websocket_team_states')
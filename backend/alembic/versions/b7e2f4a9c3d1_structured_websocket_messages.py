@@ -0,0 +1,105 @@
+"""Store websocket messages as structured columns plus a JSONB payload
+
+Revision ID: b7e2f4a9c3d1
+Revises: 8a41d6c2f0b7
+Create Date: 2025-08-05 09:27:44.530912
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2f4a9c3d1'
+down_revision: Union[str, Sequence[str], None] = '8a41d6c2f0b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+websocket_messages = sa.table(
+    'websocket_messages',
+    sa.column('id', sa.Integer()),
+    sa.column('message', sa.Text()),
+    sa.column('source', sa.String()),
+    sa.column('type', sa.String()),
+    sa.column('prompt_tokens', sa.Integer()),
+    sa.column('completion_tokens', sa.Integer()),
+    sa.column('payload', postgresql.JSONB()),
+)
+
+
+def _parse_message(message: str) -> dict:
+    try:
+        payload = json.loads(message)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        # Plain-text messages saved before history was stored as JSON
+        payload = {"content": message}
+    models_usage = payload.get("models_usage") or {}
+    return {
+        "source": payload.get("source"),
+        "type": payload.get("type"),
+        "prompt_tokens": models_usage.get("prompt_tokens"),
+        "completion_tokens": models_usage.get("completion_tokens"),
+        "payload": payload,
+    }
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('websocket_messages', sa.Column('source', sa.String(length=255), nullable=True))
+    op.add_column('websocket_messages', sa.Column('type', sa.String(length=100), nullable=True))
+    op.add_column('websocket_messages', sa.Column('prompt_tokens', sa.Integer(), nullable=True))
+    op.add_column('websocket_messages', sa.Column('completion_tokens', sa.Integer(), nullable=True))
+    op.add_column('websocket_messages', sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+    # Parse the stringified messages in batches; not every legacy row is valid JSON
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(websocket_messages.c.id, websocket_messages.c.message)
+            .where(websocket_messages.c.id > last_id)
+            .order_by(websocket_messages.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            websocket_messages.update()
+            .where(websocket_messages.c.id == sa.bindparam('row_id'))
+            .values(
+                source=sa.bindparam('source'),
+                type=sa.bindparam('type'),
+                prompt_tokens=sa.bindparam('prompt_tokens'),
+                completion_tokens=sa.bindparam('completion_tokens'),
+                payload=sa.bindparam('payload', type_=postgresql.JSONB()),
+            ),
+            [{"row_id": row.id, **_parse_message(row.message)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+    op.alter_column('websocket_messages', 'payload', nullable=False)
+    op.drop_column('websocket_messages', 'message')
+    op.create_index('ix_websocket_messages_session_type', 'websocket_messages', ['session_id', 'type'], unique=False)
+    op.create_index('ix_websocket_messages_session_source', 'websocket_messages', ['session_id', 'source'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_websocket_messages_session_source', table_name='websocket_messages')
+    op.drop_index('ix_websocket_messages_session_type', table_name='websocket_messages')
+    op.add_column('websocket_messages', sa.Column('message', sa.Text(), nullable=True))
+    op.execute("UPDATE websocket_messages SET message = payload::text")
+    op.alter_column('websocket_messages', 'message', nullable=False)
+    op.drop_column('websocket_messages', 'payload')
+    op.drop_column('websocket_messages', 'completion_tokens')
+    op.drop_column('websocket_messages', 'prompt_tokens')
+    op.drop_column('websocket_messages', 'type')
+    op.drop_column('websocket_messages', 'source')
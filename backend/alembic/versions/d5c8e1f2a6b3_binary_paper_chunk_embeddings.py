@@ -0,0 +1,140 @@
+"""Store paper and conversation chunk embeddings as binary float32 vectors
+
+Revision ID: d5c8e1f2a6b3
+Revises: b7e2f4a9c3d1
+Create Date: 2025-08-07 14:02:51.774310
+
+"""
+import json
+import os
+from typing import Sequence, Union
+
+import numpy as np
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5c8e1f2a6b3'
+down_revision: Union[str, Sequence[str], None] = 'b7e2f4a9c3d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+EMBEDDING_DIM = 1536
+
+# Must match lib/sqlalchemy/vector.py at runtime
+use_pgvector = os.getenv("USE_PGVECTOR", "false").lower() == "true"
+
+paper_chunks = sa.table(
+    'paper_chunks',
+    sa.column('id', sa.Integer()),
+    sa.column('embedding_vector', sa.Text()),
+    sa.column('embedding_vector_f32', sa.LargeBinary()),
+)
+
+# Created by misc/database with create_all, so it only exists where that was used
+conversation_chunks = sa.table(
+    'conversation_chunks',
+    sa.column('id', sa.Uuid()),
+    sa.column('embedding_vector', postgresql.JSONB()),
+    sa.column('embedding_vector_f32', sa.LargeBinary()),
+)
+
+# (table, HNSW index name, column type before this revision)
+CHUNK_TABLES = (
+    (paper_chunks, 'ix_paper_chunks_embedding_vector', 'text'),
+    (conversation_chunks, 'ix_conversation_chunks_embedding_hnsw', 'jsonb'),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if use_pgvector:
+        op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    for table, index_name, _ in CHUNK_TABLES:
+        if _stores_json_embeddings(bind, table):
+            _upgrade_table(bind, table, index_name)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    for table, index_name, json_type in CHUNK_TABLES:
+        if sa.inspect(bind).has_table(table.name):
+            _downgrade_table(bind, table, index_name, json_type)
+
+
+def _stores_json_embeddings(bind, table: sa.TableClause) -> bool:
+    """Whether the table exists and still keeps its embeddings as JSON; create_all of the current models already makes them binary"""
+    inspector = sa.inspect(bind)
+    if not inspector.has_table(table.name):
+        return False
+    column = next(column for column in inspector.get_columns(table.name) if column['name'] == 'embedding_vector')
+    return isinstance(column['type'], (sa.JSON, sa.Text))
+
+
+def _upgrade_table(bind, table: sa.TableClause, index_name: str) -> None:
+    """Convert a table's JSON embeddings, clearing those that are not EMBEDDING_DIM long.
+
+    Such vectors (the seed script used to write 5-dimensional ones) cannot be
+    compared with real embeddings and would fail the cast to vector(EMBEDDING_DIM).
+    """
+    if use_pgvector:
+        op.execute(
+            f"UPDATE {table.name} SET embedding_vector = NULL "
+            f"WHERE json_array_length(embedding_vector::json) <> {EMBEDDING_DIM}"
+        )
+        # The JSON array text is already a valid vector literal
+        op.execute(
+            f"ALTER TABLE {table.name} ALTER COLUMN embedding_vector "
+            f"TYPE vector({EMBEDDING_DIM}) USING embedding_vector::text::vector"
+        )
+        op.execute(f"CREATE INDEX {index_name} ON {table.name} USING hnsw (embedding_vector vector_cosine_ops)")
+        return
+
+    op.add_column(table.name, sa.Column('embedding_vector_f32', sa.LargeBinary(), nullable=True))
+    last_id = None
+    while True:
+        query = sa.select(table.c.id, sa.cast(table.c.embedding_vector, sa.Text()).label('embedding_vector'))
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = bind.execute(query.order_by(table.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+        converted = []
+        for row in rows:
+            vector = np.asarray(json.loads(row.embedding_vector), dtype="<f4") if row.embedding_vector else None
+            if vector is not None and vector.shape == (EMBEDDING_DIM,):
+                converted.append({"row_id": row.id, "embedding_vector_f32": vector.tobytes()})
+        if converted:
+            bind.execute(
+                table.update()
+                .where(table.c.id == sa.bindparam('row_id'))
+                .values(embedding_vector_f32=sa.bindparam('embedding_vector_f32')),
+                converted
+            )
+        last_id = rows[-1].id
+    op.drop_column(table.name, 'embedding_vector')
+    op.alter_column(table.name, 'embedding_vector_f32', new_column_name='embedding_vector')
+
+
+def _downgrade_table(bind, table: sa.TableClause, index_name: str, json_type: str) -> None:
+    if use_pgvector:
+        op.execute(f"DROP INDEX IF EXISTS {index_name}")
+        op.execute(f"ALTER TABLE {table.name} ALTER COLUMN embedding_vector TYPE {json_type} USING embedding_vector::text::{json_type}")
+        return
+
+    op.alter_column(table.name, 'embedding_vector', new_column_name='embedding_vector_f32')
+    op.add_column(table.name, sa.Column('embedding_vector', postgresql.JSONB() if json_type == 'jsonb' else sa.Text(), nullable=True))
+    rows = bind.execute(sa.select(table.c.id, table.c.embedding_vector_f32).where(table.c.embedding_vector_f32.is_not(None))).all()
+    for row in rows:
+        vector = np.frombuffer(row.embedding_vector_f32, dtype="<f4").tolist()
+        bind.execute(
+            table.update().where(table.c.id == row.id).values(
+                embedding_vector=vector if json_type == 'jsonb' else json.dumps(vector)
+            )
+        )
+    op.drop_column(table.name, 'embedding_vector_f32')
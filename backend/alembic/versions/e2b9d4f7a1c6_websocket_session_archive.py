@@ -0,0 +1,50 @@
+"""Track websocket session activity and archive state
+
+Revision ID: e2b9d4f7a1c6
+Revises: d5c8e1f2a6b3
+Create Date: 2025-08-09 11:18:36.402957
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b9d4f7a1c6'
+down_revision: Union[str, Sequence[str], None] = 'd5c8e1f2a6b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('websocket_sessions', sa.Column('last_activity_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True))
+    op.add_column('websocket_sessions', sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True))
+
+    # Last activity is the latest message, or the creation time for sessions without messages
+    op.execute("""
+        UPDATE websocket_sessions AS s
+        SET last_activity_at = COALESCE(latest.created_at, s.created_at)
+        FROM (
+            SELECT sessions.id, MAX(m.created_at) AS created_at
+            FROM websocket_sessions AS sessions
+            LEFT JOIN websocket_messages AS m ON m.session_id = sessions.id
+            GROUP BY sessions.id
+        ) AS latest
+        WHERE s.id = latest.id
+    """)
+
+    op.create_index(
+        'ix_websocket_sessions_hot_last_activity', 'websocket_sessions', ['last_activity_at'],
+        unique=False, postgresql_where=sa.text('archived_at IS NULL')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Archived sessions keep their messages in the archive files; restore them before downgrading
+    op.drop_index('ix_websocket_sessions_hot_last_activity', table_name='websocket_sessions', postgresql_where=sa.text('archived_at IS NULL'))
+    op.drop_column('websocket_sessions', 'archived_at')
+    op.drop_column('websocket_sessions', 'last_activity_at')
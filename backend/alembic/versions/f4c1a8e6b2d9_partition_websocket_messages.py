@@ -0,0 +1,112 @@
+"""Partition websocket messages by month on created_at
+
+Revision ID: f4c1a8e6b2d9
+Revises: e2b9d4f7a1c6
+Create Date: 2025-08-11 10:05:12.660418
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c1a8e6b2d9'
+down_revision: Union[str, Sequence[str], None] = 'e2b9d4f7a1c6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Monthly partitions created past the current month; must match lib/sqlalchemy/partitions.py
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, session_id, seq, source, type, prompt_tokens, completion_tokens, payload, created_at"
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_indexes() -> None:
+    op.create_index('ix_websocket_messages_id', 'websocket_messages', ['id'], unique=False)
+    op.create_index('ix_websocket_messages_session_type', 'websocket_messages', ['session_id', 'type'], unique=False)
+    op.create_index('ix_websocket_messages_session_source', 'websocket_messages', ['session_id', 'source'], unique=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    op.execute("""
+        CREATE TABLE websocket_messages_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('websocket_messages_id_seq'),
+            session_id INTEGER NOT NULL REFERENCES websocket_sessions (id),
+            seq INTEGER NOT NULL,
+            source VARCHAR(255),
+            type VARCHAR(100),
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            payload JSONB NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+
+    # One partition per month from the oldest message until a few months ahead
+    oldest = bind.execute(sa.text("SELECT MIN(created_at) FROM websocket_messages")).scalar()
+    now = datetime.now(timezone.utc)
+    month = date((oldest or now).year, (oldest or now).month, 1)
+    last_month = _add_months(date(now.year, now.month, 1), MONTHS_AHEAD)
+    while month <= last_month:
+        op.execute(
+            f"CREATE TABLE websocket_messages_y{month.year:04d}m{month.month:02d} PARTITION OF websocket_messages_partitioned "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+    op.execute("CREATE TABLE websocket_messages_default PARTITION OF websocket_messages_partitioned DEFAULT")
+
+    op.execute(f"""
+        INSERT INTO websocket_messages_partitioned ({COLUMNS})
+        SELECT id, session_id, seq, source, type, prompt_tokens, completion_tokens, payload, COALESCE(created_at, now())
+        FROM websocket_messages
+    """)
+
+    # Keep the id sequence when the old table goes away
+    op.execute("ALTER SEQUENCE websocket_messages_id_seq OWNED BY NONE")
+    op.drop_table('websocket_messages')
+    op.execute("ALTER TABLE websocket_messages_partitioned RENAME TO websocket_messages")
+    op.execute("ALTER TABLE websocket_messages RENAME CONSTRAINT websocket_messages_partitioned_pkey TO websocket_messages_pkey")
+    op.execute("ALTER SEQUENCE websocket_messages_id_seq OWNED BY websocket_messages.id")
+
+    # (session_id, seq) cannot be unique without the partition key; the session's counter keeps it unique
+    op.create_index('ix_websocket_messages_session_seq', 'websocket_messages', ['session_id', 'seq'], unique=False)
+    _create_indexes()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("""
+        CREATE TABLE websocket_messages_unpartitioned (
+            id INTEGER NOT NULL DEFAULT nextval('websocket_messages_id_seq') PRIMARY KEY,
+            session_id INTEGER NOT NULL REFERENCES websocket_sessions (id),
+            seq INTEGER NOT NULL,
+            source VARCHAR(255),
+            type VARCHAR(100),
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            payload JSONB NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+    """)
+    op.execute(f"INSERT INTO websocket_messages_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM websocket_messages")
+
+    op.execute("ALTER SEQUENCE websocket_messages_id_seq OWNED BY NONE")
+    # Dropping the parent drops every attached partition; detached ones are left alone
+    op.drop_table('websocket_messages')
+    op.execute("ALTER TABLE websocket_messages_unpartitioned RENAME TO websocket_messages")
+    op.execute("ALTER TABLE websocket_messages RENAME CONSTRAINT websocket_messages_unpartitioned_pkey TO websocket_messages_pkey")
+    op.execute("ALTER SEQUENCE websocket_messages_id_seq OWNED BY websocket_messages.id")
+
+    op.create_unique_constraint('uq_websocket_messages_session_seq', 'websocket_messages', ['session_id', 'seq'])
+    _create_indexes()
@@ -0,0 +1,347 @@
+"""Benchmarks for the storage layer.
+
+Runs each StorageRepositoryImpl and ConversationService operation across
+dataset sizes and concurrency levels against a disposable database filled
+by lib/sqlalchemy/synthetic.py. Records latency
+percentiles, SQL statements per operation (counted with SQLAlchemy engine
+events) and bytes written, and writes the results as JSON so runs from
+different commits can be compared.
+
+Usage:
+    python -m benchmarks.storage --sizes 100,1000 --concurrency 1,8 --output results.json
+    python -m benchmarks.storage --baseline results.json   # print the change against an earlier run
+
+Without --database-url each dataset size gets a fresh SQLite file, opened
+with the embedded WAL backend from lib/sqlalchemy/sqlite.py. A
+PostgreSQL URL must point at a throwaway database: its tables are dropped
+and recreated for every size.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import numpy as np
+from sqlalchemy import Engine, event, select
+from adapter.storage import StorageRepositoryImpl
+from lib.sqlalchemy.db import Base
+from lib.sqlalchemy.sqlalchemy_models import WebsocketSession
+from lib.sqlalchemy.synthetic import SyntheticConfig, create_engine_for, generate
+from misc.database.models import (
+    Base as ConversationBase, DatabaseManager,
+    AgentStateCreate, ConversationChunkCreate, MessageCreate, SessionCreate, TeamStateCreate,
+)
+from misc.database.service import ConversationService
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "COPY")
+
+@dataclass
+class BenchmarkResult:
+    operation: str
+    dataset_size: int
+    concurrency: int
+    iterations: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    max_ms: float
+    ops_per_second: float
+    queries_per_op: float
+    bytes_written_per_op: float
+    errors: int = 0
+
+class QueryCounter:
+    """Counts statements and bound parameter bytes of writes through engine events"""
+
+    def __init__(self, engines: List[Optional[Engine]]):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.bytes_written = 0
+        for engine in engines:
+            if engine is not None:
+                event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        size = 0
+        if statement.lstrip().upper().startswith(WRITE_PREFIXES):
+            rows = parameters if executemany else [parameters]
+            for row in rows or []:
+                # Batched INSERT..VALUES statements pass a flat parameter tuple
+                values = row.values() if isinstance(row, dict) else row if isinstance(row, (list, tuple)) else (row,)
+                size += sum(len(value) if isinstance(value, (bytes, bytearray, memoryview, str)) else 8 for value in values)
+        with self._lock:
+            self.queries += 1
+            self.bytes_written += size
+
+    def snapshot(self) -> tuple[int, int]:
+        with self._lock:
+            return self.queries, self.bytes_written
+
+def _sample_message(index: int) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "source": "summarize_agent",
+        "models_usage": {"prompt_tokens": 1200, "completion_tokens": 200},
+        "metadata": {},
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "content": f"Benchmark message {index} " + "lorem ipsum " * 50,
+        "type": "TextMessage",
+    }
+
+def _sample_team_state() -> Dict[str, Any]:
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "team_state.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"type": "TeamState", "version": "1.0.0", "agent_states": {
+        "RoundRobinGroupChatManager": {"message_thread": [], "current_turn": 0, "next_speaker_index": 0}
+    }}
+
+def _growing_state(base: Dict[str, Any], turn: int) -> Dict[str, Any]:
+    """A team state that gained one message since the previous turn, as in a live chat"""
+    state = copy.deepcopy(base)
+    manager = state["agent_states"].setdefault("RoundRobinGroupChatManager", {"message_thread": []})
+    manager.setdefault("message_thread", []).extend(_sample_message(i) for i in range(turn))
+    manager["current_turn"] = turn
+    return state
+
+def _storage_operations(session_ids: List[str], team_state: Dict[str, Any]) -> Dict[str, Callable[[StorageRepositoryImpl, int], Awaitable[Any]]]:
+    def pick() -> str:
+        return random.choice(session_ids)
+
+    async def save_llm_state(repository: StorageRepositoryImpl, i: int):
+        await repository.save_llm_state(pick(), _growing_state(team_state, i % 20))
+
+    return {
+        "load_history": lambda repository, i: repository.load_history(pick()),
+        "load_history_page": lambda repository, i: repository.load_history(pick(), since=0, limit=50),
+        "get_session_info": lambda repository, i: repository.get_session_info(pick()),
+        "list_sessions": lambda repository, i: repository.list_sessions(),
+        "save_message": lambda repository, i: repository.save_message(pick(), _sample_message(i)),
+        "append_messages": lambda repository, i: repository.append_messages(pick(), [_sample_message(j) for j in range(20)]),
+        "save_llm_state": save_llm_state,
+        "load_llm_state": lambda repository, i: repository.load_llm_state(pick()),
+    }
+
+def _run_worker(session_factory, operation, iterations: int, offset: int) -> tuple[List[float], int]:
+    """Run one client's share of the iterations on its own repository and event loop"""
+    repository = StorageRepositoryImpl(session_factory)
+    latencies = []
+    errors = 0
+
+    async def run():
+        nonlocal errors
+        for i in range(iterations):
+            started = time.perf_counter()
+            try:
+                await operation(repository, offset + i)
+            except Exception:
+                errors += 1
+                repository.session.rollback()
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        asyncio.run(run())
+    finally:
+        repository.session.close()
+    return latencies, errors
+
+def _measure(name: str, counter: QueryCounter, dataset_size: int, concurrency: int, iterations: int,
+             run_client: Callable[[int, int], tuple[List[float], int]]) -> BenchmarkResult:
+    per_client = max(1, iterations // concurrency)
+    queries_before, bytes_before = counter.snapshot()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(lambda client: run_client(per_client, client * per_client), range(concurrency)))
+    elapsed = time.perf_counter() - started
+    queries_after, bytes_after = counter.snapshot()
+
+    latencies = np.array([latency for client_latencies, _ in outcomes for latency in client_latencies]) * 1000
+    total = len(latencies)
+    return BenchmarkResult(
+        operation=name,
+        dataset_size=dataset_size,
+        concurrency=concurrency,
+        iterations=total,
+        p50_ms=float(np.percentile(latencies, 50)),
+        p95_ms=float(np.percentile(latencies, 95)),
+        p99_ms=float(np.percentile(latencies, 99)),
+        mean_ms=float(latencies.mean()),
+        max_ms=float(latencies.max()),
+        ops_per_second=total / elapsed,
+        queries_per_op=(queries_after - queries_before) / total,
+        bytes_written_per_op=(bytes_after - bytes_before) / total,
+        errors=sum(errors for _, errors in outcomes),
+    )
+
+def _conversation_service_operations(session_factory) -> Dict[str, Callable[[int, int], tuple[List[float], int]]]:
+    """ConversationService benchmarks"""
+    with session_factory() as db:
+        service = ConversationService(db)
+        conversation = service.create_session(SessionCreate(team_config={}))
+        agents = [service.create_agent(conversation.id, {"name": f"agent_{i}", "agent_type": "AssistantAgent"}) for i in range(4)]
+        conversation_id, agent_ids = conversation.id, [agent.id for agent in agents]
+
+    def client(call: Callable[[ConversationService, int], Any]):
+        def run(iterations: int, offset: int) -> tuple[List[float], int]:
+            latencies, errors = [], 0
+            with session_factory() as db:
+                service = ConversationService(db)
+                for i in range(iterations):
+                    started = time.perf_counter()
+                    try:
+                        call(service, offset + i)
+                    except Exception:
+                        errors += 1
+                        db.rollback()
+                    latencies.append(time.perf_counter() - started)
+            return latencies, errors
+        return run
+
+    def messages(i: int) -> List[MessageCreate]:
+        return [
+            MessageCreate(
+                source="summarize_agent", message_type="TextMessage", content=f"message {i} {j} privacy protection",
+                chunks=[ConversationChunkCreate(chunk_text=f"privacy protection chunk {i} {j}", chunk_type="message_content")]
+            )
+            for j in range(20)
+        ]
+
+    def agent_states() -> List[AgentStateCreate]:
+        return [AgentStateCreate(agent_id=agent_id, state_type="AssistantAgentState", llm_context={"messages": []}) for agent_id in agent_ids]
+
+    return {
+        "conversation.add_messages_bulk": client(lambda service, i: service.add_messages_bulk(conversation_id, messages(i))),
+        "conversation.search_conversation_chunks": client(lambda service, i: service.search_conversation_chunks(conversation_id, "privacy protection")),
+        "conversation.save_session_state": client(lambda service, i: service.save_session_state(
+            conversation_id, TeamStateCreate(team_type="RoundRobinGroupChat", current_turn=i), agent_states()
+        )),
+    }
+
+def _prepare_database(database_url: Optional[str], size: int, messages_per_session: float, seed: int) -> tuple[DatabaseManager, Optional[str]]:
+    """Load a fresh dataset and return the database as the application would open it"""
+    temporary_path = None
+    if database_url is None:
+        temporary_path = tempfile.mktemp(prefix=f"storage-bench-{size}-", suffix=".db")
+        database_url = f"sqlite:///{temporary_path}"
+    loader = create_engine_for(database_url)
+    ConversationBase.metadata.drop_all(bind=loader)
+    Base.metadata.drop_all(bind=loader)
+    Base.metadata.create_all(bind=loader)
+    generate(loader, SyntheticConfig(sessions=size, messages_per_session=messages_per_session, users=0, papers=0, seed=seed))
+    loader.dispose()
+
+    # SQLite files are benchmarked on the embedded WAL backend (single writer, reader pool)
+    manager = DatabaseManager(database_url)
+    manager.create_tables()
+    return manager, temporary_path
+
+def run_benchmarks(args) -> Dict[str, Any]:
+    random.seed(args.seed)
+    team_state = _sample_team_state()
+    results: List[BenchmarkResult] = []
+
+    for size in args.sizes:
+        print(f"Preparing dataset with {size} sessions", flush=True)
+        manager, temporary_path = _prepare_database(args.database_url, size, args.messages_per_session, args.seed)
+        dialect = manager.engine.dialect.name
+        try:
+            session_factory = manager.SessionLocal
+            counter = QueryCounter([manager.engine, manager.reader_engine])
+            with session_factory() as db:
+                session_ids = list(db.execute(select(WebsocketSession.session_id)).scalars())
+
+            clients: Dict[str, Callable[[int, int], tuple[List[float], int]]] = {
+                name: (lambda operation: lambda iterations, offset: _run_worker(session_factory, operation, iterations, offset))(operation)
+                for name, operation in _storage_operations(session_ids, team_state).items()
+            }
+            clients.update(_conversation_service_operations(session_factory))
+
+            for name, run_client in clients.items():
+                if args.operations and name not in args.operations:
+                    continue
+                for concurrency in args.concurrency:
+                    # list_sessions reads every session, so it gets fewer iterations at scale
+                    iterations = max(concurrency, args.iterations // 10) if name == "list_sessions" else args.iterations
+                    result = _measure(name, counter, size, concurrency, iterations, run_client)
+                    results.append(result)
+                    print(f"{name:42} size={size:<8} c={concurrency:<3} p50={result.p50_ms:8.2f}ms "
+                          f"p99={result.p99_ms:8.2f}ms q/op={result.queries_per_op:5.1f} "
+                          f"B/op={result.bytes_written_per_op:9.0f} errors={result.errors}", flush=True)
+        finally:
+            manager.close()
+            if temporary_path is not None:
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(temporary_path + suffix):
+                        os.remove(temporary_path + suffix)
+
+    return {
+        "commit": _current_commit(),
+        "dialect": dialect,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "parameters": {
+            "sizes": args.sizes,
+            "concurrency": args.concurrency,
+            "iterations": args.iterations,
+            "messages_per_session": args.messages_per_session,
+            "seed": args.seed,
+        },
+        "results": [asdict(result) for result in results],
+    }
+
+def _current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_comparison(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print the p50 and p99 change of every result that also exists in the baseline"""
+    key = lambda result: (result["operation"], result["dataset_size"], result["concurrency"])
+    previous = {key(result): result for result in baseline["results"]}
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        p50_change = (result["p50_ms"] / before["p50_ms"] - 1) * 100 if before["p50_ms"] else 0.0
+        p99_change = (result["p99_ms"] / before["p99_ms"] - 1) * 100 if before["p99_ms"] else 0.0
+        print(f"{result['operation']:42} size={result['dataset_size']:<8} c={result['concurrency']:<3} "
+              f"p50 {p50_change:+6.1f}%  p99 {p99_change:+6.1f}%  "
+              f"q/op {before['queries_per_op']:.1f} -> {result['queries_per_op']:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the storage layer")
+    parser.add_argument("--database-url", default=None, help="Disposable database; tables are dropped (default: a temporary SQLite file per size)")
+    parser.add_argument("--sizes", type=lambda value: [int(v) for v in value.split(",")], default=[100, 1000], help="Comma-separated session counts")
+    parser.add_argument("--concurrency", type=lambda value: [int(v) for v in value.split(",")], default=[1, 8], help="Comma-separated client counts")
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per operation and concurrency level")
+    parser.add_argument("--messages-per-session", type=float, default=40.0)
+    parser.add_argument("--operations", type=lambda value: value.split(","), default=None, help="Only run these operations")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional, Union
+import orjson
+from autogen_core import CacheStore
+from autogen_core.models import CreateResult
+from lib.metrics import registry
+
+CachedCompletion = Union[CreateResult, List[Union[str, CreateResult]]]
+
+cache_hits = registry.counter("completion_cache_hits_total", "Model calls answered from the completion cache")
+cache_misses = registry.counter("completion_cache_misses_total", "Completion cache lookups that called the model")
+cache_evictions = registry.counter("completion_cache_evictions_total", "Completions evicted to keep the cache within its size")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_completions_accessed_at ON completions (accessed_at);
+"""
+
+# A hit makes no model call, so it reports no usage and is not charged to the rate limits
+NO_USAGE = {"prompt_tokens": 0, "completion_tokens": 0}
+
+def _without_usage(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {**value, "usage": dict(NO_USAGE)}
+    return [_without_usage(item) if isinstance(item, dict) else item for item in value]
+
+def _encode(value: CachedCompletion) -> bytes:
+    if isinstance(value, CreateResult):
+        return orjson.dumps(value.model_dump(mode="json"))
+    return orjson.dumps([item if isinstance(item, str) else item.model_dump(mode="json") for item in value])
+
+class SQLiteCacheStore(CacheStore[CachedCompletion]):
+    """Completion store for ChatCompletionCache in a local SQLite file.
+
+    Values are kept as JSON and handed back as dicts, which
+    ChatCompletionCache turns back into CreateResults; a hit spent no
+    tokens, so it is handed back with zero usage. Once the stored values
+    exceed max_bytes, the least recently read ones are evicted down to 90%
+    of it. One connection is shared by every team, so calls are serialized
+    by a lock.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def namespaced(self, namespace: str) -> "NamespacedCacheStore":
+        return NamespacedCacheStore(self, namespace)
+
+    def get(self, key: str, default: Optional[CachedCompletion] = None) -> Optional[Any]:
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                cache_misses.inc()
+                return default
+            self._connection.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        cache_hits.inc()
+        return _without_usage(orjson.loads(row[0]))
+
+    def set(self, key: str, value: CachedCompletion) -> None:
+        data = _encode(value)
+        with self._lock:
+            previous = self._connection.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._size += len(data) - (previous[0] if previous else 0)
+            if self._size > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self, target: int):
+        # Walk the least recently read rows until enough bytes are freed
+        freed, keys = 0, []
+        for key, size in self._connection.execute("SELECT key, size FROM completions ORDER BY accessed_at"):
+            if self._size - freed <= target:
+                break
+            keys.append((key,))
+            freed += size
+        self._connection.executemany("DELETE FROM completions WHERE key = ?", keys)
+        self._size -= freed
+        cache_evictions.inc(len(keys))
+
+class NamespacedCacheStore(CacheStore[CachedCompletion]):
+    """View of a store with its keys prefixed, e.g. by the model config they were computed with.
+
+    ChatCompletionCache keys on the messages, tools and create arguments but
+    not on the model, so clients of different configs must not share keys.
+    """
+
+    def __init__(self, store: SQLiteCacheStore, namespace: str):
+        self.store = store
+        self.namespace = namespace
+
+    def get(self, key: str, default: Optional[CachedCompletion] = None) -> Optional[Any]:
+        return self.store.get(f"{self.namespace}:{key}", default)
+
+    def set(self, key: str, value: CachedCompletion) -> None:
+        self.store.set(f"{self.namespace}:{key}", value)
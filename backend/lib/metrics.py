@@ -0,0 +1,107 @@
+import bisect
+import threading
+
+# In-process metrics rendered in the Prometheus text format by routers/metrics.py.
+# Metrics are process-wide and unlabeled; each worker process reports its own.
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name} {self.value}"]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name} {self.value}"]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...]):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            samples.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        samples.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        samples.append(f"{self.name}_sum {total}")
+        samples.append(f"{self.name}_count {cumulative}")
+        return samples
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._register(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...]) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics.values() for line in metric.render()) + "\n"
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+registry = MetricsRegistry()
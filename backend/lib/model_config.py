@@ -1,10 +1,11 @@
+import os
 from typing import Any
 import aiofiles
 import yaml
 
-model_config_path = "model_config.yaml"
+model_config_path = os.getenv("MODEL_CONFIG_PATH", "model_config.yaml")
 
-async def load_model_config() -> Any:
-    async with aiofiles.open(model_config_path, "r") as file:
+async def load_model_config(path: str = model_config_path) -> Any:
+    async with aiofiles.open(path, "r") as file:
         model_config = yaml.safe_load(await file.read())
-        return model_config
\ No newline at end of file
+        return model_config
@@ -0,0 +1,181 @@
+import logging
+from typing import Any, List, Mapping
+from autogen_core.model_context import ChatCompletionContext, UnboundedChatCompletionContext
+from autogen_core.models import (
+    AssistantMessage,
+    ChatCompletionClient,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    SystemMessage,
+    UserMessage,
+)
+from lib.tokenizer import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+# Context policies selectable per agent in the model_context section of model_config.yaml
+POLICIES = ("unbounded", "tokens", "head_tail", "summary")
+
+MEMORY_SOURCE = "memory"
+
+# Appended to a message cut down to fit the context on its own
+TRUNCATION_MARKER = "\n[truncated]"
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for an assistant that will continue it. Keep the user's goals, "
+    "paper titles and ids, search results still relevant, decisions taken and open questions. Be concise."
+)
+
+def _is_function_call(message: LLMMessage) -> bool:
+    return isinstance(message, AssistantMessage) and isinstance(message.content, list)
+
+def _truncate(message: LLMMessage, token_limit: int, counter: TokenCounter) -> LLMMessage:
+    """The message with its text cut to about token_limit tokens; tool calls and images are kept whole"""
+
+    def cut(text: str, ratio: float) -> str:
+        return text[: int(len(text) * ratio)] + TRUNCATION_MARKER
+
+    candidate, ratio = message, 1.0
+    for _ in range(4):
+        tokens = counter.count(candidate)
+        if tokens <= token_limit:
+            break
+        ratio = max(0.0, ratio * token_limit / tokens * 0.9)
+        if isinstance(message.content, str):
+            candidate = message.model_copy(update={"content": cut(message.content, ratio)})
+        elif isinstance(message, FunctionExecutionResultMessage):
+            candidate = message.model_copy(update={"content": [
+                result.model_copy(update={"content": cut(result.content, ratio)}) for result in message.content
+            ]})
+        else:
+            break
+    return candidate
+
+def tail_within(messages: List[LLMMessage], token_limit: int, counter: TokenCounter) -> List[LLMMessage]:
+    """Newest messages whose tokens add up to at most token_limit.
+
+    The newest message is always kept, truncated if it doesn't fit on its
+    own, and a tool result keeps the call that asked for it even where the
+    call goes over the limit.
+    """
+    if not messages:
+        return []
+    total, start = 0, len(messages)
+    while start > 0:
+        total += counter.count(messages[start - 1])
+        if total > token_limit:
+            break
+        start -= 1
+    tail = messages[start:]
+    if not tail:
+        start = len(messages) - 1
+        tail = [_truncate(messages[-1], token_limit, counter)]
+    # Tool results are meaningless without the call that asked for them
+    while 0 < start and isinstance(tail[0], FunctionExecutionResultMessage):
+        start -= 1
+        tail = [messages[start], *tail]
+    # Unless the call was dropped before; a lone result is all that is left of it
+    while len(tail) > 1 and isinstance(tail[0], FunctionExecutionResultMessage):
+        tail = tail[1:]
+    return tail
+
+class TokenLimitedContext(ChatCompletionContext):
+    """The newest messages that fit in token_limit tokens.
+
+    Messages that no longer fit are dropped from the context too, so the
+    saved team state stops growing with the session.
+    """
+
+    def __init__(self, token_limit: int, counter: TokenCounter, initial_messages: List[LLMMessage] | None = None):
+        super().__init__(initial_messages)
+        self.token_limit = token_limit
+        self.counter = counter
+
+    async def get_messages(self) -> List[LLMMessage]:
+        self._messages = tail_within(self._messages, self.token_limit, self.counter)
+        return list(self._messages)
+
+class HeadTailContext(ChatCompletionContext):
+    """The first head_size messages, usually the task, plus the newest messages in the remaining tokens"""
+
+    def __init__(self, head_size: int, token_limit: int, counter: TokenCounter, initial_messages: List[LLMMessage] | None = None):
+        super().__init__(initial_messages)
+        self.head_size = head_size
+        self.token_limit = token_limit
+        self.counter = counter
+        self._placeholder = UserMessage(content="Earlier messages were skipped.", source="System")
+
+    async def get_messages(self) -> List[LLMMessage]:
+        head = self._messages[: self.head_size]
+        if head and _is_function_call(head[-1]):
+            # Its results would be cut off with the middle of the conversation
+            head = head[:-1]
+        rest = self._messages[len(head):]
+        budget = self.token_limit - self.counter.count_all(head)
+        if self.counter.count_all(rest) <= budget:
+            return list(self._messages)
+        tail = tail_within(rest, budget - self.counter.count(self._placeholder), self.counter)
+        self._messages = head + tail
+        return head + [self._placeholder] + tail
+
+class RollingSummaryContext(ChatCompletionContext):
+    """Recent messages verbatim, everything older folded into a running summary.
+
+    Once the context exceeds token_limit tokens, the messages beyond the
+    newest keep_tokens are summarized by the model, together with the
+    previous summary, into one memory message that replaces them. The
+    summary is part of the saved state, so each message is summarized once.
+    """
+
+    def __init__(
+        self,
+        model_client: ChatCompletionClient,
+        token_limit: int,
+        keep_tokens: int,
+        counter: TokenCounter,
+        initial_messages: List[LLMMessage] | None = None,
+    ):
+        super().__init__(initial_messages)
+        self.model_client = model_client
+        self.token_limit = token_limit
+        self.keep_tokens = keep_tokens
+        self.counter = counter
+
+    async def get_messages(self) -> List[LLMMessage]:
+        if self.counter.count_all(self._messages) <= self.token_limit:
+            return list(self._messages)
+        tail = tail_within(self._messages, self.keep_tokens, self.counter)
+        older = self._messages[: len(self._messages) - len(tail)]
+        if not older:
+            # Only the newest message is left, truncated to fit; there is nothing to summarize
+            self._messages = tail
+            return list(self._messages)
+        try:
+            memory = await self._summarize(older)
+            self._messages = [memory] + tail
+        except Exception as e:
+            logger.error(f"Failed to summarize the conversation, dropping older messages instead: {str(e)}")
+            self._messages = tail
+        return list(self._messages)
+
+    async def _summarize(self, messages: List[LLMMessage]) -> UserMessage:
+        # The summarizer's own prompt is bounded too; the previous summary always leads
+        memory = [message for message in messages[:1] if getattr(message, "source", None) == MEMORY_SOURCE]
+        recent = tail_within(messages[len(memory):], self.token_limit - self.counter.count_all(memory), self.counter)
+        transcript = "\n\n".join(f"{getattr(message, 'source', message.type)}: {message.content}" for message in memory + recent)
+        result = await self.model_client.create([SystemMessage(content=SUMMARY_PROMPT), UserMessage(content=transcript, source="user")])
+        return UserMessage(content=f"Summary of the earlier conversation:\n{result.content}", source=MEMORY_SOURCE)
+
+def build_model_context(settings: Mapping[str, Any], model_client: ChatCompletionClient, counter: TokenCounter) -> ChatCompletionContext:
+    """Model context for an agent from its model_context settings"""
+    policy = settings.get("policy", "tokens")
+    token_limit = int(settings.get("token_limit", 16000))
+    if policy == "unbounded":
+        return UnboundedChatCompletionContext()
+    if policy == "tokens":
+        return TokenLimitedContext(token_limit, counter)
+    if policy == "head_tail":
+        return HeadTailContext(int(settings.get("head_size", 2)), token_limit, counter)
+    if policy == "summary":
+        return RollingSummaryContext(model_client, token_limit, int(settings.get("keep_tokens", token_limit // 2)), counter)
+    raise ValueError(f"Unknown model context policy: {policy}")
@@ -0,0 +1,58 @@
+import hashlib
+import io
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Iterable, Iterator
+import zstandard
+from lib import state_codec
+
+# Archive of inactive websocket sessions: one zstd-compressed JSONL file per
+# session. The first line is a header (session columns and the latest team
+# state), every following line is one message row in sequence order.
+
+# Archived messages exist nowhere else, so by default they go to the persistent STORAGE_PATH volume
+ARCHIVE_DIR = os.getenv("SESSION_ARCHIVE_DIR", os.path.join(os.getenv("STORAGE_PATH", "data"), "archive"))
+
+_ZSTD_LEVEL = int(os.getenv("SESSION_ARCHIVE_ZSTD_LEVEL", "9"))
+
+def archive_path(session_id: str, root: str | None = None) -> str:
+    """Location of a session's archive; session ids are hashed so any string makes a safe file name"""
+    digest = hashlib.sha256(session_id.encode()).hexdigest()
+    return os.path.join(root or ARCHIVE_DIR, digest[:2], f"{digest}.jsonl.zst")
+
+def write_archive(path: str, header: dict[str, Any], rows: Iterable[dict[str, Any]]) -> int:
+    """Write an archive and return the number of rows.
+
+    The file is written under a temporary name, synced and renamed, so the
+    path either holds a complete archive or nothing.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    count = 0
+    with open(temporary_path, "wb") as f:
+        with zstandard.ZstdCompressor(level=_ZSTD_LEVEL).stream_writer(f, closefd=False) as writer:
+            writer.write(state_codec.dumps(header) + b"\n")
+            for row in rows:
+                writer.write(state_codec.dumps(row) + b"\n")
+                count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+    return count
+
+@contextmanager
+def open_archive(path: str) -> Iterator[tuple[dict[str, Any], Iterator[dict[str, Any]]]]:
+    """Yield the header and an iterator over the rows, decompressing as the rows are read"""
+    with open(path, "rb") as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+        lines = io.BufferedReader(reader, buffer_size=1 << 16)
+        yield state_codec.loads(lines.readline()), (state_codec.loads(line) for line in lines)
+
+def remove_archive(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def parse_datetime(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value is not None else None
@@ -3,9 +3,13 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 import os
 from dotenv import load_dotenv
+from lib.sqlalchemy.sqlite import create_sqlite_engines, sqlite_sessionmaker
 
 load_dotenv()
 
+# "postgresql" (default) or "sqlite" for an embedded database file on single-node deployments
+database_backend = os.getenv("DATABASE_BACKEND", "postgresql")
+
 database_driver = "postgresql"
 username = os.getenv("POSTGRES_USER")
 password = os.getenv("POSTGRES_PASSWORD")
@@ -22,6 +26,13 @@ sqlalchemy_url = URL.create(
     database=database,
 )
 
-engine = create_engine(sqlalchemy_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+if database_backend == "sqlite":
+    sqlite_path = os.getenv("SQLITE_PATH", "data/backend.db")
+    sqlalchemy_url = URL.create(drivername="sqlite", database=sqlite_path)
+    # engine is the single writer; reads are routed to reader_engine by the session
+    engine, reader_engine = create_sqlite_engines(sqlite_path, int(os.getenv("SQLITE_READER_POOL_SIZE", "8")))
+    SessionLocal = sqlite_sessionmaker(engine, reader_engine)
+else:
+    engine = create_engine(sqlalchemy_url)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base = declarative_base()
@@ -0,0 +1,46 @@
+from typing import Any, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from lib.sqlalchemy import vector
+from lib.sqlalchemy.sqlalchemy_models import PaperChunk
+
+def load_paper_chunk_embeddings(db: Session, paper_id: Optional[int] = None) -> Tuple[List[int], np.ndarray]:
+    """
+    Load chunk embeddings with a single query.
+
+    Args:
+        db: Database session
+        paper_id: Restrict to the chunks of one paper (default: all papers)
+
+    Returns:
+        Tuple of chunk ids and an (N, d) float32 matrix with one row per id
+    """
+    query = select(PaperChunk.id, PaperChunk.embedding_vector).where(PaperChunk.embedding_vector.is_not(None))
+    if paper_id is not None:
+        query = query.where(PaperChunk.paper_id == paper_id)
+    rows = db.execute(query.order_by(PaperChunk.id)).all()
+    return [row.id for row in rows], vector.stack_vectors([row.embedding_vector for row in rows])
+
+def search_paper_chunks(db: Session, query_vector: Any, k: int = 10,
+                        paper_id: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    Find the k chunks nearest to query_vector by cosine distance.
+
+    Runs in SQL when the column is a pgvector column, otherwise over the
+    embedding matrix in numpy.
+
+    Returns:
+        List of (chunk id, cosine distance), nearest first
+    """
+    if vector.use_pgvector and db.get_bind().dialect.name == "postgresql":
+        distance = vector.cosine_distance(PaperChunk.embedding_vector, query_vector, PaperChunk.embedding_vector.type.dim)
+        query = select(PaperChunk.id, distance.label("distance")).where(PaperChunk.embedding_vector.is_not(None))
+        if paper_id is not None:
+            query = query.where(PaperChunk.paper_id == paper_id)
+        rows = db.execute(query.order_by(distance).limit(k)).all()
+        return [(row.id, float(row.distance)) for row in rows]
+
+    ids, matrix = load_paper_chunk_embeddings(db, paper_id)
+    indexes, distances = vector.top_k_cosine(matrix, query_vector, k)
+    return [(ids[i], float(d)) for i, d in zip(indexes, distances)]
@@ -0,0 +1,107 @@
+"""Monthly range partitions for PostgreSQL tables.
+
+Partitioned tables (see WebsocketMessage) are split by month on created_at
+into partitions named <table>_yYYYYmMM, plus a <table>_default partition
+that catches rows outside every monthly range, e.g. archived sessions
+restored into months whose partition was already dropped.
+
+maintain() keeps partitions ready for the coming months and removes old
+ones. A past partition is dropped as soon as it is empty, which is the
+usual end state once the session archive has moved every session in it
+out, and partitions older than the retention period are detached so they
+can be dumped or dropped without touching the live table.
+"""
+import logging
+import re
+from datetime import date, datetime, timezone
+from sqlalchemy import Connection, Engine, Table
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_SUFFIX = re.compile(r"_y(\d{4})m(\d{2})$")
+
+def month_start(value: date | datetime) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table_name: str, month: date) -> str:
+    return f"{table_name}_y{month.year:04d}m{month.month:02d}"
+
+def create_partitions(connection: Connection, table_name: str, first_month: date, last_month: date) -> list[str]:
+    """Create the monthly partitions from first_month to last_month that do not exist yet"""
+    existing = {name for name, _ in list_partitions(connection, table_name)}
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        name = partition_name(table_name, month)
+        if name not in existing:
+            connection.exec_driver_sql(
+                f"CREATE TABLE {name} PARTITION OF {table_name} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            )
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+def create_default_partition(connection: Connection, table_name: str):
+    connection.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {table_name}_default PARTITION OF {table_name} DEFAULT")
+
+def list_partitions(connection: Connection, table_name: str) -> list[tuple[str, date]]:
+    """Monthly partitions currently attached to table_name, oldest first"""
+    rows = connection.exec_driver_sql(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = %(table_name)s",
+        {"table_name": table_name},
+    ).scalars()
+    partitions = []
+    for name in rows:
+        match = _PARTITION_SUFFIX.search(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def maintain(engine: Engine, table_name: str, months_ahead: int = 3, retention_months: int = 0) -> dict[str, list[str]]:
+    """Create upcoming partitions, drop empty past ones and detach expired ones.
+
+    retention_months <= 0 keeps every non-empty partition attached. Each
+    partition is handled in its own transaction so a busy table is only
+    locked briefly.
+    """
+    current_month = month_start(datetime.now(timezone.utc))
+    result: dict[str, list[str]] = {"created": [], "dropped": [], "detached": []}
+
+    with engine.begin() as connection:
+        create_default_partition(connection, table_name)
+        result["created"] = create_partitions(connection, table_name, current_month, add_months(current_month, months_ahead))
+
+    with engine.connect() as connection:
+        past = [(name, month) for name, month in list_partitions(connection, table_name) if month < current_month]
+    retention_start = add_months(current_month, -retention_months) if retention_months > 0 else None
+
+    for name, month in past:
+        try:
+            with engine.begin() as connection:
+                # Lock first so no insert can land between the emptiness check and the drop
+                connection.exec_driver_sql(f"LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE")
+                if connection.exec_driver_sql(f"SELECT 1 FROM {name} LIMIT 1").first() is None:
+                    connection.exec_driver_sql(f"DROP TABLE {name}")
+                    result["dropped"].append(name)
+                elif retention_start is not None and month < retention_start:
+                    connection.exec_driver_sql(f"ALTER TABLE {table_name} DETACH PARTITION {name}")
+                    result["detached"].append(name)
+        except Exception as e:
+            logger.error(f"Failed to maintain partition {name}: {str(e)}")
+    return result
+
+def create_partitions_after_create(table: Table, connection: Connection, months_ahead: int = 3, **kw):
+    """after_create listener that makes a newly created partitioned table usable right away"""
+    if connection.dialect.name != "postgresql":
+        return
+    create_default_partition(connection, table.name)
+    current_month = month_start(datetime.now(timezone.utc))
+    create_partitions(connection, table.name, current_month, add_months(current_month, months_ahead))
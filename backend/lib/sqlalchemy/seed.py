@@ -1,11 +1,14 @@
 from lib.sqlalchemy.db import SessionLocal, engine
-from backend.lib.sqlalchemy.sqlalchemy_models import User, Paper, PaperChunk
+from lib.sqlalchemy.sqlalchemy_models import User, Paper, PaperChunk
 from sqlalchemy.orm import sessionmaker
-import json
+import numpy as np
+
+EMBEDDING_DIM = 1536
 
 def seed_database():
     """Seed the database with example data"""
     db = SessionLocal()
+    rng = np.random.default_rng(42)
     
     try:
         # Check if data already exists
@@ -64,28 +67,28 @@ def seed_database():
             paper_id=paper1.id,
             text="Machine learning is a subset of artificial intelligence that focuses on algorithms and statistical models.",
             chunk_index=0,
-            embedding_vector=json.dumps([0.1, 0.2, 0.3, 0.4, 0.5])
+            embedding_vector=rng.standard_normal(EMBEDDING_DIM, dtype=np.float32)
         )
         
         chunk2 = PaperChunk(
             paper_id=paper1.id,
             text="These algorithms enable computers to improve their performance on a specific task through experience.",
             chunk_index=1,
-            embedding_vector=json.dumps([0.2, 0.3, 0.4, 0.5, 0.6])
+            embedding_vector=rng.standard_normal(EMBEDDING_DIM, dtype=np.float32)
         )
         
         chunk3 = PaperChunk(
             paper_id=paper2.id,
             text="Deep learning has revolutionized natural language processing by introducing neural network architectures.",
             chunk_index=0,
-            embedding_vector=json.dumps([0.3, 0.4, 0.5, 0.6, 0.7])
+            embedding_vector=rng.standard_normal(EMBEDDING_DIM, dtype=np.float32)
         )
         
         chunk4 = PaperChunk(
             paper_id=paper2.id,
             text="Transformers and attention mechanisms have become the foundation of modern NLP systems.",
             chunk_index=1,
-            embedding_vector=json.dumps([0.4, 0.5, 0.6, 0.7, 0.8])
+            embedding_vector=rng.standard_normal(EMBEDDING_DIM, dtype=np.float32)
         )
         
         db.add(chunk1)
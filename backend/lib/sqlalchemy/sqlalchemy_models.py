@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON, UniqueConstraint, Boolean, LargeBinary, Index, PrimaryKeyConstraint, DDL, event
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from lib.sqlalchemy import partitions
 from lib.sqlalchemy.db import Base
+from lib.sqlalchemy.vector import Float32Vector
 
 class User(Base):
     __tablename__ = "users"
@@ -44,7 +47,7 @@ class PaperChunk(Base):
     paper_id = Column(Integer, ForeignKey("papers.id"), nullable=False)
     text = Column(Text, nullable=False)
     chunk_index = Column(Integer, nullable=False)
-    embedding_vector = Column(Text)  # Store as JSON string for now
+    embedding_vector = Column(Float32Vector(1536))  # float32 bytes, or pgvector when USE_PGVECTOR=true
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationship
@@ -54,22 +57,79 @@ class WebsocketSession(Base):
     __tablename__ = "websocket_sessions"
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String(255), nullable=False)
+    session_id = Column(String(255), nullable=False, unique=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-    llm_state = Column(JSON, nullable=False) # Stringified JSON
+    llm_state = Column(JSON, nullable=True) # Legacy uncompressed team state, superseded by WebsocketTeamState
+    last_seq = Column(Integer, nullable=False, default=0, server_default="0") # Last allocated message sequence number
+    last_activity_at = Column(DateTime(timezone=True), server_default=func.now()) # Time of the latest appended message
+    archived_at = Column(DateTime(timezone=True), nullable=True) # Set while messages and team state live in the session archive
     
     # Relationship
     messages = relationship("WebsocketMessage", back_populates="session")
+    team_states = relationship("WebsocketTeamState", back_populates="session")
+
+    __table_args__ = (
+        # Only hot sessions are candidates for archiving
+        Index(
+            'ix_websocket_sessions_hot_last_activity', 'last_activity_at',
+            postgresql_where=archived_at.is_(None), sqlite_where=archived_at.is_(None),
+        ),
+    )
+
+def _not_postgresql(ddl, target, bind, dialect, **kw) -> bool:
+    return dialect.name != "postgresql"
 
 class WebsocketMessage(Base):
     __tablename__ = "websocket_messages"
     
+    id = Column(Integer, index=True)
+    session_id = Column(Integer, ForeignKey("websocket_sessions.id"), nullable=False)
+    seq = Column(Integer, nullable=False) # Per-session sequence number, allocated from WebsocketSession.last_seq
+    source = Column(String(255)) # Agent or user that produced the message
+    type = Column(String(100)) # AutoGen message type, e.g. TextMessage
+    prompt_tokens = Column(Integer) # From models_usage, when the message came from a model call
+    completion_tokens = Column(Integer)
+    payload = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False) # The full message as dumped by AutoGen
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now()) # Partition key on PostgreSQL
+    
+    # Relationship
+    session = relationship("WebsocketSession", back_populates="messages")
+
+    # On PostgreSQL the table is range-partitioned by month on created_at (see
+    # lib/sqlalchemy/partitions.py). Keys there must include the partition key, so
+    # the primary key is (id, created_at) and (session_id, seq) is a plain index,
+    # kept unique by the sequence counter on the session.
+    __table_args__ = (
+        PrimaryKeyConstraint('id', name='websocket_messages_pkey').ddl_if(callable_=_not_postgresql),
+        UniqueConstraint('session_id', 'seq', name='uq_websocket_messages_session_seq').ddl_if(callable_=_not_postgresql),
+        Index('ix_websocket_messages_session_seq', 'session_id', 'seq').ddl_if(dialect='postgresql'),
+        Index('ix_websocket_messages_session_type', 'session_id', 'type'),
+        Index('ix_websocket_messages_session_source', 'session_id', 'source'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+event.listen(
+    WebsocketMessage.__table__, "after_create",
+    DDL("ALTER TABLE %(table)s ADD CONSTRAINT websocket_messages_pkey PRIMARY KEY (id, created_at)").execute_if(dialect="postgresql"),
+)
+event.listen(WebsocketMessage.__table__, "after_create", partitions.create_partitions_after_create)
+
+class WebsocketTeamState(Base):
+    __tablename__ = "websocket_team_states"
+    
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("websocket_sessions.id"), nullable=False)
-    message = Column(Text, nullable=False)
+    version = Column(Integer, nullable=False) # Increments on every save
+    is_snapshot = Column(Boolean, nullable=False) # Full state, or a delta against the previous version
+    payload = Column(LargeBinary, nullable=False) # zstd-compressed JSON, see lib/state_codec.py
+    raw_size = Column(Integer, nullable=False) # Uncompressed size of the full state in bytes
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationship
-    session = relationship("WebsocketSession", back_populates="messages")
\ No newline at end of file
+    session = relationship("WebsocketSession", back_populates="team_states")
+
+    __table_args__ = (
+        UniqueConstraint('session_id', 'version', name='uq_websocket_team_states_session_version'),
+    )
@@ -0,0 +1,128 @@
+"""Embedded SQLite storage for single-node deployments.
+
+The database runs in WAL mode so readers never block the writer or each
+other. Writes go through an engine with exactly one pooled connection: its
+pool is the single-writer queue, and every write transaction starts with
+BEGIN IMMEDIATE so it holds the lock from the start instead of failing to
+upgrade a read lock. Reads run on a separate pool of query-only connections
+in autocommit mode, so each statement sees the latest committed data and no
+read transaction stays open to hold back WAL checkpoints.
+"""
+import os
+from contextlib import contextmanager
+from typing import Iterable
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # Durable at checkpoints; a crash can lose the last transactions but never corrupts the file
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+    f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))}",
+    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+def _apply_pragmas(engine: Engine, extra: Iterable[str] = ()):
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy events decide when transactions begin
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in (*PRAGMAS, *extra):
+            cursor.execute(pragma)
+        cursor.close()
+
+def create_sqlite_engines(path: str, reader_pool_size: int = 8) -> tuple[Engine, Engine]:
+    """Create the (writer, reader) engine pair for the database file at path"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    url = f"sqlite:///{path}"
+
+    writer = create_engine(
+        url,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=float(os.getenv("SQLITE_WRITE_TIMEOUT_SECONDS", "30")),
+        connect_args={"check_same_thread": False},
+    )
+    _apply_pragmas(writer)
+
+    @event.listens_for(writer, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    reader = create_engine(
+        url,
+        pool_size=reader_pool_size,
+        # Readers never block each other in WAL mode, so extra connections are allowed beyond the pool
+        max_overflow=-1,
+        isolation_level="AUTOCOMMIT",
+        connect_args={"check_same_thread": False},
+    )
+    _apply_pragmas(reader, extra=("PRAGMA query_only=ON",))
+    return writer, reader
+
+class RoutingSession(Session):
+    """Session that reads from the reader pool until its transaction writes.
+
+    A flush or an INSERT/UPDATE/DELETE moves the transaction onto the writer
+    connection, and it stays there until commit or rollback so the
+    transaction can read its own uncommitted writes. A write transaction
+    that fails is rolled back at once: the writer is the only connection
+    of its pool, and a session left waiting for its owner's rollback would
+    block every other writer.
+    """
+
+    writer: Engine
+    reader: Engine
+    _writing = False
+
+    def execute(self, statement, *args, **kwargs):
+        # ORM bulk INSERTs ask for a bind without passing the statement, so mark the write here
+        if isinstance(statement, UpdateBase):
+            self._writing = True
+        with self._rollback_failed_write():
+            return super().execute(statement, *args, **kwargs)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._writing or self._flushing or isinstance(clause, UpdateBase):
+            self._writing = True
+            return self.writer
+        return self.reader
+
+    def commit(self):
+        try:
+            with self._rollback_failed_write():
+                super().commit()
+        finally:
+            self._writing = False
+
+    def rollback(self):
+        try:
+            super().rollback()
+        finally:
+            self._writing = False
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._writing = False
+
+    @contextmanager
+    def _rollback_failed_write(self):
+        try:
+            yield
+        except Exception:
+            if self._writing:
+                self.rollback()
+            raise
+
+def sqlite_sessionmaker(writer: Engine, reader: Engine) -> sessionmaker:
+    session_class = type("SQLiteRoutingSession", (RoutingSession,), {"writer": writer, "reader": reader})
+    return sessionmaker(class_=session_class, autocommit=False, autoflush=False)
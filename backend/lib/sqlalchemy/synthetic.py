@@ -0,0 +1,344 @@
+"""Synthetic data generator for scale testing the storage layer.
+
+Generates users, papers, 1536-dim paper chunks, websocket sessions and their
+messages with heavy-tailed size distributions, reproducibly from a seed.
+Rows are loaded with COPY on PostgreSQL and with batched executemany on
+SQLite, and are appended after the highest existing ids so repeated runs
+grow the dataset.
+
+Usage:
+    python -m lib.sqlalchemy.synthetic --sessions 100000 --papers 10000 --database-url sqlite:///scale.db
+"""
+import argparse
+import io
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Sequence
+import numpy as np
+import orjson
+from sqlalchemy import Engine, Table, create_engine, event, func, select, text
+from lib.sqlalchemy import vector
+from lib.sqlalchemy.db import Base, sqlalchemy_url
+from lib.sqlalchemy.sqlalchemy_models import User, Paper, PaperChunk, WebsocketSession, WebsocketMessage
+
+# Message mix of a typical chat: (type, share, mean content length in characters)
+MESSAGE_TYPES = (
+    ("TextMessage", 0.45, 600),
+    ("ToolCallRequestEvent", 0.15, 150),
+    ("ToolCallExecutionEvent", 0.15, 4000),
+    ("ToolCallSummaryMessage", 0.15, 3000),
+    ("ThoughtEvent", 0.10, 400),
+)
+AGENT_SOURCES = ("search_paper_agent", "search_chunk_agent", "summarize_agent")
+
+VOCABULARY = (
+    "privacy model agent data learning network graph neural attention language retrieval "
+    "embedding vector search paper results method approach dataset evaluation training "
+    "transformer benchmark performance system analysis user query context memory state "
+    "protection federated inference token latency throughput index storage database"
+).split()
+
+# COPY text format escapes; backslash must be replaced first
+COPY_ESCAPES = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"))
+
+@dataclass
+class SyntheticConfig:
+    sessions: int = 1000
+    # Messages per session follow a lognormal distribution with this mean
+    messages_per_session: float = 40.0
+    max_messages_per_session: int = 5000
+    users: int = 100
+    papers: int = 1000
+    # Chunks per paper follow a lognormal distribution with this mean
+    chunks_per_paper: float = 30.0
+    max_chunks_per_paper: int = 500
+    seed: int = 42
+    # Rows per COPY or executemany; one transaction each
+    batch_size: int = 10000
+    # Sessions are spread over this many days before now
+    days: int = 365
+
+@dataclass
+class SyntheticSummary:
+    rows: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return sum(self.rows.values()) / self.seconds if self.seconds else 0.0
+
+def _lognormal_counts(rng: np.random.Generator, mean: float, size: int, upper: int, sigma: float = 1.0) -> np.ndarray:
+    """Heavy-tailed positive integers with the given mean, clipped to [1, upper]"""
+    samples = rng.lognormal(mean=math.log(mean) - sigma ** 2 / 2, sigma=sigma, size=size)
+    return np.clip(np.rint(samples), 1, upper).astype(np.int64)
+
+class _TextSource:
+    """Random text sliced from one pre-generated corpus, which is much faster than sampling words per row"""
+
+    def __init__(self, rng: np.random.Generator, size: int = 1 << 20):
+        words = np.array(VOCABULARY)[rng.integers(0, len(VOCABULARY), size=size // 6)]
+        self.corpus = " ".join(words.tolist())
+        self.rng = rng
+
+    def text(self, length: int) -> str:
+        length = min(length, len(self.corpus))
+        start = int(self.rng.integers(0, len(self.corpus) - length + 1))
+        return self.corpus[start:start + length]
+
+def _next_id(engine: Engine, table: Table) -> int:
+    with engine.connect() as conn:
+        return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+def _copy_field(value: Any, dialect_vector: bool) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, np.ndarray):
+        if dialect_vector:
+            return "[" + ",".join(map(repr, value.tolist())) + "]"
+        return "\\\\x" + np.asarray(value, dtype="<f4").tobytes().hex()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        value = orjson.dumps(value).decode()
+    value = str(value)
+    for char, escaped in COPY_ESCAPES:
+        value = value.replace(char, escaped)
+    return value
+
+def _load(engine: Engine, table: Table, rows: List[Dict[str, Any]]):
+    """Load one batch of rows in a single transaction"""
+    if not rows:
+        return
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            columns = list(rows[0])
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write("\t".join(_copy_field(row[column], vector.use_pgvector) for column in columns) + "\n")
+            buffer.seek(0)
+            cursor = conn.connection.cursor()
+            try:
+                cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN", buffer)
+            finally:
+                cursor.close()
+        else:
+            conn.execute(table.insert(), rows)
+
+def _reset_sequences(engine: Engine, tables: Sequence[Table]):
+    """COPY bypasses the serial sequences, so move them past the loaded ids"""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        for table in tables:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table.name}), 1))"
+            ))
+
+def _batched(rows: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _user_rows(config: SyntheticConfig, first_id: int, now: datetime) -> Iterator[Dict[str, Any]]:
+    for user_id in range(first_id, first_id + config.users):
+        yield {
+            "id": user_id,
+            "email": f"user{user_id}@example.com",
+            "name": f"Synthetic User {user_id}",
+            "created_at": now,
+        }
+
+def _paper_rows(config: SyntheticConfig, rng: np.random.Generator, texts: _TextSource,
+                first_id: int, user_ids: np.ndarray, now: datetime) -> Iterator[Dict[str, Any]]:
+    abstract_lengths = _lognormal_counts(rng, 1200, config.papers, 10000, sigma=0.5)
+    for offset, paper_id in enumerate(range(first_id, first_id + config.papers)):
+        yield {
+            "id": paper_id,
+            "title": texts.text(int(rng.integers(30, 200))).strip().capitalize(),
+            "abstract": texts.text(int(abstract_lengths[offset])),
+            "author_id": int(user_ids[offset]),
+            "journal": "Journal of Synthetic Data",
+            "year": str(int(rng.integers(2000, 2026))),
+            "doi": f"10.5555/synthetic.{paper_id}",
+            "created_at": now,
+        }
+
+def _chunk_rows(config: SyntheticConfig, rng: np.random.Generator, texts: _TextSource,
+                first_id: int, paper_ids: range, now: datetime) -> Iterator[Dict[str, Any]]:
+    chunk_counts = _lognormal_counts(rng, config.chunks_per_paper, len(paper_ids), config.max_chunks_per_paper)
+    chunk_id = first_id
+    for paper_id, count in zip(paper_ids, chunk_counts):
+        # Unit-norm float32 embeddings, generated per paper to bound memory
+        embeddings = rng.standard_normal((int(count), PaperChunk.embedding_vector.type.dim), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        for chunk_index in range(int(count)):
+            yield {
+                "id": chunk_id,
+                "paper_id": paper_id,
+                "text": texts.text(int(rng.integers(500, 2000))),
+                "chunk_index": chunk_index,
+                "embedding_vector": embeddings[chunk_index],
+                "created_at": now,
+            }
+            chunk_id += 1
+
+def _session_and_message_rows(config: SyntheticConfig, rng: np.random.Generator, texts: _TextSource,
+                              first_session_id: int, first_message_id: int,
+                              now: datetime) -> Iterator[tuple[Dict[str, Any] | None, Dict[str, Any] | None]]:
+    """Yield (session row, None) followed by (None, message row) for each of its messages"""
+    message_counts = _lognormal_counts(rng, config.messages_per_session, config.sessions, config.max_messages_per_session)
+    type_names = [name for name, _, _ in MESSAGE_TYPES]
+    type_shares = np.array([share for _, share, _ in MESSAGE_TYPES])
+    type_lengths = {name: length for name, _, length in MESSAGE_TYPES}
+    message_id = first_message_id
+
+    for offset, session_pk in enumerate(range(first_session_id, first_session_id + config.sessions)):
+        count = int(message_counts[offset])
+        created_at = now - timedelta(seconds=float(rng.uniform(0, config.days * 86400)))
+        types = rng.choice(len(type_names), size=count, p=type_shares / type_shares.sum())
+        gaps = rng.exponential(20.0, size=count)
+        yield {
+            "id": session_pk,
+            "session_id": f"synthetic-{config.seed}-{session_pk}",
+            "created_at": created_at,
+            "last_seq": count,
+            "last_activity_at": created_at + timedelta(seconds=float(gaps.sum())),
+        }, None
+
+        timestamp = created_at
+        for seq in range(1, count + 1):
+            type_name = type_names[types[seq - 1]]
+            timestamp += timedelta(seconds=float(gaps[seq - 1]))
+            # About half of the text messages are the user's turns
+            source = "user" if type_name == "TextMessage" and rng.random() < 0.5 else AGENT_SOURCES[seq % len(AGENT_SOURCES)]
+            length = int(_lognormal_counts(rng, type_lengths[type_name], 1, 50000)[0])
+            usage = None
+            if source != "user" and type_name in ("TextMessage", "ToolCallRequestEvent"):
+                usage = {"prompt_tokens": int(rng.integers(100, 8000)), "completion_tokens": int(rng.integers(10, 1000))}
+            yield None, {
+                "id": message_id,
+                "session_id": session_pk,
+                "seq": seq,
+                "source": source,
+                "type": type_name,
+                "prompt_tokens": usage["prompt_tokens"] if usage else None,
+                "completion_tokens": usage["completion_tokens"] if usage else None,
+                "payload": {
+                    "id": f"{session_pk}-{seq}",
+                    "source": source,
+                    "models_usage": usage,
+                    "metadata": {},
+                    "created_at": timestamp.isoformat(),
+                    "content": texts.text(length),
+                    "type": type_name,
+                },
+                "created_at": timestamp,
+            }
+            message_id += 1
+
+def generate(engine: Engine, config: SyntheticConfig) -> SyntheticSummary:
+    """Generate and load a synthetic dataset into the database behind engine"""
+    started = time.perf_counter()
+    rng = np.random.default_rng(config.seed)
+    texts = _TextSource(rng)
+    now = datetime.now(timezone.utc)
+    summary = SyntheticSummary()
+
+    def load(table: Table, rows: Iterator[Dict[str, Any]]):
+        for batch in _batched(rows, config.batch_size):
+            _load(engine, table, batch)
+            summary.rows[table.name] = summary.rows.get(table.name, 0) + len(batch)
+
+    first_user_id = _next_id(engine, User.__table__)
+    load(User.__table__, _user_rows(config, first_user_id, now))
+
+    first_paper_id = _next_id(engine, Paper.__table__)
+    author_ids = rng.integers(first_user_id, first_user_id + config.users, size=config.papers)
+    load(Paper.__table__, _paper_rows(config, rng, texts, first_paper_id, author_ids, now))
+    load(PaperChunk.__table__, _chunk_rows(
+        config, rng, texts, _next_id(engine, PaperChunk.__table__),
+        range(first_paper_id, first_paper_id + config.papers), now
+    ))
+
+    # Sessions must land before their messages, so flush both whenever either batch fills up
+    sessions: List[Dict[str, Any]] = []
+    messages: List[Dict[str, Any]] = []
+    rows = _session_and_message_rows(
+        config, rng, texts,
+        _next_id(engine, WebsocketSession.__table__), _next_id(engine, WebsocketMessage.__table__), now
+    )
+    for session_row, message_row in rows:
+        if session_row is not None:
+            sessions.append(session_row)
+        else:
+            messages.append(message_row)
+        if len(sessions) >= config.batch_size or len(messages) >= config.batch_size:
+            load(WebsocketSession.__table__, iter(sessions))
+            load(WebsocketMessage.__table__, iter(messages))
+            sessions, messages = [], []
+    load(WebsocketSession.__table__, iter(sessions))
+    load(WebsocketMessage.__table__, iter(messages))
+
+    _reset_sequences(engine, [
+        User.__table__, Paper.__table__, PaperChunk.__table__,
+        WebsocketSession.__table__, WebsocketMessage.__table__,
+    ])
+    summary.seconds = time.perf_counter() - started
+    return summary
+
+def create_engine_for(database_url: str) -> Engine:
+    """Engine for loading; SQLite gets pragmas that trade durability for load speed"""
+    engine = create_engine(database_url)
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=OFF")
+            cursor.close()
+    return engine
+
+def main():
+    defaults = SyntheticConfig()
+    parser = argparse.ArgumentParser(description="Load a synthetic dataset for scale testing")
+    parser.add_argument("--database-url", default=None, help="Target database (default: the POSTGRES_* settings)")
+    parser.add_argument("--create-tables", action="store_true", help="Create missing tables first, e.g. for a fresh SQLite file")
+    parser.add_argument("--sessions", type=int, default=defaults.sessions)
+    parser.add_argument("--messages-per-session", type=float, default=defaults.messages_per_session)
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--papers", type=int, default=defaults.papers)
+    parser.add_argument("--chunks-per-paper", type=float, default=defaults.chunks_per_paper)
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    if args.database_url is None:
+        args.database_url = sqlalchemy_url.render_as_string(hide_password=False)
+    engine = create_engine_for(args.database_url)
+    if args.create_tables:
+        Base.metadata.create_all(bind=engine)
+
+    config = SyntheticConfig(
+        sessions=args.sessions,
+        messages_per_session=args.messages_per_session,
+        users=args.users,
+        papers=args.papers,
+        chunks_per_paper=args.chunks_per_paper,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+    summary = generate(engine, config)
+    for table, count in summary.rows.items():
+        print(f"{table}: {count} rows")
+    print(f"Loaded in {summary.seconds:.1f}s ({summary.rows_per_second:,.0f} rows/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+from typing import Any
+import numpy as np
+from sqlalchemy import Float, LargeBinary, bindparam
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.types import TypeDecorator
+
+try:
+    from pgvector.sqlalchemy import VECTOR
+except ImportError:  # pgvector is an optional dependency
+    VECTOR = None
+
+# The column type has to match the migrated schema, so pgvector is opt-in rather than auto-detected
+use_pgvector = VECTOR is not None and os.getenv("USE_PGVECTOR", "false").lower() == "true"
+
+class Float32Vector(TypeDecorator):
+    """Embedding vector stored as raw little-endian float32.
+
+    Stored as bytea (decoded with a zero-copy np.frombuffer), or as a pgvector
+    column on PostgreSQL when USE_PGVECTOR=true. Values are bound from any
+    sequence of floats and always loaded as a float32 numpy array.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, dim: int | None = None):
+        super().__init__()
+        self.dim = dim
+
+    def load_dialect_impl(self, dialect):
+        if use_pgvector and dialect.name == "postgresql":
+            return dialect.type_descriptor(VECTOR(self.dim))
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value: Any, dialect) -> Any:
+        if value is None:
+            return None
+        array = np.asarray(value, dtype="<f4")
+        if self.dim is not None and array.shape != (self.dim,):
+            raise ValueError(f"Expected a vector of dimension {self.dim}, got shape {array.shape}")
+        if use_pgvector and dialect.name == "postgresql":
+            return array
+        return array.tobytes()
+
+    def process_result_value(self, value: Any, dialect) -> np.ndarray | None:
+        if value is None:
+            return None
+        if isinstance(value, np.ndarray):
+            return value.astype(np.float32, copy=False)
+        return np.frombuffer(value, dtype="<f4")
+
+def stack_vectors(vectors: list[np.ndarray]) -> np.ndarray:
+    """Stack loaded vectors into an (N, d) float32 matrix"""
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack(vectors)
+
+def cosine_distance(column: ColumnElement, query_vector: Any, dim: int | None = None) -> ColumnElement:
+    """SQL expression for pgvector's cosine distance between column and query_vector"""
+    if VECTOR is None:
+        raise RuntimeError("pgvector is not installed")
+    query = bindparam(None, np.asarray(query_vector, dtype=np.float32), type_=VECTOR(dim))
+    return column.op("<=>", return_type=Float)(query)
+
+def top_k_cosine(matrix: np.ndarray, query_vector: Any, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Brute-force cosine kNN over the rows of matrix; returns (row indexes, distances)"""
+    if matrix.shape[0] == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    similarities = (matrix @ query) / np.where(norms == 0, 1, norms)
+    k = min(k, matrix.shape[0])
+    indexes = np.argpartition(-similarities, k - 1)[:k]
+    indexes = indexes[np.argsort(-similarities[indexes])]
+    return indexes, 1 - similarities[indexes]
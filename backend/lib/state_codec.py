@@ -0,0 +1,99 @@
+import os
+import threading
+from typing import Any
+import orjson
+import zstandard
+
+# Encoding for persisted team state: orjson (which handles datetimes natively)
+# compressed with zstd. Successive states are stored as deltas against the
+# previous one; see diff_state/apply_delta.
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+_ZSTD_LEVEL = int(os.getenv("TEAM_STATE_ZSTD_LEVEL", "3"))
+
+# zstd contexts are not thread-safe, so each thread gets its own pair
+_contexts = threading.local()
+
+def _compressor() -> zstandard.ZstdCompressor:
+    if not hasattr(_contexts, "compressor"):
+        _contexts.compressor = zstandard.ZstdCompressor(level=_ZSTD_LEVEL)
+    return _contexts.compressor
+
+def _decompressor() -> zstandard.ZstdDecompressor:
+    if not hasattr(_contexts, "decompressor"):
+        _contexts.decompressor = zstandard.ZstdDecompressor()
+    return _contexts.decompressor
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=str, option=_ORJSON_OPTIONS)
+
+def loads(data: bytes) -> Any:
+    return orjson.loads(data)
+
+def normalize(value: Any) -> Any:
+    """Return the plain JSON form of value (datetimes become ISO strings, etc.)"""
+    return loads(dumps(value))
+
+def compress(data: bytes) -> bytes:
+    return _compressor().compress(data)
+
+def encode(value: Any) -> bytes:
+    return compress(dumps(value))
+
+def decode(data: bytes) -> Any:
+    return loads(_decompressor().decompress(data))
+
+def diff_state(old: Any, new: Any, path: tuple = ()) -> list[list]:
+    """Compute the operations that turn old into new.
+
+    Both values must be normalized JSON. Dicts are diffed key by key and lists
+    that only grew (the common case for LLM contexts and message threads) are
+    encoded as an extension; anything else is replaced wholesale.
+    Operations are ["set", path, value], ["del", path] and ["extend", path, items].
+    """
+    if type(old) is not type(new):
+        return [["set", list(path), new]]
+
+    if isinstance(new, dict):
+        ops: list[list] = []
+        for key in old.keys() - new.keys():
+            ops.append(["del", [*path, key]])
+        for key, value in new.items():
+            if key not in old:
+                ops.append(["set", [*path, key], value])
+            elif old[key] != value:
+                ops.extend(diff_state(old[key], value, (*path, key)))
+        return ops
+
+    if isinstance(new, list):
+        if len(new) > len(old) and new[:len(old)] == old:
+            return [["extend", list(path), new[len(old):]]]
+        return [] if new == old else [["set", list(path), new]]
+
+    return [] if new == old else [["set", list(path), new]]
+
+def apply_delta(state: Any, ops: list[list]) -> Any:
+    """Apply operations produced by diff_state to state (in place where possible)"""
+    for op in ops:
+        kind, path = op[0], op[1]
+        if not path:
+            if kind == "set":
+                state = op[2]
+            elif kind == "extend":
+                state.extend(op[2])
+            continue
+
+        parent = state
+        for key in path[:-1]:
+            parent = parent[key]
+        key = path[-1]
+        if kind == "set":
+            parent[key] = op[2]
+        elif kind == "del":
+            del parent[key]
+        elif kind == "extend":
+            parent[key].extend(op[2])
+        else:
+            raise ValueError(f"Unknown state delta operation: {kind}")
+    return state
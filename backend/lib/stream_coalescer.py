@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+from autogen_agentchat.messages import ModelClientStreamingChunkEvent
+
+logger = logging.getLogger(__name__)
+
+class StreamChunkCoalescer:
+    """Merge streamed model tokens into fewer websocket frames.
+
+    Consecutive chunks of the same message are buffered and sent as one
+    ModelClientStreamingChunkEvent frame once flush_interval seconds have
+    passed since the first buffered chunk or max_chars characters are
+    buffered, whichever comes first. Callers flush before sending any other
+    message so frames keep their order.
+    """
+
+    def __init__(self, send: Callable[[dict[str, Any]], Awaitable[None]], flush_interval: float = 0.05, max_chars: int = 256):
+        self.send = send
+        self.flush_interval = flush_interval
+        self.max_chars = max_chars
+        self._frame: dict[str, Any] | None = None
+        self._parts: list[str] = []
+        self._chars = 0
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.Task | None = None
+
+    async def add(self, chunk: ModelClientStreamingChunkEvent):
+        """Buffer a chunk, sending the buffer first if the chunk belongs to another message"""
+        if self._frame is not None and (self._frame["source"], self._frame["full_message_id"]) != (chunk.source, chunk.full_message_id):
+            await self.flush()
+        if self._frame is None:
+            # The first chunk's fields (id, source, created_at) describe the whole frame
+            self._frame = chunk.model_dump(mode="json")
+            self._timer = asyncio.create_task(self._flush_later())
+        self._parts.append(chunk.content)
+        self._chars += len(chunk.content)
+        if self._chars >= self.max_chars:
+            await self.flush()
+
+    async def flush(self):
+        """Send whatever is buffered as one frame"""
+        async with self._lock:
+            if self._frame is None:
+                return
+            frame, self._frame = self._frame, None
+            frame["content"] = "".join(self._parts)
+            self._parts, self._chars = [], 0
+            if self._timer is not None and self._timer is not asyncio.current_task():
+                self._timer.cancel()
+            self._timer = None
+            await self.send(frame)
+
+    def close(self):
+        """Stop the timer and drop anything still buffered, e.g. after the run failed"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._frame, self._parts, self._chars = None, [], 0
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            # The next send from the stream loop surfaces a broken connection
+            logger.debug(f"Failed to send streamed tokens: {str(e)}")
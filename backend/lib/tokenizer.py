@@ -0,0 +1,64 @@
+import functools
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Callable
+import tiktoken
+from tiktoken.model import encoding_name_for_model
+from autogen_core.models import LLMMessage
+
+logger = logging.getLogger(__name__)
+
+# Tokens OpenAI adds around every chat message for the role and separators
+MESSAGE_OVERHEAD = 4
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(model: str) -> Callable[[str], list[int]] | None:
+    """tiktoken encoder for the model, loaded once per process; None if tiktoken can't provide one"""
+    try:
+        name = encoding_name_for_model(model)
+    except KeyError:
+        name = "o200k_base"
+    try:
+        encoding = tiktoken.get_encoding(name)
+    except Exception as e:
+        # The encoding files are downloaded on first use, which fails offline
+        logger.warning(f"No tiktoken encoding for {model}, estimating token counts from length: {str(e)}")
+        return None
+    return functools.partial(encoding.encode, disallowed_special=())
+
+class TokenCounter:
+    """Token counts of chat messages, cached per message content.
+
+    Model contexts recount the whole history on every turn; with the cache
+    only messages added since the last turn are encoded. Without a tiktoken
+    encoding, counts are estimated at four characters per token.
+    """
+
+    def __init__(self, model: str = "gpt-4o", max_entries: int = 65536):
+        self.model = model
+        self.max_entries = max_entries
+        self._counts: OrderedDict[bytes, int] = OrderedDict()
+
+    def count(self, message: LLMMessage) -> int:
+        text = message.model_dump_json(exclude={"type"})
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        count = self._counts.get(key)
+        if count is not None:
+            self._counts.move_to_end(key)
+            return count
+        encode = get_encoder(self.model)
+        count = (len(encode(text)) if encode is not None else len(text) // 4 + 1) + MESSAGE_OVERHEAD
+        self._counts[key] = count
+        if len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+        return count
+
+    def count_all(self, messages: list[LLMMessage]) -> int:
+        return sum(self.count(message) for message in messages)
+
+@functools.lru_cache(maxsize=None)
+def token_counter(model: str) -> TokenCounter:
+    """Process-wide counter for the model, shared by every agent and session"""
+    return TokenCounter(model, int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "65536")))
@@ -1,9 +1,11 @@
+import asyncio
 import weaviate
-from weaviate import WeaviateClient
+from weaviate import WeaviateAsyncClient
 from weaviate.classes.query import MetadataQuery, Filter
 import os
 from dotenv import load_dotenv
-from typing import List, Tuple, Dict
+from typing import Any, Awaitable, List, Tuple, Dict
+from autogen_core import CancellationToken
 from result import Result, Ok, Err, is_err
 from models.paper import validate_paper_entry
 from models.chunk import validate_paper_chunk
@@ -11,9 +13,13 @@ from models.chunk import validate_paper_chunk
 load_dotenv()
 openai_api_key = os.environ["OPENAI_API_KEY"]
 
+# The tools are async and take the run's cancellation token (FunctionTool passes it
+# in and hides it from the model), so a cancelled run aborts the Weaviate request
+# instead of leaving it running in an executor thread.
+
 class WeaviateClientContext:
     def __init__(self):
-        client = weaviate.connect_to_local(
+        client = weaviate.use_async_with_local(
             host="localhost",  # Use a string to specify the host
             port=8080,
             grpc_port=50051,
@@ -21,27 +27,36 @@ class WeaviateClientContext:
         )
         self.client = client
 
-    def __enter__(self) -> Result[WeaviateClient, str]:
-        if self.client is None or not self.client.is_ready():
+    async def __aenter__(self) -> Result[WeaviateAsyncClient, str]:
+        if self.client is None:
+            return Err("Weaviate client is not initialized or not ready")
+        await self.client.connect()
+        if not await self.client.is_ready():
             return Err("Weaviate client is not initialized or not ready")
         return Ok(self.client)
 
-    def __exit__(self, exc_type, exc_value, traceback):
+    async def __aexit__(self, exc_type, exc_value, traceback):
         if self.client is not None:
-            self.client.close()
+            await self.client.close()
             self.client = None
 
-def search_paper(query: str) -> str | List[Dict[str, str | float | None]]:
-    with WeaviateClientContext() as r:
+async def _cancellable(request: Awaitable[Any], cancellation_token: CancellationToken | None) -> Any:
+    future = asyncio.ensure_future(request)
+    if cancellation_token is not None:
+        cancellation_token.link_future(future)
+    return await future
+
+async def search_paper(query: str, cancellation_token: CancellationToken) -> str | List[Dict[str, str | float | None]]:
+    async with WeaviateClientContext() as r:
         if is_err(r):
             return r.unwrap_err()
         client = r.unwrap()
         paper_collection = client.collections.get("Paper")
-        result = paper_collection.query.near_text(
+        result = await _cancellable(paper_collection.query.near_text(
             query=query,
             limit=10,
             return_metadata=MetadataQuery(distance=True)
-        )
+        ), cancellation_token)
         if len(result.objects) == 0:
             return f"No paper found related to the query: {query}"
         else:
@@ -63,15 +78,15 @@ def search_paper(query: str) -> str | List[Dict[str, str | float | None]]:
 def add_hyphen_to_uuid(uuid: str) -> str:
     return f"{uuid[:8]}-{uuid[8:12]}-{uuid[12:16]}-{uuid[16:20]}-{uuid[20:]}"
 
-def search_chunk(paper_id: str, query: str) -> str | List[Dict[str, str | float | None]]:
-    with WeaviateClientContext() as r:
+async def search_chunk(paper_id: str, query: str, cancellation_token: CancellationToken) -> str | List[Dict[str, str | float | None]]:
+    async with WeaviateClientContext() as r:
         if is_err(r):
             return r.unwrap_err()
         client = r.unwrap()
 
         # ensure the paper exists
         paper_collection = client.collections.get("Paper")
-        result = paper_collection.query.fetch_object_by_id(paper_id)
+        result = await _cancellable(paper_collection.query.fetch_object_by_id(paper_id), cancellation_token)
         if result is None:
             return "Paper not found"
 
@@ -79,12 +94,12 @@ def search_chunk(paper_id: str, query: str) -> str | List[Dict[str, str | float
 
         # add hyphen to paper_id(uuid)
         paper_id_with_hyphen = add_hyphen_to_uuid(paper_id)
-        result = chunk_collection.query.near_text(
+        result = await _cancellable(chunk_collection.query.near_text(
             filters=Filter.by_property("paperId").equal(paper_id_with_hyphen),
             query=query,
             limit=10,
             return_metadata=MetadataQuery(distance=True)
-        )
+        ), cancellation_token)
         if len(result.objects) == 0:
             return f"No chunk found related to the query: {query}"
 
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any
+from fastapi import WebSocket, WebSocketDisconnect
+from lib.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Overflow policies when the queue is full:
+#   "drop"  - token frames arriving at a full queue are merged into the queued frame
+#             of the same message; otherwise frames make room by merging two queued
+#             token frames of one message. Tokens are only discarded when nothing
+#             can be merged, and then always the rest of a message's stream, never a
+#             piece from its middle; the message's final frame still arrives whole.
+#             Frames wait for room only when no token frame is queued.
+#   "block" - every frame waits for room, so a slow client slows the run down.
+OVERFLOW_POLICIES = ("drop", "block")
+
+CHUNK_TYPE = "ModelClientStreamingChunkEvent"
+
+queue_depth = registry.gauge("websocket_send_queue_depth", "Frames waiting in websocket send queues, summed over connections")
+send_seconds = registry.histogram(
+    "websocket_send_seconds", "Time to write one frame to a websocket",
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+queue_wait_seconds = registry.histogram(
+    "websocket_send_queue_wait_seconds", "Time a frame spent queued before it was sent",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+frames_sent = registry.counter("websocket_frames_sent_total", "Frames written to websockets")
+frames_coalesced = registry.counter("websocket_frames_coalesced_total", "Queued token frames merged into an earlier frame")
+frames_dropped = registry.counter("websocket_frames_dropped_total", "Token frames dropped because a send queue was full")
+producer_wait_seconds = registry.histogram(
+    "websocket_send_blocked_seconds", "Time producers waited for room in a full send queue",
+    (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+
+def _message_key(frame: dict[str, Any]) -> tuple[Any, Any]:
+    """The message a frame belongs to; token frames name the final message they lead up to"""
+    if frame.get("type") == CHUNK_TYPE:
+        return frame.get("source"), frame.get("full_message_id")
+    return frame.get("source"), frame.get("id")
+
+def _merged(first: dict[str, Any], second: dict[str, Any]) -> dict[str, Any]:
+    frame = {**first, "content": first["content"] + second["content"]}
+    if "offset" in second:
+        # Resuming from the merged frame's offset must not replay the tokens merged into it
+        frame["offset"] = second["offset"]
+    return frame
+
+class WebsocketSender:
+    """Per-connection sender task with a bounded outbound queue.
+
+    The chat loop enqueues frames and carries on with the team run; a
+    background task writes them to the socket, so a slow client does not
+    stall the agents. Token frames of the same message that pile up in the
+    queue are merged before sending. When the queue is full, the overflow
+    policy decides whether token frames are dropped or the producer waits.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int = 256, overflow: str = "drop"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.overflow = overflow
+        # (frame, droppable, time enqueued)
+        self._queue: deque[tuple[dict[str, Any], bool, float]] = deque()
+        # Messages whose token stream was cut short; their later token frames are dropped too
+        self._truncated: set[tuple[Any, Any]] = set()
+        self._changed = asyncio.Condition()
+        self._error: BaseException | None = None
+        self._closing = False
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def send(self, frame: dict[str, Any], droppable: bool = False):
+        """Queue a frame; droppable frames may be discarded under the drop policy.
+
+        Raises WebSocketDisconnect once the connection has failed, so the
+        producer stops the same way it would on an inline send.
+        """
+        self._raise_if_failed()
+        async with self._changed:
+            if self._truncated:
+                if droppable and _message_key(frame) in self._truncated:
+                    frames_dropped.inc()
+                    return
+                if not droppable:
+                    self._truncated.discard(_message_key(frame))
+            if len(self._queue) >= self.max_queue and self.overflow == "drop":
+                if droppable:
+                    if self._merge_into_last(frame):
+                        return
+                    # The first token frame of a message usually queues behind the previous
+                    # message's final frame; room from other messages keeps its stream going
+                    if not self._make_room() or _message_key(frame) in self._truncated:
+                        self._truncated.add(_message_key(frame))
+                        frames_dropped.inc()
+                        return
+                else:
+                    self._make_room()
+            if len(self._queue) >= self.max_queue:
+                started = time.perf_counter()
+                await self._changed.wait_for(lambda: len(self._queue) < self.max_queue or self._error is not None)
+                producer_wait_seconds.observe(time.perf_counter() - started)
+                self._raise_if_failed()
+            self._queue.append((frame, droppable, time.perf_counter()))
+            queue_depth.inc()
+            self._changed.notify_all()
+
+    async def close(self, timeout: float = 5.0):
+        """Send what is still queued, up to timeout seconds, and stop the sender task"""
+        if self._task is None:
+            return
+        async with self._changed:
+            self._closing = True
+            self._changed.notify_all()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except Exception:
+            self._task.cancel()
+        async with self._changed:
+            queue_depth.dec(len(self._queue))
+            self._queue.clear()
+        self._task = None
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise WebSocketDisconnect(reason=f"Send failed: {self._error}")
+
+    def _merge_into_last(self, frame: dict[str, Any]) -> bool:
+        if not self._queue:
+            return False
+        last, droppable, enqueued_at = self._queue[-1]
+        if not droppable or _message_key(last) != _message_key(frame):
+            return False
+        self._queue[-1] = (_merged(last, frame), True, enqueued_at)
+        frames_coalesced.inc()
+        return True
+
+    def _make_room(self) -> bool:
+        """Free a slot by merging two queued token frames of one message, else by dropping the end of a message's stream"""
+        for index in range(len(self._queue) - 1):
+            first, droppable, enqueued_at = self._queue[index]
+            second, second_droppable, _ = self._queue[index + 1]
+            if droppable and second_droppable and _message_key(first) == _message_key(second):
+                self._queue[index] = (_merged(first, second), True, enqueued_at)
+                del self._queue[index + 1]
+                queue_depth.dec()
+                frames_coalesced.inc()
+                return True
+        # The newest token frame of a message is the end of its queued stream
+        for index in range(len(self._queue) - 1, -1, -1):
+            frame, droppable, _ = self._queue[index]
+            if droppable:
+                del self._queue[index]
+                queue_depth.dec()
+                self._truncated.add(_message_key(frame))
+                frames_dropped.inc()
+                return True
+        return False
+
+    def _next_frame(self) -> tuple[dict[str, Any], float]:
+        """Pop the next frame, merging the token frames of the same message queued right behind it"""
+        frame, _, enqueued_at = self._queue.popleft()
+        queue_depth.dec()
+        if frame.get("type") != CHUNK_TYPE:
+            return frame, enqueued_at
+        merged = None
+        while self._queue:
+            following, _, _ = self._queue[0]
+            if following.get("type") != CHUNK_TYPE or _message_key(following) != _message_key(frame):
+                break
+            self._queue.popleft()
+            queue_depth.dec()
+            frames_coalesced.inc()
+            if merged is None:
+                merged = [frame["content"]]
+            merged.append(following["content"])
+            last = following
+        if merged is not None:
+            frame = {**frame, "content": "".join(merged)}
+            if "offset" in last:
+                # Resuming from the merged frame's offset must not replay the tokens merged into it
+                frame["offset"] = last["offset"]
+        return frame, enqueued_at
+
+    async def _run(self):
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self._queue or self._closing)
+                    if not self._queue:
+                        return
+                    frame, enqueued_at = self._next_frame()
+                    self._changed.notify_all()
+                started = time.perf_counter()
+                queue_wait_seconds.observe(started - enqueued_at)
+                await self.websocket.send_json(frame)
+                send_seconds.observe(time.perf_counter() - started)
+                frames_sent.inc()
+        except Exception as e:
+            logger.info(f"Websocket sender stopped: {str(e)}")
+            async with self._changed:
+                self._error = e
+                self._changed.notify_all()
@@ -4,10 +4,10 @@ import json
 from datetime import datetime
 from autogen_agentchat.teams import RoundRobinGroupChat, SelectorGroupChat
 from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
-from autogen_agentchat.messages import TextMessage, AgentMessage
+from autogen_agentchat.messages import TextMessage, BaseChatMessage
 from autogen_agentchat.base import TaskResult
 from .service import ConversationService
-from .models import SessionCreate, MessageCreate, AgentStateCreate, TeamStateCreate
+from .models import SessionCreate, MessageCreate, AgentStateCreate, TeamStateCreate, ConversationChunkCreate
 
 class AutoGenDatabaseIntegration:
     def __init__(self, conversation_service: ConversationService):
@@ -55,11 +55,11 @@ class AutoGenDatabaseIntegration:
         
         return session.id
     
-    def save_team_state(self, session_id: uuid.UUID, team: RoundRobinGroupChat | SelectorGroupChat) -> bool:
+    async def save_team_state(self, session_id: uuid.UUID, team: RoundRobinGroupChat | SelectorGroupChat) -> bool:
         """Save current team state to database"""
         try:
             # Get current state from team
-            team_state = team.save_state()
+            team_state = await team.save_state()
             
             # Extract message thread
             message_thread = []
@@ -86,32 +86,29 @@ class AutoGenDatabaseIntegration:
                 version=team_state.get('version', '1.0.0')
             )
             
-            self.service.save_team_state(session_id, team_state_data)
-            
-            # Save individual agent states
-            if 'agent_states' in team_state:
-                for agent_name, agent_state_data in team_state['agent_states'].items():
-                    # Find agent in database
-                    agents = self.service.get_session_agents(session_id)
-                    agent = next((a for a in agents if a.name == agent_name), None)
-                    
-                    if agent:
-                        state_data = AgentStateCreate(
-                            agent_id=agent.id,
-                            state_type=agent_state_data.get('type', 'AssistantAgentState'),
-                            llm_context=agent_state_data.get('llm_context'),
-                            message_buffer=agent_state_data.get('message_buffer'),
-                            version=agent_state_data.get('version', '1.0.0')
-                        )
-                        self.service.save_agent_state(session_id, agent.id, state_data)
+            # Resolve every agent in one query, then upsert all states together
+            agent_states = team_state.get('agent_states', {})
+            agent_ids = self.service.get_agent_ids_by_name(session_id, list(agent_states))
+            agent_state_data = [
+                AgentStateCreate(
+                    agent_id=agent_ids[agent_name],
+                    state_type=state.get('type', 'AssistantAgentState'),
+                    llm_context=state.get('llm_context'),
+                    message_buffer=state.get('message_buffer'),
+                    version=state.get('version', '1.0.0')
+                )
+                for agent_name, state in agent_states.items()
+                if agent_name in agent_ids
+            ]
             
+            self.service.save_session_state(session_id, team_state_data, agent_state_data)
             return True
             
         except Exception as e:
             print(f"Failed to save team state: {e}")
             return False
     
-    def load_team_state(self, session_id: uuid.UUID, team: RoundRobinGroupChat | SelectorGroupChat) -> bool:
+    async def load_team_state(self, session_id: uuid.UUID, team: RoundRobinGroupChat | SelectorGroupChat) -> bool:
         """Load team state from database"""
         try:
             # Get team state from database
@@ -127,14 +124,13 @@ class AutoGenDatabaseIntegration:
             }
             
             # Load agent states
+            agent_names = {agent.id: agent.name for agent in self.service.get_session_agents(session_id)}
             agent_states = self.service.get_session_agent_states(session_id)
             for agent_state in agent_states:
-                agent = self.service.db.query(self.service.db.query().filter(
-                    self.service.db.query().filter.id == agent_state.agent_id
-                ).first()
+                agent_name = agent_names.get(agent_state.agent_id)
                 
-                if agent:
-                    team_state['agent_states'][agent.name] = {
+                if agent_name:
+                    team_state['agent_states'][agent_name] = {
                         'type': agent_state.state_type,
                         'version': agent_state.version,
                         'llm_context': agent_state.llm_context,
@@ -158,55 +154,53 @@ class AutoGenDatabaseIntegration:
             print(f"Failed to load team state: {e}")
             return False
     
-    def save_message(self, session_id: uuid.UUID, message: AgentMessage | TextMessage, 
+    def save_message(self, session_id: uuid.UUID, message: BaseChatMessage, 
                     agent_id: Optional[uuid.UUID] = None) -> bool:
         """Save a message to the database"""
+        return self.save_messages(session_id, [message], agent_id)
+    
+    def save_messages(self, session_id: uuid.UUID, messages: List[BaseChatMessage],
+                      agent_id: Optional[uuid.UUID] = None) -> bool:
+        """Save a batch of messages and their conversation chunks in one transaction"""
         try:
-            # Get next sequence order
-            sequence_order = self.service.get_next_sequence_order(session_id)
-            
-            # Create message data
-            message_data = MessageCreate(
-                source=message.source,
-                message_type=type(message).__name__,
-                content=message.content,
-                thought=getattr(message, 'thought', None),
-                models_usage=getattr(message, 'models_usage', None),
-                metadata=getattr(message, 'metadata', {}),
-                sequence_order=sequence_order
-            )
-            
-            # Save message
-            saved_message = self.service.add_message(session_id, message_data, agent_id)
-            
-            # Create conversation chunks for semantic search
-            if message.content:
-                self._create_conversation_chunks(session_id, saved_message.id, message.content)
+            messages_data = [
+                MessageCreate(
+                    source=message.source,
+                    message_type=type(message).__name__,
+                    content=message.content,
+                    thought=getattr(message, 'thought', None),
+                    models_usage=getattr(message, 'models_usage', None),
+                    metadata=getattr(message, 'metadata', {}),
+                    agent_id=agent_id,
+                    # Create conversation chunks for semantic search
+                    chunks=self._build_conversation_chunks(message.content) if message.content else []
+                )
+                for message in messages
+            ]
             
+            # Sequence numbers are assigned by the service as one block
+            self.service.add_messages_bulk(session_id, messages_data)
             return True
             
         except Exception as e:
-            print(f"Failed to save message: {e}")
+            print(f"Failed to save messages: {e}")
             return False
     
-    def _create_conversation_chunks(self, session_id: uuid.UUID, message_id: uuid.UUID, content: str):
+    def _build_conversation_chunks(self, content: str) -> List[ConversationChunkCreate]:
         """Create conversation chunks for semantic search"""
-        try:
-            # Simple chunking - split by sentences or paragraphs
-            # In a real implementation, you might want more sophisticated chunking
-            chunks = self._split_into_chunks(content)
-            
-            for i, chunk in enumerate(chunks):
-                if chunk.strip():
-                    self.service.add_conversation_chunk(
-                        session_id=session_id,
-                        message_id=message_id,
-                        chunk_text=chunk.strip(),
-                        chunk_type='message_content',
-                        metadata={'chunk_index': i}
-                    )
-        except Exception as e:
-            print(f"Failed to create conversation chunks: {e}")
+        # Simple chunking - split by sentences or paragraphs
+        # In a real implementation, you might want more sophisticated chunking
+        chunks = self._split_into_chunks(content)
+        
+        return [
+            ConversationChunkCreate(
+                chunk_text=chunk.strip(),
+                chunk_type='message_content',
+                metadata={'chunk_index': i}
+            )
+            for i, chunk in enumerate(chunks)
+            if chunk.strip()
+        ]
     
     def _split_into_chunks(self, text: str, max_length: int = 500) -> List[str]:
         """Split text into chunks for semantic search"""
@@ -241,7 +235,7 @@ class AutoGenDatabaseIntegration:
                 'content': message.content,
                 'thought': message.thought,
                 'models_usage': message.models_usage,
-                'metadata': message.metadata,
+                'metadata': message.metadata_,
                 'created_at': message.created_at.isoformat(),
                 'sequence_order': message.sequence_order
             })
@@ -249,9 +243,10 @@ class AutoGenDatabaseIntegration:
         return history
     
     def search_conversations(self, session_id: uuid.UUID, query: str, 
-                           chunk_type: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search conversations by content"""
-        chunks = self.service.search_conversation_chunks(session_id, query, chunk_type, limit)
+                           chunk_type: Optional[str] = None, limit: int = 10,
+                           query_vector: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Search conversations by content, optionally combined with embedding similarity"""
+        chunks = self.service.search_conversation_chunks(session_id, query, chunk_type, limit, query_vector)
         
         results = []
         for chunk in chunks:
@@ -260,7 +255,7 @@ class AutoGenDatabaseIntegration:
                 'chunk_text': chunk.chunk_text,
                 'chunk_type': chunk.chunk_type,
                 'message_id': str(chunk.message_id),
-                'metadata': chunk.metadata,
+                'metadata': chunk.metadata_,
                 'created_at': chunk.created_at.isoformat()
             })
         
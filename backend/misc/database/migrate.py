@@ -0,0 +1,282 @@
+"""Bulk migrator for JSON team history and state files.
+
+Each source is a directory holding a team_history.json and, optionally, a
+team_state.json as written by the file-based repositories. History files are
+parsed incrementally and loaded into the messages table with COPY in chunks,
+so memory use does not grow with the file size. Every chunk commits together
+with its checkpoint row, which makes an interrupted run resumable: rerunning
+the same command skips what is already loaded.
+
+Usage:
+    python -m misc.database.migrate [--workers N] [--chunk-size N] [--database-url URL] SOURCE...
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import ijson
+import orjson
+from sqlalchemy import create_engine, func, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session as DBSession, sessionmaker
+from .models import Base, Session, Agent, MigrationCheckpoint, AgentStateCreate, TeamStateCreate
+from .service import ConversationService
+
+HISTORY_FILE = "team_history.json"
+STATE_FILE = "team_state.json"
+
+MESSAGE_COLUMNS = (
+    "id", "session_id", "source", "message_type", "content",
+    "models_usage", "metadata", "created_at", "sequence_order",
+)
+
+# COPY text format escapes; backslash must be replaced first
+COPY_ESCAPES = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"))
+
+@dataclass
+class MigrationResult:
+    source: str
+    rows: int
+    seconds: float
+    skipped: bool = False
+    error: Optional[str] = None
+
+def session_id_for(source: str) -> uuid.UUID:
+    """Use the directory name when it is a session UUID, otherwise derive a stable id from the path"""
+    name = os.path.basename(os.path.normpath(source))
+    try:
+        return uuid.UUID(name)
+    except ValueError:
+        return uuid.uuid5(uuid.NAMESPACE_URL, os.path.abspath(source))
+
+def _copy_field(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    if not isinstance(value, str):
+        value = orjson.dumps(value).decode()
+    for char, escaped in COPY_ESCAPES:
+        value = value.replace(char, escaped)
+    return value
+
+def _message_row(session_id: uuid.UUID, index: int, msg: Dict[str, Any]) -> str:
+    """Render one history entry as a COPY text-format line"""
+    return "\t".join(_copy_field(value) for value in (
+        # Derived from the original id so a file copied into two sources cannot collide
+        str(uuid.uuid5(session_id, str(msg.get("id") or index))),
+        str(session_id),
+        msg.get("source", "unknown"),
+        msg.get("type", "TextMessage"),
+        msg.get("content", ""),
+        msg.get("models_usage"),
+        msg.get("metadata") or {},
+        msg.get("created_at") or datetime.utcnow().isoformat(),
+        str(index + 1),
+    )) + "\n"
+
+def _copy_messages(db: DBSession, buffer: io.StringIO):
+    buffer.seek(0)
+    # Runs on the session's own connection so it commits together with the checkpoint
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY messages ({', '.join(MESSAGE_COLUMNS)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+def _commit_chunk(db: DBSession, source: str, session_id: uuid.UUID, buffer: io.StringIO, rows_done: int):
+    _copy_messages(db, buffer)
+    db.execute(
+        update(MigrationCheckpoint)
+        .where(MigrationCheckpoint.source == source)
+        .values(rows_done=rows_done, updated_at=func.now())
+    )
+    db.execute(
+        update(Session)
+        .where(Session.id == session_id)
+        .values(last_sequence_order=func.greatest(Session.last_sequence_order, rows_done))
+    )
+    db.commit()
+
+def _iter_agent_states(state_path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    with open(state_path, "rb") as f:
+        yield from ijson.kvitems(f, "agent_states", use_float=True)
+
+def _migrate_state(db: DBSession, session_id: uuid.UUID, state_path: str):
+    """Persist the team and agent states with the set-based upsert"""
+    team_data = None
+    agent_states: Dict[str, Dict[str, Any]] = {}
+    for name, state in _iter_agent_states(state_path):
+        if "message_thread" in state:
+            # The group chat manager carries the team state
+            team_data = TeamStateCreate(
+                team_type=name.removesuffix("Manager"),
+                message_thread=state.get("message_thread"),
+                current_turn=state.get("current_turn", 0),
+                next_speaker_index=state.get("next_speaker_index", 0),
+                version=state.get("version", "1.0.0"),
+            )
+        else:
+            agent_states[name] = state
+
+    service = ConversationService(db)
+    agent_ids = service.get_agent_ids_by_name(session_id, list(agent_states))
+    missing = [name for name in agent_states if name not in agent_ids]
+    if missing:
+        rows = db.execute(
+            insert(Agent).returning(Agent.name, Agent.id),
+            [
+                {
+                    "session_id": session_id,
+                    "name": name,
+                    "agent_type": agent_states[name].get("agent_state", {}).get("type", "AssistantAgentState").removesuffix("State"),
+                }
+                for name in missing
+            ],
+        ).all()
+        agent_ids.update({row.name: row.id for row in rows})
+
+    service.save_session_state(
+        session_id,
+        team_data or TeamStateCreate(team_type="RoundRobinGroupChat"),
+        [
+            AgentStateCreate(
+                agent_id=agent_ids[name],
+                state_type=state.get("agent_state", {}).get("type", state.get("type", "AssistantAgentState")),
+                llm_context=state.get("agent_state", {}).get("llm_context"),
+                message_buffer=state.get("message_buffer"),
+                version=state.get("version", "1.0.0"),
+            )
+            for name, state in agent_states.items()
+        ],
+    )
+
+def migrate_source(database_url: str, source: str, chunk_size: int) -> MigrationResult:
+    """Migrate one source directory; runs in a worker process"""
+    started = time.perf_counter()
+    source = os.path.abspath(source)
+    session_id = session_id_for(source)
+    engine = create_engine(database_url)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+    try:
+        checkpoint = db.get(MigrationCheckpoint, source)
+        if checkpoint is not None and checkpoint.completed:
+            return MigrationResult(source, 0, 0.0, skipped=True)
+
+        db.execute(pg_insert(Session).values(
+            id=session_id,
+            name=f"Migrated {os.path.basename(source)}",
+            team_config={},
+            status="active",
+        ).on_conflict_do_nothing())
+        db.execute(pg_insert(MigrationCheckpoint).values(
+            source=source,
+            session_id=session_id,
+        ).on_conflict_do_nothing())
+        db.commit()
+
+        rows_done = checkpoint.rows_done if checkpoint is not None else 0
+        rows = 0
+        buffer = io.StringIO()
+        pending = 0
+        chunk_started = time.perf_counter()
+        with open(os.path.join(source, HISTORY_FILE), "rb") as f:
+            for index, msg in enumerate(ijson.items(f, "item", use_float=True)):
+                # Already loaded by an earlier run
+                if index < rows_done:
+                    continue
+                buffer.write(_message_row(session_id, index, msg))
+                pending += 1
+                if pending >= chunk_size:
+                    _commit_chunk(db, source, session_id, buffer, index + 1)
+                    rows += pending
+                    elapsed = time.perf_counter() - chunk_started
+                    print(f"[{os.path.basename(source)}] {index + 1} rows ({pending / elapsed:,.0f} rows/s)", flush=True)
+                    buffer = io.StringIO()
+                    pending = 0
+                    chunk_started = time.perf_counter()
+        if pending:
+            _commit_chunk(db, source, session_id, buffer, rows_done + rows + pending)
+            rows += pending
+
+        state_path = os.path.join(source, STATE_FILE)
+        if os.path.exists(state_path):
+            _migrate_state(db, session_id, state_path)
+
+        db.execute(
+            update(MigrationCheckpoint)
+            .where(MigrationCheckpoint.source == source)
+            .values(completed=True, updated_at=func.now())
+        )
+        db.commit()
+        return MigrationResult(source, rows, time.perf_counter() - started)
+
+    except Exception as e:
+        db.rollback()
+        return MigrationResult(source, 0, time.perf_counter() - started, error=str(e))
+    finally:
+        db.close()
+        engine.dispose()
+
+def find_sources(paths: List[str]) -> List[str]:
+    """Expand the given paths to directories that contain a history file, largest first"""
+    sources = []
+    for path in paths:
+        for root, _, files in os.walk(path):
+            if HISTORY_FILE in files:
+                sources.append(root)
+    # Start the biggest files first so one large file does not finish last on its own
+    return sorted(sources, key=lambda source: os.path.getsize(os.path.join(source, HISTORY_FILE)), reverse=True)
+
+def default_database_url() -> str:
+    from lib.sqlalchemy.db import sqlalchemy_url
+    return sqlalchemy_url.render_as_string(hide_password=False)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Migrate JSON team history and state files into the conversation database")
+    parser.add_argument("paths", nargs="+", help="Directories to search for team_history.json files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Messages per COPY and checkpoint")
+    parser.add_argument("--database-url", default=None, help="Target database (default: the POSTGRES_* settings)")
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url or default_database_url()
+    sources = find_sources(args.paths)
+    if not sources:
+        print("No team_history.json files found")
+        return 0
+
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    print(f"Migrating {len(sources)} sources with {args.workers} workers")
+    started = time.perf_counter()
+    total_rows = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(migrate_source, database_url, source, args.chunk_size) for source in sources]
+        for future in as_completed(futures):
+            result = future.result()
+            if result.error:
+                failed += 1
+                print(f"FAILED {result.source}: {result.error}", flush=True)
+            elif result.skipped:
+                print(f"Skipped {result.source} (already migrated)", flush=True)
+            else:
+                total_rows += result.rows
+                rate = result.rows / result.seconds if result.seconds else 0.0
+                print(f"Migrated {result.source}: {result.rows} rows in {result.seconds:.1f}s ({rate:,.0f} rows/s)", flush=True)
+
+    elapsed = time.perf_counter() - started
+    print(f"Done: {total_rows} rows from {len(sources) - failed} sources in {elapsed:.1f}s "
+          f"({total_rows / elapsed if elapsed else 0.0:,.0f} rows/s), {failed} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,34 @@
-from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, UniqueConstraint, Index
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import Column, String, Text, Integer, Boolean, DateTime, ForeignKey, UniqueConstraint, Index, Computed, JSON, Uuid, DDL, event
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy import create_engine
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 import uuid
+from lib.sqlalchemy.vector import Float32Vector, use_pgvector
+from lib.sqlalchemy.sqlite import create_sqlite_engines, sqlite_sessionmaker
 
 Base = declarative_base()
 
+# Portable column types: native on PostgreSQL, JSON text and CHAR(32) on SQLite
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+TSVectorType = TSVECTOR().with_variant(Text(), "sqlite")
+
 class Session(Base):
     __tablename__ = 'sessions'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     name = Column(String(255))
     description = Column(Text)
-    team_config = Column(JSONB, nullable=False)
+    team_config = Column(JSONType, nullable=False)
     status = Column(String(50), default='active')
+    # Highest sequence_order handed out to this session's messages; bumped atomically when messages are added
+    last_sequence_order = Column(Integer, nullable=False, default=0, server_default='0')
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
-    metadata = Column(JSONB, default={})
+    metadata_ = Column('metadata', JSONType, default={})  # 'metadata' is reserved by the declarative base
     
     # Relationships
     agents = relationship("Agent", back_populates="session", cascade="all, delete-orphan")
@@ -31,13 +40,13 @@ class Session(Base):
 class Agent(Base):
     __tablename__ = 'agents'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    session_id = Column(Uuid, ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
     name = Column(String(100), nullable=False)
     agent_type = Column(String(100), nullable=False)
     system_message = Column(Text)
-    model_config = Column(JSONB)
-    tools = Column(JSONB)
+    model_config = Column(JSONType)
+    tools = Column(JSONType)
     description = Column(Text)
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -50,15 +59,15 @@ class Agent(Base):
 class Message(Base):
     __tablename__ = 'messages'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
-    agent_id = Column(UUID(as_uuid=True), ForeignKey('agents.id', ondelete='SET NULL'))
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    session_id = Column(Uuid, ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
+    agent_id = Column(Uuid, ForeignKey('agents.id', ondelete='SET NULL'))
     source = Column(String(100), nullable=False)
     message_type = Column(String(50), nullable=False)
     content = Column(Text, nullable=False)
     thought = Column(Text)
-    models_usage = Column(JSONB)
-    metadata = Column(JSONB, default={})
+    models_usage = Column(JSONType)
+    metadata_ = Column('metadata', JSONType, default={})  # 'metadata' is reserved by the declarative base
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     sequence_order = Column(Integer, nullable=False)
     
@@ -66,16 +75,20 @@ class Message(Base):
     session = relationship("Session", back_populates="messages")
     agent = relationship("Agent", back_populates="messages")
     conversation_chunks = relationship("ConversationChunk", back_populates="message", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        UniqueConstraint('session_id', 'sequence_order', name='uq_session_message_sequence'),
+    )
 
 class AgentState(Base):
     __tablename__ = 'agent_states'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
-    agent_id = Column(UUID(as_uuid=True), ForeignKey('agents.id', ondelete='CASCADE'), nullable=False)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    session_id = Column(Uuid, ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
+    agent_id = Column(Uuid, ForeignKey('agents.id', ondelete='CASCADE'), nullable=False)
     state_type = Column(String(100), nullable=False)
-    llm_context = Column(JSONB)
-    message_buffer = Column(JSONB)
+    llm_context = Column(JSONType)
+    message_buffer = Column(JSONType)
     version = Column(String(20), default='1.0.0')
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -91,13 +104,13 @@ class AgentState(Base):
 class TeamState(Base):
     __tablename__ = 'team_states'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    session_id = Column(Uuid, ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
     team_type = Column(String(100), nullable=False)
-    message_thread = Column(JSONB)
+    message_thread = Column(JSONType)
     current_turn = Column(Integer, default=0)
     next_speaker_index = Column(Integer, default=0)
-    termination_condition = Column(JSONB)
+    termination_condition = Column(JSONType)
     version = Column(String(20), default='1.0.0')
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -112,24 +125,80 @@ class TeamState(Base):
 class ConversationChunk(Base):
     __tablename__ = 'conversation_chunks'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
-    message_id = Column(UUID(as_uuid=True), ForeignKey('messages.id', ondelete='CASCADE'), nullable=False)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    session_id = Column(Uuid, ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False)
+    message_id = Column(Uuid, ForeignKey('messages.id', ondelete='CASCADE'), nullable=False)
     chunk_text = Column(Text, nullable=False)
     chunk_type = Column(String(50), nullable=False)
-    embedding_vector = Column(JSONB)  # Store as JSONB for now, can be changed to VECTOR if pgvector is available
-    metadata = Column(JSONB, default={})
+    embedding_vector = Column(Float32Vector(1536))  # float32 bytes, or pgvector when USE_PGVECTOR=true
+    # Maintained by PostgreSQL from chunk_text, so full-text search never has to parse rows at query time
+    # (On SQLite the column stays NULL and conversation_chunks_fts is used instead)
+    search_vector = Column(TSVectorType, Computed("to_tsvector('english', chunk_text)", persisted=True))
+    metadata_ = Column('metadata', JSONType, default={})  # 'metadata' is reserved by the declarative base
     created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     
     # Relationships
     session = relationship("Session", back_populates="conversation_chunks")
     message = relationship("Message", back_populates="conversation_chunks")
+    
+    __table_args__ = (
+        Index('ix_conversation_chunks_session_type', 'session_id', 'chunk_type'),
+        Index('ix_conversation_chunks_search_vector', 'search_vector', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    ) + ((
+        Index(
+            'ix_conversation_chunks_embedding_hnsw', 'embedding_vector',
+            postgresql_using='hnsw',
+            postgresql_ops={'embedding_vector': 'vector_cosine_ops'}
+        ).ddl_if(dialect='postgresql'),
+    ) if use_pgvector else ())
+
+# SQLite full-text index over chunk_text, kept in sync by triggers. It is keyed by
+# the implicit rowid, so run INSERT INTO conversation_chunks_fts(conversation_chunks_fts) VALUES('rebuild') after a VACUUM.
+for statement in (
+    "CREATE VIRTUAL TABLE conversation_chunks_fts USING fts5("
+    "chunk_text, content='conversation_chunks', content_rowid='rowid', tokenize='porter unicode61')",
+    "CREATE TRIGGER conversation_chunks_fts_insert AFTER INSERT ON conversation_chunks BEGIN "
+    "INSERT INTO conversation_chunks_fts(rowid, chunk_text) VALUES (new.rowid, new.chunk_text); END",
+    "CREATE TRIGGER conversation_chunks_fts_delete AFTER DELETE ON conversation_chunks BEGIN "
+    "INSERT INTO conversation_chunks_fts(conversation_chunks_fts, rowid, chunk_text) VALUES ('delete', old.rowid, old.chunk_text); END",
+    "CREATE TRIGGER conversation_chunks_fts_update AFTER UPDATE OF chunk_text ON conversation_chunks BEGIN "
+    "INSERT INTO conversation_chunks_fts(conversation_chunks_fts, rowid, chunk_text) VALUES ('delete', old.rowid, old.chunk_text); "
+    "INSERT INTO conversation_chunks_fts(rowid, chunk_text) VALUES (new.rowid, new.chunk_text); END",
+):
+    event.listen(ConversationChunk.__table__, "after_create", DDL(statement).execute_if(dialect='sqlite'))
+event.listen(
+    ConversationChunk.__table__, "before_drop",
+    DDL("DROP TABLE IF EXISTS conversation_chunks_fts").execute_if(dialect='sqlite')
+)
+
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    # The generated search_vector column calls to_tsvector; SQLite searches through FTS5 instead
+    dbapi_connection.create_function("to_tsvector", 2, lambda config, text: None, deterministic=True)
+
+class MigrationCheckpoint(Base):
+    __tablename__ = 'migration_checkpoints'
+    
+    # Directory the history was migrated from
+    source = Column(Text, primary_key=True)
+    session_id = Column(Uuid, nullable=False)
+    rows_done = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
 
 # Database connection and session management
 class DatabaseManager:
     def __init__(self, database_url: str):
-        self.engine = create_engine(database_url)
-        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        url = make_url(database_url)
+        self.reader_engine = None
+        if url.get_backend_name() == "sqlite":
+            # WAL file with a single writer connection and a pool of readers, see lib/sqlalchemy/sqlite.py
+            self.engine, self.reader_engine = create_sqlite_engines(url.database)
+            for engine in (self.engine, self.reader_engine):
+                event.listen(engine, "connect", _register_sqlite_functions)
+            self.SessionLocal = sqlite_sessionmaker(self.engine, self.reader_engine)
+        else:
+            self.engine = create_engine(database_url)
+            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
     
     def create_tables(self):
         """Create all tables"""
@@ -142,6 +211,8 @@ class DatabaseManager:
     def close(self):
         """Close database connection"""
         self.engine.dispose()
+        if self.reader_engine is not None:
+            self.reader_engine.dispose()
 
 # Pydantic models for API responses
 from pydantic import BaseModel, Field
@@ -168,6 +239,12 @@ class SessionResponse(BaseModel):
     agent_count: int = 0
     last_message_at: Optional[datetime] = None
 
+class ConversationChunkCreate(BaseModel):
+    chunk_text: str
+    chunk_type: str
+    embedding_vector: Optional[List[float]] = None
+    metadata: Optional[Dict[str, Any]] = {}
+
 class MessageCreate(BaseModel):
     source: str
     message_type: str
@@ -175,7 +252,10 @@ class MessageCreate(BaseModel):
     thought: Optional[str] = None
     models_usage: Optional[Dict[str, Any]] = None
     metadata: Optional[Dict[str, Any]] = {}
-    sequence_order: int
+    # Assigned from the session's counter when omitted
+    sequence_order: Optional[int] = None
+    agent_id: Optional[UUID] = None
+    chunks: List[ConversationChunkCreate] = []
 
 class MessageResponse(BaseModel):
     id: UUID
@@ -194,7 +274,8 @@ class AgentStateCreate(BaseModel):
     agent_id: UUID
     state_type: str
     llm_context: Optional[Dict[str, Any]] = None
-    message_buffer: Optional[Dict[str, Any]] = None
+    # AutoGen saves the buffer as a list of messages
+    message_buffer: Optional[List[Dict[str, Any]] | Dict[str, Any]] = None
     version: str = "1.0.0"
 
 class TeamStateCreate(BaseModel):
@@ -1,18 +1,35 @@
 from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session as DBSession
-from sqlalchemy import and_, desc, func
+from sqlalchemy import and_, case, column, desc, func, insert, literal_column, select, table, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime
 import uuid
 import json
+import re
+from lib.sqlalchemy import vector
 from .models import (
     Session, Agent, Message, AgentState, TeamState, ConversationChunk,
     SessionCreate, MessageCreate, AgentStateCreate, TeamStateCreate
 )
 
+# Reciprocal rank fusion constant; dampens the weight of the top few ranks of either list
+RRF_K = 60
+
+# SQLite full-text index maintained by triggers, see models.py
+conversation_chunks_fts = table('conversation_chunks_fts', column('rowid'), column('conversation_chunks_fts'))
+
 class ConversationService:
     def __init__(self, db_session: DBSession):
         self.db = db_session
     
+    def _dialect(self) -> str:
+        return self.db.get_bind().dialect.name
+    
+    def _upsert(self, model):
+        """INSERT that supports on_conflict_do_update on both PostgreSQL and SQLite"""
+        return (pg_insert if self._dialect() == 'postgresql' else sqlite_insert)(model)
+    
     # Session Management
     def create_session(self, session_data: SessionCreate) -> Session:
         """Create a new conversation session"""
@@ -20,7 +37,7 @@ class ConversationService:
             name=session_data.name,
             description=session_data.description,
             team_config=session_data.team_config,
-            metadata=session_data.metadata
+            metadata_=session_data.metadata
         )
         self.db.add(session)
         self.db.commit()
@@ -69,22 +86,111 @@ class ConversationService:
     # Message Management
     def add_message(self, session_id: uuid.UUID, message_data: MessageCreate, agent_id: Optional[uuid.UUID] = None) -> Message:
         """Add a message to the conversation"""
+        sequence_order = message_data.sequence_order
+        if sequence_order is None:
+            sequence_order = self._allocate_sequence_orders(session_id, 1)
+        else:
+            # Keep the counter ahead of explicitly numbered messages
+            self.db.execute(
+                update(Session)
+                .where(Session.id == session_id)
+                .values(last_sequence_order=case(
+                    (Session.last_sequence_order < sequence_order, sequence_order),
+                    else_=Session.last_sequence_order
+                ))
+            )
         message = Message(
             session_id=session_id,
-            agent_id=agent_id,
+            agent_id=agent_id or message_data.agent_id,
             source=message_data.source,
             message_type=message_data.message_type,
             content=message_data.content,
             thought=message_data.thought,
             models_usage=message_data.models_usage,
-            metadata=message_data.metadata,
-            sequence_order=message_data.sequence_order
+            metadata_=message_data.metadata,
+            sequence_order=sequence_order
         )
         self.db.add(message)
         self.db.commit()
         self.db.refresh(message)
         return message
     
+    def add_messages_bulk(self, session_id: uuid.UUID, messages: List[MessageCreate]) -> List[uuid.UUID]:
+        """Add a batch of messages and their conversation chunks in one transaction
+        
+        Sequence numbers are taken as one contiguous block from the session's
+        counter, so concurrent writers never collide; any sequence_order set
+        on the items is ignored. Messages and chunks are each written with a
+        single multi-row INSERT.
+        
+        Returns:
+            Message ids in the order of messages
+        """
+        if not messages:
+            return []
+        
+        try:
+            first_sequence_order = self._allocate_sequence_orders(session_id, len(messages))
+            message_rows = [
+                {
+                    'id': uuid.uuid4(),
+                    'session_id': session_id,
+                    'agent_id': message_data.agent_id,
+                    'source': message_data.source,
+                    'message_type': message_data.message_type,
+                    'content': message_data.content,
+                    'thought': message_data.thought,
+                    'models_usage': message_data.models_usage,
+                    'metadata_': message_data.metadata or {},
+                    'sequence_order': first_sequence_order + i,
+                    'created_at': datetime.utcnow(),
+                }
+                for i, message_data in enumerate(messages)
+            ]
+            message_ids = self.db.scalars(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True),
+                message_rows
+            ).all()
+            
+            chunk_rows = [
+                {
+                    'id': uuid.uuid4(),
+                    'session_id': session_id,
+                    'message_id': message_id,
+                    'chunk_text': chunk.chunk_text,
+                    'chunk_type': chunk.chunk_type,
+                    'embedding_vector': chunk.embedding_vector,
+                    'metadata_': chunk.metadata or {},
+                    'created_at': datetime.utcnow(),
+                }
+                for message_id, message_data in zip(message_ids, messages)
+                for chunk in message_data.chunks
+            ]
+            if chunk_rows:
+                self.db.execute(insert(ConversationChunk), chunk_rows)
+            
+            self.db.commit()
+            return list(message_ids)
+        except Exception:
+            self.db.rollback()
+            raise
+    
+    def _allocate_sequence_orders(self, session_id: uuid.UUID, count: int) -> int:
+        """Reserve count sequence numbers for the session and return the first one
+        
+        The UPDATE takes a row lock on the session until the caller's
+        transaction ends, which serializes concurrent allocations.
+        """
+        last_sequence_order = self.db.execute(
+            update(Session)
+            .where(Session.id == session_id)
+            .values(last_sequence_order=Session.last_sequence_order + count)
+            .returning(Session.last_sequence_order)
+        ).scalar()
+        if last_sequence_order is None:
+            raise ValueError(f"Session not found: {session_id}")
+        return last_sequence_order - count + 1
+    
     def get_conversation_history(self, session_id: uuid.UUID, limit: Optional[int] = None) -> List[Message]:
         """Get conversation history for a session"""
         query = self.db.query(Message).filter(Message.session_id == session_id).order_by(Message.sequence_order)
@@ -93,8 +199,12 @@ class ConversationService:
         return query.all()
     
     def get_next_sequence_order(self, session_id: uuid.UUID) -> int:
-        """Get the next sequence order for a session"""
-        result = self.db.query(func.max(Message.sequence_order)).filter(Message.session_id == session_id).scalar()
+        """Get the next sequence order for a session
+        
+        Only a hint: use add_messages_bulk, or add_message without a
+        sequence_order, to have numbers assigned atomically.
+        """
+        result = self.db.query(Session.last_sequence_order).filter(Session.id == session_id).scalar()
         return (result or 0) + 1
     
     # Agent State Management
@@ -172,6 +282,79 @@ class ConversationService:
         """Get team state"""
         return self.db.query(TeamState).filter(TeamState.session_id == session_id).first()
     
+    def get_agent_ids_by_name(self, session_id: uuid.UUID, names: List[str]) -> Dict[str, uuid.UUID]:
+        """Resolve agent names to ids with a single query"""
+        if not names:
+            return {}
+        rows = self.db.execute(
+            select(Agent.name, Agent.id).where(and_(Agent.session_id == session_id, Agent.name.in_(names)))
+        ).all()
+        return {row.name: row.id for row in rows}
+    
+    def save_session_state(self, session_id: uuid.UUID, team_data: TeamStateCreate,
+                           agent_states: List[AgentStateCreate]) -> None:
+        """Upsert the team state and all agent states in one transaction
+        
+        Each table is written with a single INSERT ... ON CONFLICT DO UPDATE,
+        so the number of round trips does not depend on the team size.
+        """
+        try:
+            team_insert = self._upsert(TeamState).values(
+                id=uuid.uuid4(),
+                session_id=session_id,
+                team_type=team_data.team_type,
+                message_thread=team_data.message_thread,
+                current_turn=team_data.current_turn,
+                next_speaker_index=team_data.next_speaker_index,
+                termination_condition=team_data.termination_condition,
+                version=team_data.version,
+                created_at=func.now(),
+                updated_at=func.now()
+            )
+            self.db.execute(team_insert.on_conflict_do_update(
+                index_elements=['session_id'],
+                set_={
+                    'team_type': team_insert.excluded.team_type,
+                    'message_thread': team_insert.excluded.message_thread,
+                    'current_turn': team_insert.excluded.current_turn,
+                    'next_speaker_index': team_insert.excluded.next_speaker_index,
+                    'termination_condition': team_insert.excluded.termination_condition,
+                    'version': team_insert.excluded.version,
+                    'updated_at': func.now(),
+                }
+            ))
+            
+            if agent_states:
+                agent_insert = self._upsert(AgentState).values([
+                    {
+                        'id': uuid.uuid4(),
+                        'session_id': session_id,
+                        'agent_id': state_data.agent_id,
+                        'state_type': state_data.state_type,
+                        'llm_context': state_data.llm_context,
+                        'message_buffer': state_data.message_buffer,
+                        'version': state_data.version,
+                        'created_at': func.now(),
+                        'updated_at': func.now(),
+                    }
+                    for state_data in agent_states
+                ])
+                self.db.execute(agent_insert.on_conflict_do_update(
+                    index_elements=['session_id', 'agent_id'],
+                    set_={
+                        'state_type': agent_insert.excluded.state_type,
+                        'llm_context': agent_insert.excluded.llm_context,
+                        'message_buffer': agent_insert.excluded.message_buffer,
+                        'version': agent_insert.excluded.version,
+                        'updated_at': func.now(),
+                    }
+                ))
+            
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+    
     # Conversation Chunks for Semantic Search
     def add_conversation_chunk(self, session_id: uuid.UUID, message_id: uuid.UUID, 
                              chunk_text: str, chunk_type: str, 
@@ -184,7 +367,7 @@ class ConversationService:
             chunk_text=chunk_text,
             chunk_type=chunk_type,
             embedding_vector=embedding_vector,
-            metadata=metadata or {}
+            metadata_=metadata or {}
         )
         self.db.add(chunk)
         self.db.commit()
@@ -192,13 +375,93 @@ class ConversationService:
         return chunk
     
     def search_conversation_chunks(self, session_id: uuid.UUID, query: str, 
-                                 chunk_type: Optional[str] = None, limit: int = 10) -> List[ConversationChunk]:
-        """Search conversation chunks by text content"""
+                                 chunk_type: Optional[str] = None, limit: int = 10,
+                                 query_vector: Optional[List[float]] = None) -> List[ConversationChunk]:
+        """Search conversation chunks by text content, optionally fused with vector similarity
+        
+        Full-text matches are ranked with ts_rank_cd over the GIN-indexed
+        search_vector. When query_vector is given, chunks are also ranked by
+        cosine distance to it and both rankings are combined with reciprocal
+        rank fusion.
+        """
+        candidates = limit * 4
+        rankings = []
+        if query and query.strip():
+            rankings.append(self._rank_chunks_by_text(session_id, query, chunk_type, candidates))
+        if query_vector is not None:
+            rankings.append(self._rank_chunks_by_vector(session_id, query_vector, chunk_type, candidates))
+        if not rankings:
+            return []
+        
+        scores: Dict[uuid.UUID, float] = {}
+        for ranking in rankings:
+            for rank, chunk_id in enumerate(ranking, start=1):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank)
+        chunk_ids = sorted(scores, key=scores.get, reverse=True)[:limit]
+        
+        chunks = self.db.query(ConversationChunk).filter(ConversationChunk.id.in_(chunk_ids)).all()
+        chunks_by_id = {chunk.id: chunk for chunk in chunks}
+        return [chunks_by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in chunks_by_id]
+    
+    def _chunk_filter(self, session_id: uuid.UUID, chunk_type: Optional[str]):
         query_filter = ConversationChunk.session_id == session_id
         if chunk_type:
             query_filter = and_(query_filter, ConversationChunk.chunk_type == chunk_type)
+        return query_filter
+    
+    def _rank_chunks_by_text(self, session_id: uuid.UUID, query: str,
+                             chunk_type: Optional[str], limit: int) -> List[uuid.UUID]:
+        """Chunk ids matching the query, best full-text rank first"""
+        if self._dialect() == 'sqlite':
+            return self._rank_chunks_by_fts5(session_id, query, chunk_type, limit)
+        ts_query = func.websearch_to_tsquery('english', query)
+        rank = func.ts_rank_cd(ConversationChunk.search_vector, ts_query)
+        rows = self.db.execute(
+            select(ConversationChunk.id)
+            .where(self._chunk_filter(session_id, chunk_type))
+            .where(ConversationChunk.search_vector.op('@@')(ts_query))
+            .order_by(desc(rank), ConversationChunk.created_at)
+            .limit(limit)
+        ).all()
+        return [row.id for row in rows]
+    
+    def _rank_chunks_by_fts5(self, session_id: uuid.UUID, query: str,
+                             chunk_type: Optional[str], limit: int) -> List[uuid.UUID]:
+        """SQLite equivalent of the tsvector ranking, using FTS5 and bm25"""
+        # Quote every word so user input cannot be read as FTS5 syntax; words are ANDed like websearch_to_tsquery
+        fts_query = ' '.join(f'"{word}"' for word in re.findall(r'\w+', query))
+        if not fts_query:
+            return []
+        rows = self.db.execute(
+            select(ConversationChunk.id)
+            .join(conversation_chunks_fts, conversation_chunks_fts.c.rowid == literal_column('conversation_chunks.rowid'))
+            .where(self._chunk_filter(session_id, chunk_type))
+            .where(conversation_chunks_fts.c.conversation_chunks_fts.op('MATCH')(fts_query))
+            .order_by(func.bm25(literal_column('conversation_chunks_fts')), ConversationChunk.created_at)
+            .limit(limit)
+        ).all()
+        return [row.id for row in rows]
+    
+    def _rank_chunks_by_vector(self, session_id: uuid.UUID, query_vector: List[float],
+                               chunk_type: Optional[str], limit: int) -> List[uuid.UUID]:
+        """Chunk ids nearest to query_vector by cosine distance"""
+        query_filter = and_(self._chunk_filter(session_id, chunk_type), ConversationChunk.embedding_vector.is_not(None))
+        if vector.use_pgvector and self._dialect() == 'postgresql':
+            distance = vector.cosine_distance(
+                ConversationChunk.embedding_vector, query_vector, ConversationChunk.embedding_vector.type.dim
+            )
+            rows = self.db.execute(
+                select(ConversationChunk.id).where(query_filter).order_by(distance).limit(limit)
+            ).all()
+            return [row.id for row in rows]
         
-        return self.db.query(ConversationChunk).filter(query_filter).limit(limit).all()
+        # Without pgvector, rank the session's embeddings in memory; one query loads them as a matrix
+        rows = self.db.execute(
+            select(ConversationChunk.id, ConversationChunk.embedding_vector).where(query_filter)
+        ).all()
+        matrix = vector.stack_vectors([row.embedding_vector for row in rows])
+        indexes, _ = vector.top_k_cosine(matrix, query_vector, limit)
+        return [rows[i].id for i in indexes]
     
     # Utility Methods
     def get_session_summary(self, session_id: uuid.UUID) -> Dict[str, Any]:
@@ -240,6 +503,7 @@ class ConversationService:
                 self.db.refresh(session)
             
             # Migrate messages
+            first_sequence_order = self._allocate_sequence_orders(session_id, len(team_history)) if team_history else 1
             for i, msg_data in enumerate(team_history):
                 message = Message(
                     session_id=session_id,
@@ -247,8 +511,8 @@ class ConversationService:
                     message_type=msg_data.get('type', 'TextMessage'),
                     content=msg_data.get('content', ''),
                     models_usage=msg_data.get('models_usage'),
-                    metadata=msg_data.get('metadata', {}),
-                    sequence_order=i + 1,
+                    metadata_=msg_data.get('metadata', {}),
+                    sequence_order=first_sequence_order + i,
                     created_at=datetime.fromisoformat(msg_data.get('created_at', datetime.utcnow().isoformat()))
                 )
                 self.db.add(message)
@@ -1,8 +1,14 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Any
 
 class WebsocketMessage(BaseModel):
     id: int
     session_id: int
-    message: str
+    seq: int
+    source: str | None = None
+    type: str | None = None
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    payload: dict[str, Any]
     created_at: datetime
\ No newline at end of file
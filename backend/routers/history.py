@@ -1,27 +1,114 @@
-from fastapi import APIRouter, Query
+import hashlib
+import json
+from fastapi import APIRouter, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from adapter.history import HistoryRepositoryImpl
 from adapter.session_history import SessionHistoryRepositoryImpl
 from adapter.storage import StorageRepositoryImpl
-from typing import Any
+from typing import Any, Literal
 
 router = APIRouter()
 
 history_repository = HistoryRepositoryImpl()
 storage_repository = StorageRepositoryImpl()
 
-@router.get("/history")
-async def history(session_id: str = Query(None, description="Session ID for specific session history")) -> list[dict[str, Any]]:
+@router.get("/history", response_model=list[dict[str, Any]])
+async def history(
+    request: Request,
+    session_id: str = Query(None, description="Session ID for specific session history"),
+    since: int | None = Query(None, ge=0, description="Only return messages with a sequence number greater than this cursor"),
+    limit: int | None = Query(None, ge=1, le=1000, description="Maximum number of messages to return"),
+    type: list[str] | None = Query(None, description="Only return messages of these types, e.g. TextMessage"),
+    source: str | None = Query(None, description="Only return messages from this agent or user"),
+    format: Literal["json", "ndjson"] = Query("json", description="Response format; ndjson streams one message per line"),
+):
     """Get history - either global or session-specific"""
     if session_id:
         # Get session-specific history
-        session_history_repository = SessionHistoryRepositoryImpl(session_id)
-        return await session_history_repository.get_history()
+        return await _session_history_response(request, session_id, since, limit, type, source, format)
     else:
         # Get global history (backward compatibility)
         return await history_repository.get_history()
 
-@router.get("/sessions/{session_id}/history")
-async def session_history(session_id: str) -> list[dict[str, Any]]:
+@router.get("/sessions/{session_id}/history", response_model=list[dict[str, Any]])
+async def session_history(
+    request: Request,
+    session_id: str,
+    since: int | None = Query(None, ge=0, description="Only return messages with a sequence number greater than this cursor"),
+    limit: int | None = Query(None, ge=1, le=1000, description="Maximum number of messages to return"),
+    type: list[str] | None = Query(None, description="Only return messages of these types, e.g. TextMessage"),
+    source: str | None = Query(None, description="Only return messages from this agent or user"),
+    format: Literal["json", "ndjson"] = Query("json", description="Response format; ndjson streams one message per line"),
+):
     """Get history for a specific session"""
+    return await _session_history_response(request, session_id, since, limit, type, source, format)
+
+async def _session_history_response(
+    request: Request,
+    session_id: str,
+    since: int | None,
+    limit: int | None,
+    types: list[str] | None,
+    source: str | None,
+    format: str,
+) -> Response:
+    """Serve a page of session history.
+
+    Every page only holds messages up to the session's latest sequence
+    number, so that number together with the query identifies the body:
+    it is the ETag, and polling clients get a 304 without any history
+    being read. X-History-Cursor carries the value to pass as since on
+    the next request, for JSON and NDJSON alike.
+    """
     session_history_repository = SessionHistoryRepositoryImpl(session_id)
-    return await session_history_repository.get_history()
\ No newline at end of file
+    last_seq = await session_history_repository.get_last_seq()
+    if last_seq is None:
+        return JSONResponse(content=[])
+
+    etag = _history_etag(last_seq, since, limit, types, source, format)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Past the page's last message there is nothing more up to last_seq,
+    # whether or not the filters skipped the messages in between
+    cursor = max(last_seq, since or 0)
+
+    if format == "ndjson":
+        if limit is not None:
+            page_end = await session_history_repository.get_page_end(since, limit, types, source, until=last_seq)
+            if page_end is not None:
+                cursor = page_end
+        return StreamingResponse(
+            session_history_repository.stream_history(since, limit, types, source, until=last_seq),
+            media_type="application/x-ndjson",
+            headers={"ETag": etag, "X-History-Cursor": str(cursor)},
+        )
+
+    messages = await session_history_repository.get_history(since, limit, types, source, until=last_seq)
+    if limit is not None and len(messages) == limit:
+        cursor = messages[-1]["seq"]
+    return JSONResponse(
+        content=jsonable_encoder(messages),
+        headers={"ETag": etag, "X-History-Cursor": str(cursor)},
+    )
+
+def _history_etag(
+    last_seq: int,
+    since: int | None,
+    limit: int | None,
+    types: list[str] | None,
+    source: str | None,
+    format: str,
+) -> str:
+    """Weak ETag for a history page: the latest sequence number plus a digest of the query"""
+    query = json.dumps([since, limit, sorted(types) if types else None, source, format])
+    digest = hashlib.sha1(query.encode()).hexdigest()[:16]
+    return f'W/"{last_seq}-{digest}"'
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of an ETag against an If-None-Match header"""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from lib.metrics import registry
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Process metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -54,6 +54,19 @@ async def get_session_info(session_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get session info: {str(e)}")
 
+@router.get("/sessions/{session_id}/stats")
+async def get_session_stats(session_id: str):
+    """Get message counts and token usage per message type and source"""
+    try:
+        stats = await storage_repository.get_message_stats(session_id)
+        if not stats:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return stats
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get session stats: {str(e)}")
+
 @router.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
     """Delete a session and all its associated data"""
@@ -1,5 +1,6 @@
 import logging
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # for streaming response
@@ -7,13 +8,41 @@ from dotenv import load_dotenv
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import websocket, history, session, tsne
+from routers import websocket, history, session, tsne, metrics
+from adapter.message_buffer import message_buffer
+from adapter.model_client_pool import model_client_pool
+from adapter.partition_maintainer import partition_maintainer
+from adapter.session_archiver import session_archiver
+from adapter.session_runs import run_manager
+from adapter.team_cache import team_cache
+from lib.sqlalchemy.db import Base, database_backend, engine
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Weaviate Driver Backend", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if database_backend == "sqlite":
+        # The Alembic migrations target PostgreSQL; an embedded database is created from the models
+        Base.metadata.create_all(bind=engine)
+    message_buffer.start()
+    model_client_pool.start()
+    team_cache.start()
+    run_manager.start()
+    session_archiver.start()
+    partition_maintainer.start()
+    yield
+    await partition_maintainer.stop()
+    await session_archiver.stop()
+    # Runs still in progress are cancelled; their teams rebuild from the last persisted state
+    await run_manager.stop()
+    # Persist cached team states and buffered messages before the process exits
+    await team_cache.stop()
+    await message_buffer.stop()
+    await model_client_pool.stop()
+
+app = FastAPI(title="Weaviate Driver Backend", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +56,7 @@ app.include_router(websocket.router)
 app.include_router(history.router)
 app.include_router(session.router, prefix="/api/v1")
 app.include_router(tsne.router, prefix="/api/v1")
+app.include_router(metrics.router)
 
 @app.get("/")
 async def root():
@@ -32,16 +32,22 @@ def test_direct_connection():
         
         # Insert a test message
         cursor.execute("""
-            INSERT INTO websocket_messages (session_id, message) 
-            VALUES ((SELECT id FROM websocket_sessions WHERE session_id = %s), %s)
-        """, (session_id, "Test message from direct connection"))
+            UPDATE websocket_sessions SET last_seq = last_seq + 1
+            WHERE session_id = %s
+            RETURNING id, last_seq
+        """, (session_id,))
+        session_pk, seq = cursor.fetchone()
+        cursor.execute("""
+            INSERT INTO websocket_messages (session_id, seq, source, type, payload) 
+            VALUES (%s, %s, %s, %s, %s)
+        """, (session_pk, seq, "user", "TextMessage", json.dumps({"source": "user", "type": "TextMessage", "content": "Test message from direct connection"})))
         
         conn.commit()
         print("✅ Session and message created successfully!")
         
         # Query the data
         cursor.execute("""
-            SELECT ws.session_id, wm.message 
+            SELECT ws.session_id, wm.seq, wm.payload 
             FROM websocket_sessions ws 
             LEFT JOIN websocket_messages wm ON ws.id = wm.session_id 
             WHERE ws.session_id = %s
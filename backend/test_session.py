@@ -32,7 +32,7 @@ async def test_session_functionality():
     
     # Test saving a message
     print("Saving a test message...")
-    await storage.save_message(session_id, "Hello, this is a test message!")
+    await storage.save_message(session_id, {"source": "user", "type": "TextMessage", "content": "Hello, this is a test message!"})
     
     # Test loading history
     print("Loading history...")
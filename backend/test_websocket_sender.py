@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Test script for the websocket sender's drop overflow policy
+"""
+import asyncio
+from lib.websocket_sender import CHUNK_TYPE, WebsocketSender
+
+class SlowWebsocket:
+    """Websocket stand-in that takes a fixed time to write each frame"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.frames = []
+
+    async def send_json(self, frame):
+        await asyncio.sleep(self.delay)
+        self.frames.append(frame)
+
+async def stream_messages(messages: int, chunks: int, max_queue: int, delay: float, chunk_delay: float) -> list:
+    websocket = SlowWebsocket(delay)
+    sender = WebsocketSender(websocket, max_queue=max_queue, overflow="drop")
+    sender.start()
+    for message in range(messages):
+        message_id = f"m{message}"
+        for chunk in range(chunks):
+            await sender.send({"type": CHUNK_TYPE, "source": "assistant", "full_message_id": message_id, "content": f"{chunk} "}, droppable=True)
+            await asyncio.sleep(chunk_delay)
+        await sender.send({"type": "TextMessage", "source": "assistant", "id": message_id, "content": "final"})
+    await sender.close(timeout=30)
+    return websocket.frames
+
+def test_every_message_streams_tokens():
+    """A full queue must not cut the stream of a message that starts behind another message's final frame"""
+    # The producer outpaces the socket tenfold, so the queue is full whenever a message starts
+    frames = asyncio.run(stream_messages(messages=3, chunks=50, max_queue=4, delay=0.01, chunk_delay=0.001))
+    for message in range(3):
+        message_id = f"m{message}"
+        tokens = [
+            int(token)
+            for frame in frames if frame["type"] == CHUNK_TYPE and frame["full_message_id"] == message_id
+            for token in frame["content"].split()
+        ]
+        print(f"Message {message_id} streamed {len(tokens)} tokens")
+        assert tokens, f"Message {message_id} streamed no tokens"
+        # Tokens may only be cut from the end of a stream, never from its middle
+        assert tokens == list(range(len(tokens))), f"Message {message_id} lost tokens mid-stream: {tokens}"
+    finals = [frame["id"] for frame in frames if frame["type"] == "TextMessage"]
+    assert finals == ["m0", "m1", "m2"], f"Final frames missing or out of order: {finals}"
+
+if __name__ == "__main__":
+    test_every_message_streams_tokens()
+    print("All tests passed!")
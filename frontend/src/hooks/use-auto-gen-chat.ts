@@ -5,8 +5,16 @@ export interface AutoGenMessage {
   content: string;
   source?: string;
   timestamp?: string;
+  // Set while the message is being streamed token by token
+  streaming?: boolean;
+  // Set on the notice shown while the run waits for a free slot on the server
+  queued?: boolean;
 }
 
+// The queue notice is replaced by newer positions and removed once the run starts
+const withoutQueueNotice = (messages: AutoGenMessage[]) =>
+  messages[messages.length - 1]?.queued ? messages.slice(0, -1) : messages;
+
 export interface UseAutoGenChatOptions {
   onComplete?: () => void;
   onError?: (error: Error) => void;
@@ -23,6 +31,8 @@ export function useAutoGenChat(options: UseAutoGenChatOptions = {}) {
   
   const wsRef = useRef<WebSocket | null>(null);
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | null>(null);
+  // Offset of the next event log frame, so a reconnect replays what was missed
+  const nextOffsetRef = useRef<number | null>(null);
 
   const connectWebSocket = useCallback(() => {
     if (wsRef.current?.readyState === WebSocket.OPEN) {
@@ -32,7 +42,8 @@ export function useAutoGenChat(options: UseAutoGenChatOptions = {}) {
     setConnectionStatus('connecting');
     
     try {
-      wsRef.current = new WebSocket('ws://localhost:8002/ws/chat');
+      const resume = nextOffsetRef.current !== null ? `?resume_from=${nextOffsetRef.current}` : '';
+      wsRef.current = new WebSocket(`ws://localhost:8002/ws/chat${resume}`);
 
       wsRef.current.onopen = () => {
         console.log('WebSocket connected');
@@ -45,8 +56,17 @@ export function useAutoGenChat(options: UseAutoGenChatOptions = {}) {
         console.log('onmessage', event.data);
         try {
           const message = JSON.parse(event.data);
+          if (typeof message.offset === 'number') {
+            nextOffsetRef.current = message.offset + 1;
+          }
 
-          if (message.type === 'UserInputRequestedEvent') {
+          if (message.type === 'RunAttachedEvent') {
+            // The run carries on server side; only allow typing when it waits for us or is idle
+            if (nextOffsetRef.current === null) {
+              nextOffsetRef.current = message.next_offset;
+            }
+            setIsInputEnabled(message.awaiting_input || !message.running);
+          } else if (message.type === 'UserInputRequestedEvent') {
             // Re-enable input and send button if UserInputRequestedEvent is received
             setIsInputEnabled(true);
             options.onUserInputRequested?.();
@@ -68,14 +88,43 @@ export function useAutoGenChat(options: UseAutoGenChatOptions = {}) {
               source: message.source,
               timestamp: new Date().toISOString(),
             }]);
-          } else {
-            // Display regular message
-            setMessages(prev => [...prev, {
-              type: 'message',
+          } else if (message.type === 'RunQueuedEvent') {
+            setMessages(prev => [...withoutQueueNotice(prev), {
+              type: 'system',
               content: message.content,
               source: message.source,
               timestamp: new Date().toISOString(),
+              queued: true,
             }]);
+          } else if (message.type === 'ModelClientStreamingChunkEvent') {
+            // Grow the agent's partial answer until its final message arrives
+            setMessages(current => {
+              const prev = withoutQueueNotice(current);
+              const last = prev[prev.length - 1];
+              if (last?.streaming && last.source === message.source) {
+                return [...prev.slice(0, -1), { ...last, content: last.content + message.content }];
+              }
+              return [...prev, {
+                type: 'message',
+                content: message.content,
+                source: message.source,
+                timestamp: new Date().toISOString(),
+                streaming: true,
+              }];
+            });
+          } else {
+            // Display regular message, replacing the streamed partial answer it completes
+            setMessages(current => {
+              const prev = withoutQueueNotice(current);
+              const last = prev[prev.length - 1];
+              const rest = last?.streaming && last.source === message.source ? prev.slice(0, -1) : prev;
+              return [...rest, {
+                type: 'message',
+                content: message.content,
+                source: message.source,
+                timestamp: new Date().toISOString(),
+              }];
+            });
           }
         } catch (parseError) {
           const err = parseError instanceof Error ? parseError : new Error('Failed to parse message');
@@ -195,6 +244,12 @@ export function useAutoGenChat(options: UseAutoGenChatOptions = {}) {
     }
   }, [isInputEnabled, connectionStatus, addMessage, options]);
 
+  // Stop the running team; the server answers with a RunCancelledEvent
+  const cancelRun = useCallback(() => {
+    if (wsRef.current?.readyState !== WebSocket.OPEN) return;
+    wsRef.current.send(JSON.stringify({ type: 'CancelRun' }));
+  }, []);
+
   const loadHistory = useCallback(async () => {
     try {
       const response = await fetch('http://localhost:8002/history');
@@ -225,6 +280,7 @@ export function useAutoGenChat(options: UseAutoGenChatOptions = {}) {
     isLoading,
     error,
     sendMessage,
+    cancelRun,
     addMessage,
     clearMessages,
     reset,